@@ -1,7 +1,21 @@
+from __future__ import print_function
 import sys
 import argparse
+import bisect
+import hashlib
+import io
+import json
+import mmap
 import os
-import re
+import shutil
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 CURRENT_VERSION = 2
 CLOUD_FORMAT_KEY = u"#CLOUD"
@@ -13,72 +27,538 @@ XL_SEGMENTS_KEY = u"#CLOUD-XL-SEGMENTS:"
 XL_SEGMENT_NUMBER_KEY = u"#CLOUD-XL-SEGMENT:"
 XL_SEGMENT_SIZE_KEY = u"#CLOUD-XL-SEGMENT-SIZE:"
 XL_SEGMENT_HASH_KEY = u"#CLOUD-XL-SEGMENT-HASH:"
+PARTIAL_SUFFIX = u".partial"
+PROGRESS_SUFFIX = u".progress"
+# Python 2's mmap objects can't back a memoryview, so segments are only memory-mapped on Python 3
+MMAP_VIEWS = sys.version_info[0] >= 3
+# Segment files are named by the hash of their contents, split_xl_file.py can use any of these
+SEGMENT_HASH_NAMES = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+# Linux ioctl to share a range of one file's blocks with another (btrfs, XFS with reflink=1, ...)
+FICLONERANGE = 0x4020940D
 
 class Segment(object):
-    def __init__(self, segment_number, segment_size, segment_hash):
+    __slots__ = ('segment_number', 'segment_size', 'segment_hash', 'segment_offset')
+
+    def __init__(self, segment_number, segment_size, segment_hash, segment_offset=0):
         self.segment_number = segment_number
         self.segment_size = segment_size
         self.segment_hash = segment_hash
+        # Position of the segment in the assembled file
+        self.segment_offset = segment_offset
+
+def parse_meta_int(line_number, key, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("line {}: {} has an invalid number '{}'".format(line_number, key, value))
 
 def parse_meta_file(meta_file_contents):
     try:
-        if meta_file_contents and len(meta_file_contents) >= 8:
-            cloud_format = meta_file_contents[0] == CLOUD_FORMAT_KEY
-            cloud_format_version = int(meta_file_contents[1].split(u":")[-1]) if meta_file_contents[1].startswith(CLOUD_FORMAT_VERSION_KEY) else None
-            xl_format = meta_file_contents[2] == XL_FORMAT_KEY
-            xl_size = int(meta_file_contents[3].split(u":")[-1]) if meta_file_contents[3].startswith(XL_SIZE_KEY) else None
-            xl_threshold = int(meta_file_contents[4].split(u":")[-1]) if meta_file_contents[4].startswith(XL_THRESHOLD_KEY) else None
-            total_segments = int(meta_file_contents[5].split(u":")[-1]) if meta_file_contents[5].startswith(XL_SEGMENTS_KEY) else None
-            segments = []
-            for i in xrange(6, len(meta_file_contents)):
-                if i < len(meta_file_contents)-2:
-                    segment_number = int(meta_file_contents[i].split(u":")[-1]) if meta_file_contents[i].startswith(XL_SEGMENT_NUMBER_KEY) else None
-                    segment_size = int(meta_file_contents[i+1].split(u":")[-1]) if XL_SEGMENT_SIZE_KEY in meta_file_contents[i + 1] else None
-                    segment_hash = meta_file_contents[i+2].split(u":")[-1] if XL_SEGMENT_HASH_KEY in meta_file_contents[i + 2] else None
-                    if segment_size and segment_hash and segment_number is not None:
-                        segments.append(Segment(segment_number, segment_size, segment_hash))
-            if cloud_format and (cloud_format_version in xrange(1, CURRENT_VERSION+1)) and xl_format and xl_size:
-                if total_segments == len(segments):
-                    return segments
+        if not meta_file_contents:
+            raise ValueError("the .meta file is empty")
+        header = {}
+        segments = []
+        segment = None
+        # Keys are compared without their trailing ':' so each line is split exactly once
+        segment_number_key = XL_SEGMENT_NUMBER_KEY[:-1]
+        segment_size_key = XL_SEGMENT_SIZE_KEY[:-1]
+        segment_hash_key = XL_SEGMENT_HASH_KEY[:-1]
+        header_keys = dict((key.rstrip(u":"), key) for key in (CLOUD_FORMAT_KEY, XL_FORMAT_KEY, CLOUD_FORMAT_VERSION_KEY,
+                                                              XL_SIZE_KEY, XL_THRESHOLD_KEY, XL_SEGMENTS_KEY))
+        for line_number, line in enumerate(meta_file_contents, 1):
+            key, separator, value = line.partition(u":")
+            # Segment keys make up almost every line so check them first
+            if key == segment_hash_key:
+                if segment is None:
+                    raise ValueError("line {}: {} comes before the first {}".format(line_number, XL_SEGMENT_HASH_KEY, XL_SEGMENT_NUMBER_KEY))
+                segment.segment_hash = value.rstrip(u"\r")
+            elif key == segment_size_key:
+                if segment is None:
+                    raise ValueError("line {}: {} comes before the first {}".format(line_number, XL_SEGMENT_SIZE_KEY, XL_SEGMENT_NUMBER_KEY))
+                segment.segment_size = parse_meta_int(line_number, XL_SEGMENT_SIZE_KEY, value)
+            elif key == segment_number_key:
+                segment = Segment(parse_meta_int(line_number, XL_SEGMENT_NUMBER_KEY, value), None, None)
+                segments.append(segment)
+            elif key.rstrip(u"\r") in header_keys:
+                header_key = header_keys[key.rstrip(u"\r")]
+                if separator:
+                    header[header_key] = parse_meta_int(line_number, header_key, value)
+                elif header_key in (CLOUD_FORMAT_KEY, XL_FORMAT_KEY):
+                    # Only the format markers stand alone, True would pass for a version or a segment count of 1
+                    header[header_key] = True
+                else:
+                    raise ValueError("line {}: {} has no value".format(line_number, header_key))
+
+        for key in (CLOUD_FORMAT_KEY, XL_FORMAT_KEY, CLOUD_FORMAT_VERSION_KEY, XL_SIZE_KEY, XL_SEGMENTS_KEY):
+            if key not in header:
+                raise ValueError("{} is missing".format(key))
+        if header[CLOUD_FORMAT_VERSION_KEY] not in range(1, CURRENT_VERSION+1):
+            raise ValueError("version {} is not supported".format(header[CLOUD_FORMAT_VERSION_KEY]))
+        if not header[XL_SIZE_KEY]:
+            raise ValueError("{} is 0".format(XL_SIZE_KEY))
+        if header[XL_SEGMENTS_KEY] != len(segments):
+            raise ValueError("{} expects {} segments but {} are listed".format(XL_SEGMENTS_KEY, header[XL_SEGMENTS_KEY], len(segments)))
+        segment_offset = 0
+        for segment in segments:
+            if not segment.segment_size:
+                raise ValueError("segment {} has no {}".format(segment.segment_number, XL_SEGMENT_SIZE_KEY))
+            if not segment.segment_hash:
+                raise ValueError("segment {} has no {}".format(segment.segment_number, XL_SEGMENT_HASH_KEY))
+            segment.segment_offset = segment_offset
+            segment_offset += segment.segment_size
+        return segments
     except Exception as e:
-        print("Problem reading xl meta file contents: {}".format(e))
+        # stderr, as stdout can be carrying the contents of the xl file
+        sys.stderr.write("Problem reading xl meta file contents: {}\n".format(e))
+
+class XLFile(io.RawIOBase):
+    # Read-only view of the logical file behind an xl folder, read straight from the segments
+    def __init__(self, xl_folder):
+        super(XLFile, self).__init__()
+        self.name = xl_folder
+        self._segments = read_xl_segments(xl_folder)
+        if self._segments is None:
+            raise IOError("Error: XL folder {} has no valid .meta file".format(xl_folder))
+        self._segment_offsets = [segment.segment_offset for segment in self._segments]
+        self._size = sum(segment.segment_size for segment in self._segments)
+        self._position = 0
+        self._segment_index = None
+        self._segment_file = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise IOError("Error: negative seek position {}".format(offset))
+        self._position = offset
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self._size or not len(buffer):
+            return 0
+        segment_index = bisect.bisect_right(self._segment_offsets, self._position) - 1
+        segment_offset = self._position - self._segment_offsets[segment_index]
+        segment_remaining = self._segments[segment_index].segment_size - segment_offset
+        segment_file = self._open_segment(segment_index)
+        segment_file.seek(segment_offset)
+        bytes_read = segment_file.readinto(memoryview(buffer)[:min(len(buffer), segment_remaining)])
+        if not bytes_read:
+            raise IOError("Error: XL segment {} is shorter than its .meta size".format(self._segments[segment_index].segment_hash))
+        self._position += bytes_read
+        return bytes_read
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(0, self._size - self._position)
+        buffer = bytearray(min(size, max(0, self._size - self._position)))
+        view = memoryview(buffer)
+        filled = 0
+        while filled < len(buffer):
+            bytes_read = self.readinto(view[filled:])
+            if not bytes_read:
+                break
+            filled += bytes_read
+        return bytes(buffer[:filled])
+
+    def close(self):
+        if self._segment_file:
+            self._segment_file.close()
+            self._segment_file = None
+        super(XLFile, self).close()
+
+    def _open_segment(self, segment_index):
+        if segment_index != self._segment_index:
+            if self._segment_file:
+                self._segment_file.close()
+            self._segment_file = open(os.path.join(self.name, self._segments[segment_index].segment_hash), 'rb')
+            self._segment_index = segment_index
+        return self._segment_file
+
+class XLSegmentMap(object):
+    # Memory-mapped segments of an xl folder, each one a zero-copy memoryview, in logical file order. Python 3 only,
+    # see MMAP_VIEWS
+    def __init__(self, xl_folder, segments=None):
+        if not MMAP_VIEWS:
+            raise IOError("Error: memory-mapped xl segments need Python 3")
+        self.name = xl_folder
+        self.segments = segments if segments is not None else read_xl_segments(xl_folder)
+        if self.segments is None:
+            raise IOError("Error: XL folder {} has no valid .meta file".format(xl_folder))
+        self.segment_offsets = [segment.segment_offset for segment in self.segments]
+        self.size = self.segment_offsets[-1] + self.segments[-1].segment_size if self.segments else 0
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __getitem__(self, segment_index):
+        if segment_index < 0:
+            segment_index += len(self.segments)
+        if segment_index not in self._maps:
+            self._maps[segment_index] = self._map_segment(self.segments[segment_index])
+        mapped = self._maps[segment_index]
+        return memoryview(mapped) if mapped is not None else memoryview(b'')
+
+    def __iter__(self):
+        for segment_index in range(len(self.segments)):
+            yield self[segment_index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def slices(self, start=0, end=None):
+        # Zero-copy slices covering the logical byte range [start, end)
+        end = self.size if end is None else min(end, self.size)
+        segment_index = bisect.bisect_right(self.segment_offsets, start) - 1
+        while start < end and segment_index < len(self.segments):
+            segment_offset = start - self.segment_offsets[segment_index]
+            segment_end = min(self.segments[segment_index].segment_size, end - self.segment_offsets[segment_index])
+            yield self[segment_index][segment_offset:segment_end]
+            start = self.segment_offsets[segment_index] + segment_end
+            segment_index += 1
+
+    def release(self, segment_index):
+        # Unmap a segment that is no longer needed, eg. once it has been written out
+        self._close_map(self._maps.pop(segment_index, None))
+
+    def close(self):
+        for mapped in self._maps.values():
+            self._close_map(mapped)
+        self._maps = {}
+
+    def _close_map(self, mapped):
+        if mapped is not None:
+            try:
+                mapped.close()
+            except BufferError:
+                # A view of the segment is still held, the mapping goes away with the last one
+                pass
+
+    def _map_segment(self, segment):
+        with open(os.path.join(self.name, segment.segment_hash), 'rb') as segment_file:
+            if not os.fstat(segment_file.fileno()).st_size:
+                return None
+            mapped = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Hints are only available on Python 3.8+ and on platforms that have them
+        madvise = getattr(mapped, 'madvise', None)
+        if madvise:
+            for advice in ('MADV_SEQUENTIAL', 'MADV_HUGEPAGE'):
+                if hasattr(mmap, advice):
+                    try:
+                        madvise(getattr(mmap, advice))
+                    except (OSError, ValueError):
+                        pass
+        return mapped
+
+class SegmentStore(object):
+    # Content-addressed store of xl segments keyed by the hash that names them. xl folders are only ever read from:
+    # a segment is hardlinked into the store once its contents match its hash, stored segments are checked the same
+    # way before they are used, and assembled files share blocks with them where the filesystem supports reflinks.
+    def __init__(self, store_folder):
+        self.store_folder = store_folder
+        self.added_segments = 0
+        self.reused_segments = 0
+        self.cloned_bytes = 0
+        self._verified_hashes = set()
+        self._lock = threading.Lock()
+
+    def get_segment_file_name(self, xl_folder, segment):
+        # Fails before anything is stored if the hash can't be checked
+        get_segment_hash_name(segment)
+        segment_file_name = os.path.join(os.path.abspath(xl_folder), segment.segment_hash)
+        stored_file_name = os.path.join(self.store_folder, segment.segment_hash[:2], segment.segment_hash)
+        with self._lock:
+            verified = segment.segment_hash in self._verified_hashes
+        if not verified and os.path.isfile(stored_file_name):
+            verified = is_segment_file_valid(stored_file_name, segment)
+            if not verified:
+                print("Replacing damaged stored segment {}".format(stored_file_name))
+                os.remove(stored_file_name)
+        if verified:
+            with self._lock:
+                self._verified_hashes.add(segment.segment_hash)
+                self.reused_segments += 1
+            return stored_file_name
+        if not is_segment_file_valid(segment_file_name, segment):
+            # Assemble from it as before, but keep it out of the store
+            return segment_file_name
+        try:
+            if not os.path.isdir(os.path.dirname(stored_file_name)):
+                os.makedirs(os.path.dirname(stored_file_name))
+            os.link(segment_file_name, stored_file_name)
+        except (OSError, AttributeError):
+            # Not on the same device (or no hardlinks), copying into the store would only cost space. The link also
+            # fails when another worker has just stored the same segment.
+            return segment_file_name
+        with self._lock:
+            self._verified_hashes.add(segment.segment_hash)
+            self.added_segments += 1
+        return stored_file_name
+
+    def add_xl_file_part(self, in_file, out_file, segment):
+        out_file.flush()
+        out_file.seek(segment.segment_offset)
+        if clone_file_range(in_file, out_file, segment.segment_offset, segment.segment_size):
+            with self._lock:
+                self.cloned_bytes += segment.segment_size
+            out_file.seek(segment.segment_offset + segment.segment_size)
+        else:
+            add_xl_file_part(in_file, out_file)
+
+    def print_report(self):
+        # Reused segments are still copied into the assembled file unless they could be cloned, so only cloned bytes
+        # are disk space saved
+        print("Segment store {}: {} segments added, {} reused, saved {} by cloning into assembled files".format(
+            self.store_folder, self.added_segments, self.reused_segments, format_size(self.cloned_bytes)))
+
+def get_segment_hash_name(segment):
+    # The .meta doesn't say which hash names the segments, so it is told apart by length
+    hash_name = SEGMENT_HASH_NAMES.get(len(segment.segment_hash))
+    if not hash_name:
+        raise ValueError("segment {} is named {}, which is not an md5, sha1 or sha256 hash".format(
+            segment.segment_number, segment.segment_hash))
+    return hash_name
+
+def is_segment_file_valid(segment_file_name, segment):
+    chunk_size = 4096 * 1024 #4MB
+    hash_name = get_segment_hash_name(segment)
+    if os.path.getsize(segment_file_name) != segment.segment_size:
+        return False
+    segment_hash = hashlib.new(hash_name)
+    with open(segment_file_name, 'rb') as segment_file:
+        for chunk in iter(lambda: segment_file.read(chunk_size), b''):
+            segment_hash.update(chunk)
+    return segment_hash.hexdigest() == segment.segment_hash.lower()
+
+def clone_file_range(in_file, out_file, out_offset, length):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        fcntl.ioctl(out_file.fileno(), FICLONERANGE, struct.pack('qQQQ', in_file.fileno(), 0, length, out_offset))
+        return True
+    except (IOError, OSError):
+        # Unsupported filesystem, different filesystems or a range that is not block aligned
+        return False
+
+def read_xl_segments(xl_folder):
+    with open(os.path.join(xl_folder, ".meta"), 'rb') as meta_file:
+        meta_data = meta_file.read()
+    meta_file_contents = meta_data.decode('utf-8').split(u"\n")
+    return parse_meta_file(meta_file_contents)
+
+def stream_xl_file(xl_folder, out_file):
+    chunk_size = 4096 * 1024 #4MB
+    error = get_xl_folder_error(xl_folder)
+    if error:
+        sys.stderr.write(error + "\n")
+        return False
+    try:
+        xl_file = XLFile(xl_folder)
+    except (IOError, OSError) as e:
+        sys.stderr.write("{}\n".format(e))
+        return False
+    try:
+        shutil.copyfileobj(xl_file, out_file, chunk_size)
+    except (IOError, OSError) as e:
+        sys.stderr.write("Error: Problem streaming {}: {}\n".format(xl_folder, e))
+        return False
+    finally:
+        xl_file.close()
+    return True
 
 def get_out_file_name(xl_folder):
     return xl_folder[:-40]
 
-def assemble_all_xl_files(folder):
+def find_all_xl_folders(folder):
+    xl_folders = []
     for root, dirs, files in os.walk(folder):
         for d in dirs:
             if d.endswith('.xlarge'):
-                assemble_one_xl_file(os.path.join(root,d))
+                xl_folders.append(os.path.join(root,d))
+    return xl_folders
+
+def assemble_all_xl_files(folder, workers=1, store=None, device_workers=None):
+    xl_folders = find_all_xl_folders(folder)
+    # One group per device, each assembled by at most device_workers threads (all the workers by default). A lower
+    # device_workers keeps spinning disks from seeking between files and sends the extra workers to other disks
+    if device_workers is None:
+        device_workers = workers
+    device_groups = {}
+    for xl_folder in xl_folders:
+        device_groups.setdefault(os.stat(xl_folder).st_dev, []).append(xl_folder)
+    worker_slots = threading.BoundedSemaphore(max(1, workers))
+    lock = threading.Lock()
+    assembled_sizes = []
+
+    def assemble_device_group(group):
+        while True:
+            with lock:
+                if not group:
+                    return
+                xl_folder = group.pop(0)
+            with worker_slots:
+                try:
+                    assembled_size = assemble_one_xl_file(xl_folder, store)
+                except Exception as e:
+                    print("Error: Problem assembling {}: {}".format(xl_folder, e))
+                    assembled_size = 0
+            if assembled_size:
+                with lock:
+                    assembled_sizes.append(assembled_size)
 
-def assemble_one_xl_file(xl_folder):
+    start_time = time.time()
+    threads = []
+    for group in device_groups.values():
+        for _ in range(min(max(1, device_workers), len(group))):
+            thread = threading.Thread(target=assemble_device_group, args=(group,))
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start_time
+    total_size = sum(assembled_sizes)
+    print("Assembled {} of {} XL files, {} in {:.1f}s ({}/s) across {} devices with {} workers".format(
+        len(assembled_sizes), len(xl_folders), format_size(total_size), elapsed,
+        format_size(total_size / elapsed if elapsed else 0), len(device_groups), min(max(1, workers), len(threads))))
+
+def get_xl_folder_error(xl_folder):
     if (not os.path.isdir(xl_folder) or not xl_folder.endswith("xlarge")):
-        print("Error: XL folder {} not found or not an XL folder".format(xl_folder))
+        return "Error: XL folder {} not found or not an XL folder".format(xl_folder)
     elif ( not os.path.isfile(os.path.join(xl_folder,".meta"))):
-        print("Error: XL file is not complete!")
+        return "Error: XL file is not complete!"
+    return None
+
+def assemble_one_xl_file(xl_folder, store=None):
+    error = get_xl_folder_error(xl_folder)
+    if error:
+        print(error)
     else:
         out_file_name = get_out_file_name(xl_folder)
         if os.path.isfile(out_file_name):
-            print out_file_name + " already exists!"
+            print(out_file_name + " already exists!")
         else:
-            with open(out_file_name, 'wb') as out_file:
-                perform_xl_assembly(xl_folder, out_file)
+            return perform_resumable_xl_assembly(xl_folder, out_file_name, store)
+    return 0
+
+def perform_resumable_xl_assembly(xl_folder, out_file_name, store=None):
+    # Assemble into a partial file with a progress record next to it, so an interrupted assembly can pick up where
+    # it stopped. The finished file is renamed into place, so out_file_name only ever exists complete.
+    partial_file_name = out_file_name + PARTIAL_SUFFIX
+    progress_file_name = partial_file_name + PROGRESS_SUFFIX
+    xl_segments = read_xl_segments(xl_folder)
+    if xl_segments is None:
+        print("Error: XL folder {} has no valid .meta file".format(xl_folder))
+        return 0
+    meta_hash = get_meta_hash(xl_folder)
+    # Segments are written and checked straight from memory-mapped views where possible, the segment store works
+    # on files so that it can clone them
+    segment_map = XLSegmentMap(xl_folder, xl_segments) if MMAP_VIEWS and not store else None
+    try:
+        segments_done = get_segments_done(xl_folder, xl_segments, partial_file_name, progress_file_name, meta_hash,
+                                          segment_map)
+        if segments_done:
+            print("Resuming " + out_file_name + " from segment {} of {}".format(segments_done + 1, len(xl_segments)))
+        resume_offset = xl_segments[segments_done - 1].segment_offset + xl_segments[segments_done - 1].segment_size if segments_done else 0
+        with open(partial_file_name, 'r+b' if segments_done else 'wb') as out_file:
+            out_file.seek(resume_offset)
+            out_file.truncate()
+            for segment_index in range(segments_done, len(xl_segments)):
+                segment = xl_segments[segment_index]
+                if store:
+                    with open(store.get_segment_file_name(xl_folder, segment), 'rb') as in_file:
+                        store.add_xl_file_part(in_file, out_file, segment)
+                elif segment_map:
+                    out_file.write(segment_map[segment_index])
+                    segment_map.release(segment_index)
+                else:
+                    with open(os.path.join(os.path.abspath(xl_folder), segment.segment_hash), 'rb') as in_file:
+                        add_xl_file_part(in_file, out_file)
+                out_file.flush()
+                save_segments_done(progress_file_name, meta_hash, segment_index + 1)
+            os.fsync(out_file.fileno())
+    finally:
+        if segment_map:
+            segment_map.close()
+    os.rename(partial_file_name, out_file_name)
+    os.remove(progress_file_name)
+    print(xl_folder + " reassembly complete! New file is " + out_file_name)
+    return os.path.getsize(out_file_name)
 
-def perform_xl_assembly(xl_folder, out_file):                
+def get_meta_hash(xl_folder):
     with open(os.path.join(xl_folder, ".meta"), 'rb') as meta_file:
-        meta_data = meta_file.read()
-    meta_file_contents = meta_data.split(u"\n")
-    xl_segments = parse_meta_file(meta_file_contents)
-    for segment in xl_segments:
-        segment_file_name = segment.segment_hash
-        with open(os.path.join(os.path.abspath(xl_folder),segment_file_name), 'rb') as in_file:
-            add_xl_file_part(in_file, out_file)
-    print xl_folder + " reassembly complete! New file is " + out_file.name
+        return hashlib.sha1(meta_file.read()).hexdigest()
+
+def get_segments_done(xl_folder, xl_segments, partial_file_name, progress_file_name, meta_hash, segment_map=None):
+    try:
+        with open(progress_file_name, 'r') as progress_file:
+            progress = json.loads(progress_file.read())
+    except Exception as e:
+        return 0
+    if progress.get('meta') != meta_hash or not os.path.isfile(partial_file_name):
+        # The progress belongs to a different version of the xl file
+        return 0
+    segments_done = min(int(progress.get('segments', 0)), len(xl_segments))
+    # Writes after the last progress record may not have reached the disk, so check the last segment really is there
+    # and step back until one matches
+    while segments_done and not is_segment_written(xl_folder, xl_segments[segments_done - 1], partial_file_name,
+                                                   segment_map[segments_done - 1] if segment_map else None):
+        segments_done -= 1
+    return segments_done
+
+def is_segment_written(xl_folder, segment, partial_file_name, segment_view=None):
+    chunk_size = 4096 * 1024 #4MB
+    if os.path.getsize(partial_file_name) < segment.segment_offset + segment.segment_size:
+        return False
+    if segment_view is not None:
+        # Compare the partial file against the mapped segment rather than reading the segment into buffers
+        if len(segment_view) != segment.segment_size:
+            return False
+        with open(partial_file_name, 'rb') as partial_file:
+            partial_file.seek(segment.segment_offset)
+            for start in range(0, segment.segment_size, chunk_size):
+                chunk = segment_view[start:start + chunk_size]
+                if chunk != partial_file.read(len(chunk)):
+                    return False
+        return True
+    with open(os.path.join(os.path.abspath(xl_folder), segment.segment_hash), 'rb') as in_file, \
+            open(partial_file_name, 'rb') as partial_file:
+        partial_file.seek(segment.segment_offset)
+        remaining = segment.segment_size
+        while remaining > 0:
+            chunk = in_file.read(min(chunk_size, remaining))
+            if not chunk or chunk != partial_file.read(len(chunk)):
+                return False
+            remaining -= len(chunk)
+    return True
+
+def save_segments_done(progress_file_name, meta_hash, segments_done):
+    with open(progress_file_name, 'w') as progress_file:
+        progress_file.write(json.dumps({'meta': meta_hash, 'segments': segments_done}))
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(size) < 1000 or unit == 'TB':
+            break
+        size /= 1000.0
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{} B'.format(int(size))
 
 def add_xl_file_part(in_file, out_file):
     in_file.seek(0)
-    next_chunk = ''
+    next_chunk = b''
     finished = False
     chunk_size = 4096 * 1024 #4MB
     
@@ -92,6 +572,10 @@ def get_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument(u"--path", type=str, help=u"The path to process for xl files", required=True)
     parser.add_argument(u"--recursive", action="store_true", default=False, help=u"Recursive xl assembly for the specified path", required=False)
+    parser.add_argument(u"--stdout", action="store_true", default=False, help=u"Write the contents of the xl file to stdout instead of assembling a copy on disk", required=False)
+    parser.add_argument(u"--store", type=str, help=u"Keep segments in this content-addressed folder: segments whose contents match their hash are hardlinked into it and, where the filesystem supports it, assembled files share blocks with them. The xl folders are not changed", required=False)
+    parser.add_argument(u"--workers", type=int, default=1, help=u"Number of xl files to assemble at once with --recursive", required=False)
+    parser.add_argument(u"--deviceworkers", type=int, default=None, help=u"Most xl files to assemble at once from each disk with --recursive, eg. 1 for spinning disks. Default is --workers", required=False)
     return parser.parse_args()
 
 def main():
@@ -100,10 +584,24 @@ def main():
     if sys.platform.startswith('win32'):
         folder_path = u"\\\\?\\" + folder_path
     
-    if args.recursive:
-        assemble_all_xl_files(folder_path)
+    if args.stdout:
+        if sys.platform.startswith('win32'):
+            import msvcrt
+            msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+        if not stream_xl_file(folder_path, getattr(sys.stdout, 'buffer', sys.stdout)):
+            sys.exit(1)
     else:
-        assemble_one_xl_file(folder_path)
+        store = SegmentStore(args.store) if args.store else None
+        if args.recursive:
+            assemble_all_xl_files(folder_path, args.workers, store, args.deviceworkers)
+        else:
+            try:
+                assemble_one_xl_file(folder_path, store)
+            except ValueError as e:
+                print("Error: Problem assembling {}: {}".format(folder_path, e))
+                sys.exit(1)
+        if store:
+            store.print_report()
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
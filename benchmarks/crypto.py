@@ -0,0 +1,47 @@
+#!/usr/bin/python
+#
+# Times key derivation and file decryption for every crypto backend decrypt_odrive_file.py can use here.
+#
+from __future__ import print_function
+import argparse
+import io
+import os
+import time
+
+import decrypt_odrive_file
+from benchmarks.encrypted_generators import PASSWORD, write_encrypted_file
+
+
+def time_derivations(count):
+    salt = os.urandom(decrypt_odrive_file.SALT_LENGTH)
+    start_time = time.time()
+    for _ in range(count):
+        decrypt_odrive_file.derive_key(salt, PASSWORD)
+    return time.time() - start_time
+
+
+def time_decrypt(encrypted_file):
+    with open(os.devnull, 'wb') as out_file:
+        start_time = time.time()
+        decrypt_odrive_file.decrypt_file(encrypted_file, out_file, PASSWORD, verbose=False)
+        return time.time() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(u"--derivations", type=int, default=200, help=u"Number of keys to derive per backend. Default is 200")
+    parser.add_argument(u"--size", type=int, default=256, help=u"Size in MB of the synthetic plaintext to decrypt. Default is 256")
+    args = parser.parse_args()
+
+    encrypted_file = io.BytesIO()
+    write_encrypted_file(encrypted_file, args.size * 1024 * 1024, PASSWORD)
+    for backend in decrypt_odrive_file.get_crypto_backends():
+        decrypt_odrive_file.set_crypto_backend(backend)
+        derive_elapsed = time_derivations(args.derivations)
+        decrypt_elapsed = time_decrypt(encrypted_file)
+        print("{:<13} {:>8.1f} derivations/s {:>8.1f} MB/s decrypt".format(
+            backend, args.derivations / derive_elapsed if derive_elapsed else 0, args.size / decrypt_elapsed if decrypt_elapsed else 0))
+
+
+if __name__ == "__main__":
+    main()
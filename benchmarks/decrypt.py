@@ -0,0 +1,34 @@
+#!/usr/bin/python
+#
+# Times decrypt_odrive_file.decrypt_file on a synthetic encrypted file with different buffer sizes.
+#
+from __future__ import print_function
+import argparse
+import os
+import tempfile
+import time
+
+import decrypt_odrive_file
+from benchmarks.encrypted_generators import PASSWORD, write_encrypted_file
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(u"--size", type=int, default=1024, help=u"Size in MB of the synthetic plaintext. Default is 1024")
+    parser.add_argument(u"--buffersizes", type=str, default="0.0625,1,4,16", help=u"Comma separated buffer sizes in MB to time")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.benchmark') as encrypted_file:
+        write_encrypted_file(encrypted_file, args.size * 1024 * 1024, PASSWORD)
+        encrypted_file.flush()
+        for buffer_size in args.buffersizes.split(","):
+            buffer_bytes = int(float(buffer_size) * 1024 * 1024)
+            with open(encrypted_file.name, 'rb') as in_file, open(os.devnull, 'wb') as out_file:
+                start_time = time.time()
+                decrypt_odrive_file.decrypt_file(in_file, out_file, PASSWORD, buffer_bytes)
+                elapsed = time.time() - start_time
+            print("buffer {} MB: {:.1f} MB/s".format(buffer_size, args.size / elapsed if elapsed else 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/python
+#
+# Synthetic encrypted data for the benchmarks: encrypted files and trees of encrypted names, built on the plaintext
+# from generators.py. Everything except the random salts and IVs is the same from one run to the next.
+#
+from __future__ import print_function
+import os
+
+import encrypt_odrive_file
+from benchmarks.generators import SyntheticFile
+
+PASSWORD = u"benchmark"
+
+
+def write_encrypted_file(out_file, size, password=PASSWORD, seed=0):
+    return encrypt_odrive_file.encrypt_file(SyntheticFile(size, seed), out_file, password)
+
+
+def make_encrypted_tree(folder, depth, folders, files, file_size, password=PASSWORD, seed=0):
+    # Every level has `folders` subfolders (down to `depth`) and `files` files, all with encrypted names
+    encrypted_files = []
+    pending = [(folder, 0)]
+    while pending:
+        parent, level = pending.pop()
+        for file_number in range(files):
+            encrypted_path = os.path.join(parent, encrypt_odrive_file.encrypt_name(u"file{}.bin".format(file_number), password))
+            with open(encrypted_path, 'wb') as out_file:
+                write_encrypted_file(out_file, file_size, password, seed + len(encrypted_files))
+            encrypted_files.append(encrypted_path)
+        if level < depth:
+            for folder_number in range(folders):
+                encrypted_folder = os.path.join(parent, encrypt_odrive_file.encrypt_name(u"folder{}".format(folder_number), password))
+                os.mkdir(encrypted_folder)
+                pending.append((encrypted_folder, level + 1))
+    return encrypted_files
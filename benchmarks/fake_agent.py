@@ -0,0 +1,420 @@
+#!/usr/bin/python
+#
+# A stand-in for the odrive agent that speaks the same newline-JSON protocol as odrivecli.py, for load testing and
+# benchmarking without a real agent or account. A local folder plays the cloud: the mount folder gets placeholders
+# for it, sync downloads from it and stream serves it, with configurable latency, bandwidth and failures.
+#
+# It can also sit in front of a real agent and record every session to a file, and replay such a file later.
+#
+# Point odrivecli.py at it by giving it a home folder to register in:
+#   python -m benchmarks.fake_agent --mount /tmp/odrive --remote ~/data --home /tmp/fakehome
+#   HOME=/tmp/fakehome python odrivecli.py sync /tmp/odrive --recursive
+#
+from __future__ import print_function
+import argparse
+import base64
+import fnmatch
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+import odrivecli
+
+FOLDER_PLACEHOLDER_EXTENSION = u'.cloudf'
+FILE_PLACEHOLDER_EXTENSION = u'.cloud'
+CHUNK_SIZE = 1024 * 1024
+
+
+class FakeAgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if line:
+            self.server.agent.handle(line, self.wfile)
+
+
+class FakeAgentServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # odrivecli gives up on a connection after 100ms, so parallel clients must not wait on a short backlog
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients hang up whenever they like, eg. a stream piped into head
+        if not isinstance(sys.exc_info()[1], socket.error):
+            socketserver.ThreadingTCPServer.handle_error(self, request, client_address)
+
+
+class FakeAgent(object):
+    def __init__(self, mount_folder=None, remote_folder=None, latency=0, jitter=0, bandwidth=None, failure_rate=0,
+                 fail_pattern=None, status_items=0, seed=0, record_file=None, upstream_port=None, replay_file=None,
+                 speed=1.0):
+        self.mount_folder = mount_folder and os.path.abspath(mount_folder)
+        self.remote_folder = remote_folder and os.path.abspath(remote_folder)
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.fail_pattern = fail_pattern
+        self.status_items = status_items
+        self.record_file = record_file
+        self.upstream_port = upstream_port
+        self.speed = speed
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._downloads = {}
+        self._replay = self._load_replay(replay_file) if replay_file else None
+        self._server = None
+        if self.mount_folder and self.remote_folder:
+            if not os.path.isdir(self.mount_folder):
+                os.makedirs(self.mount_folder)
+            self._add_placeholders(self.mount_folder)
+
+    def start(self, port=0):
+        self._server = FakeAgentServer((odrivecli.HOST, port), FakeAgentHandler)
+        self._server.agent = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self._server.server_address[1]
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def write_registry(self, home_folder):
+        # The same file the agent writes, odrivecli.py finds the port in it
+        registry_folder = os.path.join(home_folder, '.odrive-agent')
+        if not os.path.isdir(registry_folder):
+            os.makedirs(registry_folder)
+        with open(os.path.join(registry_folder, '.oreg'), 'w') as f:
+            f.write(json.dumps({'current': {odrivecli.PROTOCOL_SERVER_PORT_KEY: self._server.server_address[1]}}))
+
+    def handle(self, line, out_file):
+        with self._lock:
+            self.requests += 1
+        if self._replay is not None:
+            return self._replay_session(line, out_file)
+        if self.record_file:
+            return self._record_session(line, out_file)
+        request = json.loads(line.decode('utf-8'))
+        if self.latency or self.jitter:
+            with self._lock:
+                delay = self.latency + self._random.uniform(0, self.jitter)
+            time.sleep(delay / 1000.0)
+        if not isinstance(request, dict):
+            # odrivecli sends true when FolderSyncRule rejects its arguments
+            self._send_error(out_file, u'Invalid request: {}'.format(line.decode('utf-8').strip()))
+            return
+        command = request.get('command')
+        parameters = request.get('parameters') or {}
+        handler = getattr(self, '_command_' + str(command), None)
+        if handler is None:
+            self._send(out_file, odrivecli.OdriveSynchronousCommand._ERROR_MESSAGE, u'Unsupported command: {}'.format(command))
+            return
+        try:
+            handler(parameters, out_file)
+        except socket.error:
+            pass
+
+    def _send(self, out_file, messageType, message):
+        out_file.write((json.dumps({'messageType': messageType, 'message': message}) + '\n').encode('utf-8'))
+
+    def _send_status(self, out_file, message):
+        self._send(out_file, odrivecli.OdriveSynchronousCommand._STATUS_MESSAGE, message)
+
+    def _send_error(self, out_file, message):
+        self._send(out_file, odrivecli.OdriveSynchronousCommand._ERROR_MESSAGE, message)
+
+    def _should_fail(self, path):
+        if self.fail_pattern and fnmatch.fnmatch(os.path.basename(self._get_synced_path(path)), self.fail_pattern):
+            return True
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _get_synced_path(self, path):
+        if path.endswith((FOLDER_PLACEHOLDER_EXTENSION, FILE_PLACEHOLDER_EXTENSION)):
+            return os.path.splitext(path)[0]
+        return path
+
+    def _get_remote_path(self, path):
+        relative_path = os.path.relpath(self._get_synced_path(path), self.mount_folder)
+        if relative_path.startswith(os.pardir):
+            return None
+        return os.path.normpath(os.path.join(self.remote_folder, relative_path))
+
+    def _add_placeholders(self, folder):
+        remote_folder = self._get_remote_path(folder)
+        if not remote_folder or not os.path.isdir(remote_folder):
+            return
+        remote_names = set()
+        for name in os.listdir(remote_folder):
+            remote_path = os.path.join(remote_folder, name)
+            local_path = os.path.join(folder, name)
+            remote_names.add(name)
+            placeholder_path = local_path + (FOLDER_PLACEHOLDER_EXTENSION if os.path.isdir(remote_path) else FILE_PLACEHOLDER_EXTENSION)
+            if not os.path.exists(local_path) and not os.path.exists(placeholder_path):
+                open(placeholder_path, 'wb').close()
+                # Placeholders carry the remote modification time, like the agent's
+                remote_mtime = os.path.getmtime(remote_path)
+                os.utime(placeholder_path, (remote_mtime, remote_mtime))
+        for name in os.listdir(folder):
+            if name.endswith((FOLDER_PLACEHOLDER_EXTENSION, FILE_PLACEHOLDER_EXTENSION)) and \
+                    os.path.splitext(name)[0] not in remote_names:
+                os.remove(os.path.join(folder, name))
+
+    def _copy(self, in_file, out_file, size, progress=None):
+        start_time = time.time()
+        copied = 0
+        while True:
+            chunk = in_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            out_file.write(chunk)
+            copied += len(chunk)
+            if progress:
+                progress(copied)
+            if self.bandwidth:
+                # Sleep off whatever is ahead of the simulated link
+                ahead = copied / (self.bandwidth * 1024.0 * 1024.0) - (time.time() - start_time)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def _command_sync(self, parameters, out_file):
+        path = parameters.get(odrivecli.Sync.PLACEHOLDER_PATH_ARGUMENT_NAME) or u''
+        remote_path = self._get_remote_path(path) if path else None
+        if not os.path.exists(path) or not remote_path or not os.path.exists(remote_path):
+            self._send_error(out_file, u'{} does not exist'.format(path))
+            return
+        if self._should_fail(path):
+            self._send_error(out_file, u'Unable to sync {}. Injected failure'.format(path))
+            return
+        synced_path = self._get_synced_path(path)
+        if path.endswith(FOLDER_PLACEHOLDER_EXTENSION):
+            os.mkdir(synced_path)
+            os.remove(path)
+            self._add_placeholders(synced_path)
+            self._send_status(out_file, u'Expanded {}'.format(synced_path))
+        elif path.endswith(FILE_PLACEHOLDER_EXTENSION):
+            self._download(path, remote_path, out_file)
+        else:
+            self._send_status(out_file, u'{} is already synced'.format(path))
+
+    def _download(self, path, remote_path, out_file):
+        synced_path = self._get_synced_path(path)
+        size = os.path.getsize(remote_path)
+        download = {'name': os.path.basename(synced_path), 'path': synced_path, 'percentComplete': 0}
+        with self._lock:
+            self._downloads[synced_path] = download
+
+        def progress(copied):
+            download['percentComplete'] = int(copied * 100 / size) if size else 100
+            self._send_status(out_file, u'Downloading {} {}%'.format(download['name'], download['percentComplete']))
+
+        try:
+            with open(remote_path, 'rb') as in_file, open(synced_path, 'wb') as synced_file:
+                self._copy(in_file, synced_file, size, progress)
+            os.remove(path)
+        finally:
+            with self._lock:
+                del self._downloads[synced_path]
+        self._send_status(out_file, u'Synced {}'.format(synced_path))
+
+    def _command_stream(self, parameters, out_file):
+        path = parameters.get(odrivecli.Stream.PATH_ARGUMENT_NAME) or u''
+        remote_path = self._get_remote_path(path) if path else None
+        if remote_path and os.path.isfile(remote_path) and not self._should_fail(path):
+            with open(remote_path, 'rb') as in_file:
+                self._copy(in_file, out_file, os.path.getsize(remote_path))
+
+    def _command_streamremote(self, parameters, out_file):
+        path = parameters.get(odrivecli.StreamRemote.PATH_ARGUMENT_NAME) or u''
+        remote_path = os.path.normpath(os.path.join(self.remote_folder, path.lstrip(u'/')))
+        if remote_path.startswith(self.remote_folder) and os.path.isfile(remote_path) and not self._should_fail(path):
+            with open(remote_path, 'rb') as in_file:
+                self._copy(in_file, out_file, os.path.getsize(remote_path))
+
+    def _get_sync_state(self, path):
+        if path.endswith((FOLDER_PLACEHOLDER_EXTENSION, FILE_PLACEHOLDER_EXTENSION)):
+            return 'NotSynced'
+        with self._lock:
+            if path in self._downloads:
+                return 'Active'
+        return 'Synced'
+
+    def _send_sync_states(self, path, out_file):
+        childSyncStates = {}
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                childSyncStates[os.path.splitext(name)[0] if name.endswith((FOLDER_PLACEHOLDER_EXTENSION, FILE_PLACEHOLDER_EXTENSION)) else name] = \
+                    self._get_sync_state(os.path.join(path, name))
+        # The agent sends these as a JSON string inside the message
+        self._send_status(out_file, json.dumps({'syncState': self._get_sync_state(path), 'childSyncStates': childSyncStates}))
+
+    def _command_syncstate(self, parameters, out_file):
+        path = parameters.get(odrivecli.SyncState.PATH_ARGUMENT_NAME) or u''
+        if not os.path.exists(path):
+            self._send_error(out_file, u'{} does not exist'.format(path))
+            return
+        self._send_sync_states(path, out_file)
+
+    def _command_refresh(self, parameters, out_file):
+        path = parameters.get(odrivecli.Refresh.FOLDER_PATH_ARGUMENT_NAME) or u''
+        if not os.path.isdir(path) or self._should_fail(path):
+            self._send_error(out_file, u'Unable to refresh {}'.format(path))
+            return
+        self._add_placeholders(path)
+        self._send_sync_states(path, out_file)
+
+    def _command_unsync(self, parameters, out_file):
+        path = parameters.get(odrivecli.Unsync.PATH_ARGUMENT_NAME) or u''
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            open(path + FOLDER_PLACEHOLDER_EXTENSION, 'wb').close()
+        elif os.path.isfile(path) and not path.endswith((FOLDER_PLACEHOLDER_EXTENSION, FILE_PLACEHOLDER_EXTENSION)):
+            os.remove(path)
+            open(path + FILE_PLACEHOLDER_EXTENSION, 'wb').close()
+        else:
+            self._send_error(out_file, u'Unable to unsync {}'.format(path))
+            return
+        self._send_status(out_file, u'Unsynced {}'.format(path))
+
+    def _command_status(self, parameters, out_file):
+        with self._lock:
+            downloads = [dict(download) for download in self._downloads.values()]
+        # Padding makes for payloads as big as a busy agent's
+        items = [{'name': u'item{}'.format(number), 'path': os.path.join(self.mount_folder or u'', u'item{}'.format(number)),
+                  'folderPath': self.mount_folder or u'', 'percentComplete': number % 100, 'explanation': u'Fake'}
+                 for number in range(self.status_items)]
+        self._send_status(out_file, {
+            'isActivated': True,
+            'hasSession': True,
+            'authorizedEmail': u'fake@localhost',
+            'authorizedAccountSourceType': u'odrive',
+            'syncEnabled': True,
+            'productVersion': u'fake',
+            'placeholderThreshold': u'neverDownload',
+            'autoUnsyncThreshold': u'never',
+            'downloadThrottlingThreshold': u'unlimited',
+            'uploadThrottlingThreshold': u'normal',
+            'autoTrashThreshold': u'never',
+            'xlFileThreshold': u'large',
+            'proSyncFolders': [],
+            'odriveFolder': {'path': self.mount_folder or u'', 'status': u'Online'},
+            'backupJobs': [],
+            'expandRequests': [],
+            'syncRequests': [{'path': download['path'], 'percentComplete': download['percentComplete']} for download in downloads],
+            'refreshChildOperations': [],
+            'uploads': items,
+            'downloads': downloads + items,
+            'trashItems': [],
+            'waitingItems': items,
+            'notAllowedItems': []})
+
+    def _record_session(self, line, out_file):
+        upstream = socket.create_connection((odrivecli.HOST, self.upstream_port))
+        responses = []
+        start_time = time.time()
+        try:
+            upstream.sendall(line)
+            while True:
+                data = upstream.recv(odrivecli.OdriveSynchronousCommand._RESPONSE_DATA_MAX_CHUNK_SIZE)
+                if not data:
+                    break
+                responses.append([time.time() - start_time, base64.b64encode(data).decode('ascii')])
+                out_file.write(data)
+        finally:
+            upstream.close()
+            with self._lock:
+                with open(self.record_file, 'a') as f:
+                    f.write(json.dumps({'request': json.loads(line.decode('utf-8')), 'responses': responses}) + '\n')
+
+    def _load_replay(self, replay_file):
+        sessions = {}
+        with open(replay_file, 'r') as f:
+            for line in f:
+                if line.strip():
+                    session = json.loads(line)
+                    sessions.setdefault(self._get_replay_key(session['request']), []).append(session['responses'])
+        return sessions
+
+    def _get_replay_key(self, request):
+        return json.dumps(request, sort_keys=True)
+
+    def _replay_session(self, line, out_file):
+        key = self._get_replay_key(json.loads(line.decode('utf-8')))
+        with self._lock:
+            recorded = self._replay.get(key)
+            # Sessions for the same request are replayed in the order they were recorded, then the last one repeats
+            responses = recorded.pop(0) if recorded and len(recorded) > 1 else (recorded[0] if recorded else None)
+        if responses is None:
+            self._send_error(out_file, u'No recorded session for {}'.format(key))
+            return
+        start_time = time.time()
+        for offset, data in responses:
+            delay = offset / self.speed - (time.time() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+            out_file.write(base64.b64decode(data))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(u"--mount", type=str, help=u"Local folder that gets placeholders for the --remote folder", required=False)
+    parser.add_argument(u"--remote", type=str, help=u"Folder that plays the cloud storage behind --mount", required=False)
+    parser.add_argument(u"--port", type=int, default=0, help=u"Port to listen on. Default is any free port", required=False)
+    parser.add_argument(u"--home", type=str, help=u"Register the port in HOME/.odrive-agent/.oreg so that odrivecli.py run with this HOME finds it", required=False)
+    parser.add_argument(u"--latency", type=float, default=0, help=u"Milliseconds to wait before handling each command", required=False)
+    parser.add_argument(u"--jitter", type=float, default=0, help=u"Up to this many random extra milliseconds of latency", required=False)
+    parser.add_argument(u"--bandwidth", type=float, help=u"Download and stream speed limit in MB/s", required=False)
+    parser.add_argument(u"--failurerate", type=float, default=0, help=u"Fraction of sync, stream and refresh commands that fail (0-1)", required=False)
+    parser.add_argument(u"--fail", type=str, help=u"Always fail to sync, stream or refresh names matching this glob", required=False)
+    parser.add_argument(u"--statusitems", type=int, default=0, help=u"Extra uploads, downloads and waiting items to put in every status response", required=False)
+    parser.add_argument(u"--seed", type=int, default=0, help=u"Seed for the latency jitter and failures", required=False)
+    parser.add_argument(u"--record", type=str, help=u"Pass every command to the real agent and append the sessions to this file", required=False)
+    parser.add_argument(u"--upstream", type=int, help=u"Port of the real agent for --record. Default is the one in ~/.odrive-agent/.oreg", required=False)
+    parser.add_argument(u"--replay", type=str, help=u"Answer commands with the sessions recorded in this file", required=False)
+    parser.add_argument(u"--speed", type=float, default=1.0, help=u"Speed up (or slow down) --replay timings by this factor", required=False)
+    args = parser.parse_args()
+
+    upstream_port = args.upstream
+    if args.record and not upstream_port:
+        upstream_port = odrivecli.get_protocol_server_port(os.path.join(odrivecli.expand_user(u'~'), '.odrive-agent', '.oreg'))
+        if not upstream_port:
+            parser.error(u"no running agent found to record, use --upstream")
+    if not (args.record or args.replay) and not (args.mount and args.remote):
+        parser.error(u"--mount and --remote are required unless recording or replaying")
+    if args.remote and not os.path.isdir(args.remote):
+        parser.error(u"--remote {} is not a folder".format(args.remote))
+
+    agent = FakeAgent(args.mount, args.remote, args.latency, args.jitter, args.bandwidth, args.failurerate, args.fail,
+                      args.statusitems, args.seed, args.record, upstream_port, args.replay, args.speed)
+    port = agent.start(args.port)
+    if args.home:
+        agent.write_registry(os.path.abspath(args.home))
+    print("Fake odrive agent listening on {}:{}".format(odrivecli.HOST, port))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.stop()
+        print("Handled {} commands".format(agent.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Synthetic data for the benchmarks and tests: file contents, .meta files, xl folders and remote trees for the fake
+# agent. Encrypted data is in encrypted_generators.py, so that nothing here needs a crypto library.
+# Everything is the same from one run to the next.
+#
+from __future__ import print_function
+import hashlib
+import io
+import os
+import random
+import shutil
+import struct
+
+import assemble_xl_file
+import split_xl_file
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class SyntheticFile(io.RawIOBase):
+    # Reproducible contents that are never held in memory: one seeded block, repeated with the block number in its
+    # first 8 bytes so that no two blocks (or xl segments) are identical
+    def __init__(self, size, seed=0):
+        super(SyntheticFile, self).__init__()
+        rng = random.Random(seed)
+        self._block = bytearray(rng.getrandbits(8) for _ in range(BLOCK_SIZE))
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b)
+        count = min(len(view), self._size - self._position)
+        written = 0
+        while written < count:
+            block_number, offset = divmod(self._position + written, BLOCK_SIZE)
+            struct.pack_into('>Q', self._block, 0, block_number)
+            length = min(count - written, BLOCK_SIZE - offset)
+            view[written:written + length] = self._block[offset:offset + length]
+            written += length
+        self._position += count
+        return count
+
+
+def write_data_file(file_path, size, seed=0):
+    with open(file_path, 'wb') as out_file:
+        shutil.copyfileobj(SyntheticFile(size, seed), out_file, BLOCK_SIZE)
+    return file_path
+
+
+def make_meta_file_contents(segment_count, segment_size):
+    lines = [assemble_xl_file.CLOUD_FORMAT_KEY,
+             assemble_xl_file.CLOUD_FORMAT_VERSION_KEY + str(assemble_xl_file.CURRENT_VERSION),
+             assemble_xl_file.XL_FORMAT_KEY,
+             assemble_xl_file.XL_SIZE_KEY + str(segment_count * segment_size),
+             assemble_xl_file.XL_THRESHOLD_KEY + str(segment_size),
+             assemble_xl_file.XL_SEGMENTS_KEY + str(segment_count)]
+    for segment_number in range(segment_count):
+        lines.append(assemble_xl_file.XL_SEGMENT_NUMBER_KEY + str(segment_number))
+        lines.append(assemble_xl_file.XL_SEGMENT_SIZE_KEY + str(segment_size))
+        lines.append(assemble_xl_file.XL_SEGMENT_HASH_KEY + hashlib.sha1(str(segment_number).encode('utf-8')).hexdigest())
+    return u"\n".join(lines)
+
+
+def make_xl_folder(folder, size, segment_size, name=u"synthetic.bin", seed=0):
+    # Real segments and .meta, made by splitting a synthetic file the way the agent would
+    file_path = write_data_file(os.path.join(folder, name), size, seed)
+    try:
+        return split_xl_file.split_xl_file(file_path, segment_size, folder)
+    finally:
+        os.remove(file_path)
+
+
+def count_placeholders(depth, folders, files):
+    return sum(folders ** level * (files + (folders if level < depth else 0)) for level in range(depth + 1))
+
+
+def make_remote_tree(folder, depth, folders, files, file_size=0, seed=0):
+    # Real folders and files, depth levels of folders folders each, for benchmarks/fake_agent.py to serve as the cloud
+    pending = [(folder, 0)]
+    while pending:
+        parent, level = pending.pop()
+        for file_number in range(files):
+            file_path = os.path.join(parent, u"file{}.txt".format(file_number))
+            if file_size:
+                write_data_file(file_path, file_size, seed + file_number)
+            else:
+                open(file_path, 'wb').close()
+        for folder_number in range(folders if level < depth else 0):
+            subfolder = os.path.join(parent, u"folder{}".format(folder_number))
+            os.mkdir(subfolder)
+            pending.append((subfolder, level + 1))
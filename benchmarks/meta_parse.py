@@ -0,0 +1,35 @@
+#!/usr/bin/python
+#
+# Times assemble_xl_file.parse_meta_file on synthetic .meta files with many segments.
+#
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+import assemble_xl_file
+from benchmarks.generators import make_meta_file_contents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(u"--segments", type=int, default=100000, help=u"Number of segments in the synthetic .meta file")
+    parser.add_argument(u"--repeat", type=int, default=5, help=u"Number of timed parses, the best one is reported")
+    args = parser.parse_args()
+
+    meta_data = make_meta_file_contents(args.segments, 100 * 1000 * 1000)
+    timings = []
+    for _ in range(args.repeat):
+        start_time = time.time()
+        segments = assemble_xl_file.parse_meta_file(meta_data.split(u"\n"))
+        timings.append(time.time() - start_time)
+        if segments is None or len(segments) != args.segments:
+            print("Error: parse_meta_file did not return {} segments".format(args.segments))
+            sys.exit(1)
+    best = min(timings)
+    print("Parsed {} segments in {:.3f}s ({:.0f} segments/s, best of {})".format(
+        args.segments, best, args.segments / best if best else 0, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
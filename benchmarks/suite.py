@@ -0,0 +1,222 @@
+#!/usr/bin/python
+#
+# Runs every benchmark on synthetic data and writes the timings as JSON, optionally compared against a baseline
+# from an earlier run. Exits with 1 if any case got slower than the baseline by more than the tolerance.
+#
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import assemble_xl_file
+import decrypt_odrive_file
+import encrypt_odrive_file
+import odrivecli
+from benchmarks import fake_agent
+from benchmarks import encrypted_generators
+from benchmarks import generators
+
+CASES = ['meta_parse', 'assemble', 'encrypt', 'decrypt', 'decrypt_names', 'agent_sync', 'agent_status']
+STATUS_CALLS = 20
+
+
+def time_best(repeat, setup, run):
+    timings = []
+    stdout = sys.stdout
+    for _ in range(repeat):
+        state = setup()
+        # The tools report progress on stdout, which isn't what is being timed
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            start_time = time.time()
+            run(state)
+            timings.append(time.time() - start_time)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return min(timings)
+
+
+def bench_meta_parse(args, work_folder):
+    meta_lines = generators.make_meta_file_contents(args.segments, 100 * 1000 * 1000).split(u"\n")
+    seconds = time_best(args.repeat, lambda: None, lambda state: assemble_xl_file.parse_meta_file(meta_lines))
+    return seconds, args.segments, 'segments/s'
+
+
+def bench_assemble(args, work_folder):
+    xl_folder = generators.make_xl_folder(work_folder, args.size * 1024 * 1024, args.segmentsize * 1024 * 1024)
+    out_file_name = assemble_xl_file.get_out_file_name(xl_folder)
+
+    def setup():
+        if os.path.exists(out_file_name):
+            os.remove(out_file_name)
+
+    seconds = time_best(args.repeat, setup, lambda state: assemble_xl_file.assemble_one_xl_file(xl_folder))
+    return seconds, args.size, 'MB/s'
+
+
+def bench_encrypt(args, work_folder):
+    data_file = generators.write_data_file(os.path.join(work_folder, u"plaintext.bin"), args.size * 1024 * 1024)
+
+    def run(state):
+        with open(data_file, 'rb') as in_file, open(os.devnull, 'wb') as out_file:
+            encrypt_odrive_file.encrypt_file(in_file, out_file, encrypted_generators.PASSWORD)
+
+    seconds = time_best(args.repeat, lambda: None, run)
+    return seconds, args.size, 'MB/s'
+
+
+def bench_decrypt(args, work_folder):
+    encrypted_file = os.path.join(work_folder, u"encrypted.bin")
+    with open(encrypted_file, 'wb') as out_file:
+        encrypted_generators.write_encrypted_file(out_file, args.size * 1024 * 1024)
+
+    def run(state):
+        with open(encrypted_file, 'rb') as in_file, open(os.devnull, 'wb') as out_file:
+            decrypt_odrive_file.decrypt_file(in_file, out_file, encrypted_generators.PASSWORD, verbose=False)
+
+    seconds = time_best(args.repeat, lambda: None, run)
+    return seconds, args.size, 'MB/s'
+
+
+def bench_decrypt_names(args, work_folder):
+    tree_folder = os.path.join(work_folder, u"encrypted_tree")
+    os.mkdir(tree_folder)
+    encrypted_files = encrypted_generators.make_encrypted_tree(tree_folder, 1, 2, max(1, args.names // 3), 0)
+    names = [os.path.basename(encrypted_path) for encrypted_path in encrypted_files]
+
+    def run(state):
+        for name in names:
+            decrypt_odrive_file.decrypt_name(name, encrypted_generators.PASSWORD)
+
+    seconds = time_best(args.repeat, lambda: None, run)
+    return seconds, len(names), 'names/s'
+
+
+def bench_agent_sync(args, work_folder):
+    # A recursive sync of a placeholder tree, every placeholder goes through the protocol to the fake agent
+    depth, folders, files = args.tree
+    remote_folder = os.path.join(work_folder, u"remote")
+    mount_folder = os.path.join(work_folder, u"mount")
+    os.mkdir(remote_folder)
+    generators.make_remote_tree(remote_folder, depth, folders, files)
+    agents = []
+
+    def setup():
+        for agent in agents:
+            agent.stop()
+        if os.path.isdir(mount_folder):
+            shutil.rmtree(mount_folder)
+        agent = fake_agent.FakeAgent(mount_folder, remote_folder)
+        agents[:] = [agent]
+        return agent.start()
+
+    def run(port):
+        odrivecli.RecursiveSync(port, None, mount_folder, False).execute()
+
+    try:
+        seconds = time_best(args.repeat, setup, run)
+    finally:
+        for agent in agents:
+            agent.stop()
+    return seconds, generators.count_placeholders(depth, folders, files), 'placeholders/s'
+
+
+def bench_agent_status(args, work_folder):
+    agent = fake_agent.FakeAgent(status_items=args.statusitems)
+    port = agent.start()
+
+    def run(state):
+        for _ in range(STATUS_CALLS):
+            odrivecli.DownloadsStatus(agentPort=port, desktopPort=None).execute()
+
+    try:
+        seconds = time_best(args.repeat, lambda: None, run)
+    finally:
+        agent.stop()
+    return seconds, STATUS_CALLS, 'status/s'
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, result in sorted(results.items()):
+        baseline_result = baseline.get('results', {}).get(case)
+        if not baseline_result:
+            continue
+        change = result['seconds'] / baseline_result['seconds'] - 1 if baseline_result['seconds'] else 0
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(case)
+        print("{:<16} {:>+7.1f}% vs baseline{}".format(case, change * 100, "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def get_tree(value):
+    try:
+        depth, folders, files = [int(part) for part in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("give depth,folders,files eg. 3,4,10")
+    return depth, folders, files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(u"--cases", type=str, default=",".join(CASES), help=u"Comma separated cases to run. Default is all of {}".format(", ".join(CASES)))
+    parser.add_argument(u"--size", type=int, default=256, help=u"Size in MB of the synthetic files. Default is 256")
+    parser.add_argument(u"--segmentsize", type=int, default=16, help=u"Size in MB of the synthetic xl segments. Default is 16")
+    parser.add_argument(u"--segments", type=int, default=100000, help=u"Number of segments in the synthetic .meta file. Default is 100000")
+    parser.add_argument(u"--names", type=int, default=300, help=u"Number of encrypted names to decrypt. Default is 300")
+    parser.add_argument(u"--tree", type=get_tree, default=(3, 4, 10), help=u"Shape of the synced tree as depth,folders,files. Default is 3,4,10")
+    parser.add_argument(u"--statusitems", type=int, default=1000, help=u"Number of uploads, downloads and waiting items in each fake agent status. Default is 1000")
+    parser.add_argument(u"--repeat", type=int, default=3, help=u"Number of timed runs per case, the best one is reported. Default is 3")
+    parser.add_argument(u"--output", type=str, help=u"Write the results to this JSON file", required=False)
+    parser.add_argument(u"--baseline", type=str, help=u"Compare against the results in this JSON file", required=False)
+    parser.add_argument(u"--tolerance", type=float, default=0.1, help=u"Slowdown against the baseline counted as a regression. Default is 0.1 (10%%)")
+    parser.add_argument(u"--workdir", type=str, help=u"Folder for the synthetic data. Default is a temporary folder", required=False)
+    args = parser.parse_args()
+
+    cases = [case for case in args.cases.split(",") if case]
+    for case in cases:
+        if case not in CASES:
+            parser.error(u"unknown case {}, choose from {}".format(case, ", ".join(CASES)))
+    parameters = dict((key, getattr(args, key)) for key in ('size', 'segmentsize', 'segments', 'names', 'tree', 'statusitems', 'repeat'))
+    parameters['tree'] = list(parameters['tree'])
+    report = {'python': platform.python_version(),
+              'platform': sys.platform,
+              'crypto_backend': decrypt_odrive_file.crypto_backend,
+              'parameters': parameters,
+              'results': {}}
+
+    for case in cases:
+        work_folder = tempfile.mkdtemp(prefix=u"odrive-benchmark-", dir=args.workdir)
+        try:
+            seconds, amount, unit = globals()['bench_' + case](args, work_folder)
+        finally:
+            shutil.rmtree(work_folder)
+        rate = amount / seconds if seconds else 0
+        report['results'][case] = {'seconds': seconds, 'rate': rate, 'unit': unit}
+        print("{:<16} {:>10.3f}s {:>12.1f} {}".format(case, seconds, rate, unit))
+        sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(report, indent=2, sort_keys=True))
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.loads(f.read())
+        if baseline.get('parameters') != parameters:
+            print("Warning: baseline was run with different parameters: {}".format(baseline.get('parameters')))
+        if baseline.get('python') != report['python'] or baseline.get('crypto_backend') != report['crypto_backend']:
+            print("Warning: baseline was run on python {} with the {} crypto backend".format(
+                baseline.get('python'), baseline.get('crypto_backend')))
+        if compare(report['results'], baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,50 @@
+from __future__ import print_function
 import base64
-import Crypto.Cipher.AES
-import Crypto.Hash.HMAC
-import Crypto.Hash.SHA256
-import Crypto.Protocol.KDF
+import binascii
 import hashlib
+import io
 import sys
 import argparse
+import multiprocessing
 import os
+import shutil
+import sqlite3
+import time
+
+try:
+    import Crypto
+    import Crypto.Cipher.AES
+    import Crypto.Hash.HMAC
+    import Crypto.Hash.SHA256
+    import Crypto.Protocol.KDF
+except ImportError:
+    Crypto = None
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
 
 SALT_LENGTH = 8
 VERSION_LENGTH = 1
-VALID_VERSIONS = ['1', '2']
+VALID_VERSIONS = [b'1', b'2']
 INVALID_NAME = 'invalid.name.000'
+DEFAULT_BUFFER_SIZE_MB = 4
+PARTIAL_SUFFIX = u".partial"
+AES_BLOCK_SIZE = 16
+KEY_LENGTH = 16
+COST_FACTOR = 5000
+# pycryptodome 3.7+ can encrypt and decrypt straight into a preallocated buffer, older pycrypto returns a new string per call
+DECRYPT_INTO_BUFFER = getattr(Crypto, 'version_info', (0,))[:2] >= (3, 7)
+# Fastest first. hashlib runs all of PBKDF2 in C where pycrypto calls back into hmac_sha_256 on every iteration,
+# and cryptography decrypts with OpenSSL
+CRYPTO_BACKENDS = ['cryptography', 'hashlib', 'pycrypto']
 
 def hmac_sha_256(password, salt):
     return Crypto.Hash.HMAC.new(password, salt, Crypto.Hash.SHA256).digest()
 
-def derive_key(salt, password):
-    KEY_LENGTH = 16
-    COST_FACTOR = 5000
+def derive_key_pycrypto(salt, password):
     return Crypto.Protocol.KDF.PBKDF2(
         password=password.encode('utf-8'),
         salt=salt,
@@ -26,10 +52,81 @@ def derive_key(salt, password):
         count=COST_FACTOR,
         prf=hmac_sha_256)
 
+def derive_key_hashlib(salt, password):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, COST_FACTOR, KEY_LENGTH)
+
+class PyCryptoCipher(object):
+    def __init__(self, key, iv):
+        self._cipher = Crypto.Cipher.AES.new(key, Crypto.Cipher.AES.MODE_CBC, iv)
+
+    def encrypt(self, data):
+        return self._cipher.encrypt(data)
+
+    def decrypt(self, data):
+        return self._cipher.decrypt(data)
+
+    def decrypt_into(self, data, output):
+        if DECRYPT_INTO_BUFFER:
+            self._cipher.decrypt(data, output=output[:len(data)])
+        else:
+            output[:len(data)] = self._cipher.decrypt(data.tobytes())
+
+    def encrypt_into(self, data, output):
+        if DECRYPT_INTO_BUFFER:
+            self._cipher.encrypt(data, output=output[:len(data)])
+        else:
+            output[:len(data)] = self._cipher.encrypt(data.tobytes())
+
+class CryptographyCipher(object):
+    def __init__(self, key, iv):
+        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+        self._encryptor = cipher.encryptor()
+        self._decryptor = cipher.decryptor()
+
+    def encrypt(self, data):
+        return self._encryptor.update(data)
+
+    def decrypt(self, data):
+        return self._decryptor.update(data)
+
+    def decrypt_into(self, data, output):
+        self._decryptor.update_into(data, output)
+
+    def encrypt_into(self, data, output):
+        self._encryptor.update_into(data, output)
+
+def get_crypto_backends():
+    has_pbkdf2_hmac = hasattr(hashlib, 'pbkdf2_hmac')
+    available = {'cryptography': Cipher is not None and has_pbkdf2_hmac,
+                 'hashlib': Crypto is not None and has_pbkdf2_hmac,
+                 'pycrypto': Crypto is not None}
+    return [name for name in CRYPTO_BACKENDS if available[name]]
+
+def set_crypto_backend(name=None):
+    global crypto_backend, derive_key_function, cipher_class
+    backends = get_crypto_backends()
+    if not backends:
+        raise ImportError("decrypting needs pycrypto/pycryptodome or cryptography")
+    if name is None:
+        name = backends[0]
+    elif name not in backends:
+        raise ValueError("crypto backend {} is not available, choose from {}".format(name, ", ".join(backends)))
+    crypto_backend = name
+    derive_key_function = derive_key_pycrypto if name == 'pycrypto' else derive_key_hashlib
+    cipher_class = CryptographyCipher if name == 'cryptography' else PyCryptoCipher
+
+def derive_key(salt, password):
+    return derive_key_function(salt, password)
+
+def new_cipher(key, iv):
+    return cipher_class(key, iv)
+
+set_crypto_backend()
+
 def unpad_pkcs7(s):
     return s[:-ord(s[len(s)-1:])]
 
-def decrypt_name(ciphertext_name, password):
+def decrypt_name(ciphertext_name, password, quiet=False):
     if ciphertext_name.endswith(u".oenc"):
         # This is an unencrypted name (version 2)
         return ciphertext_name[:-5]
@@ -37,13 +134,15 @@ def decrypt_name(ciphertext_name, password):
     try:
         ciphertext_bytes = ciphertext_name.encode('ascii')
     except (UnicodeEncodeError, UnicodeDecodeError) as e:
-        print ciphertext_name + " is an invalid filename (may not be encrypted) with exception: {}".format(e)
+        if not quiet:
+            print(ciphertext_name + " is an invalid filename (may not be encrypted) with exception: {}".format(e))
         return INVALID_NAME
 
     try:
         decoded_name = base64.urlsafe_b64decode(ciphertext_bytes)
-    except (UnicodeDecodeError, TypeError) as e:
-       print ciphertext_name + " is an invalid filename (may not be encrypted) with exception: {}".format(e)
+    except (UnicodeDecodeError, TypeError, ValueError) as e:
+       if not quiet:
+           print(ciphertext_name + " is an invalid filename (may not be encrypted) with exception: {}".format(e))
        return INVALID_NAME
 
     version_number = decoded_name[:VERSION_LENGTH]
@@ -53,19 +152,21 @@ def decrypt_name(ciphertext_name, password):
         return INVALID_NAME
 
     salt = decoded_name[VERSION_LENGTH:VERSION_LENGTH + SALT_LENGTH]
-    iv = decoded_name[VERSION_LENGTH + SALT_LENGTH: VERSION_LENGTH + SALT_LENGTH + Crypto.Cipher.AES.block_size]
+    iv = decoded_name[VERSION_LENGTH + SALT_LENGTH: VERSION_LENGTH + SALT_LENGTH + AES_BLOCK_SIZE]
     key = derive_key(salt, password)
-    ciphertext = decoded_name[VERSION_LENGTH + SALT_LENGTH + Crypto.Cipher.AES.block_size:]
+    ciphertext = decoded_name[VERSION_LENGTH + SALT_LENGTH + AES_BLOCK_SIZE:]
 
     try:
-      cipher = Crypto.Cipher.AES.new(key, Crypto.Cipher.AES.MODE_CBC, iv)
+      cipher = new_cipher(key, iv)
       padded_plaintext = cipher.decrypt(ciphertext)
     except:
-      print("Error occurred with %s" % key)
-      padded_plaintext = ("ERROR-%s" % ciphertext)
+      if not quiet:
+          print("Error occurred with %s" % key)
+      padded_plaintext = b"ERROR-" + ciphertext
 
-    if not padded_plaintext.startswith('\0\0\0\0'):
-        print("Invalid Filename: {}".format(ciphertext_name))
+    if not padded_plaintext.startswith(b'\0\0\0\0'):
+        if not quiet:
+            print("Invalid Filename: {}".format(ciphertext_name))
         return INVALID_NAME
 
     prefixed_name = unpad_pkcs7(padded_plaintext).decode('utf-8')
@@ -76,10 +177,11 @@ def decrypt_name(ciphertext_name, password):
 def single_file(args,file_path):
     if (not os.path.isfile(file_path) and not os.path.isdir(file_path)):
         print("Error: File/Folder {} not found".format(file_path))
-        return
+        return False
     elif not file_path.endswith(('.cloud', '.cloudf')):
         decrypted_name = decrypt_name(os.path.basename(file_path),args.password) 
-        decrypt_and_rename(args,file_path,decrypted_name)
+        return decrypt_and_rename(args,file_path,decrypted_name)
+    return True
                 
 def decrypt_and_rename(args,encrypted_path,decrypted_name):
     if decrypted_name != INVALID_NAME:
@@ -91,23 +193,53 @@ def decrypt_and_rename(args,encrypted_path,decrypted_name):
                 else:
                     print("'" + encrypted_path + "' not renamed to '" + decrypted_name + "'")
             else:
-                if not os.path.isfile(os.path.join(os.path.dirname(encrypted_path), decrypted_name)):
-                    with open(encrypted_path, 'rb') as in_file, open(os.path.join(os.path.dirname(encrypted_path), decrypted_name), 'wb') as out_file:
-                        decrypt_file(in_file, out_file, args.password)
-                    print("Decrypted file written to {}".format(os.path.abspath(out_file.name)))
+                decrypted_path = os.path.join(os.path.dirname(encrypted_path), decrypted_name)
+                if not os.path.isfile(decrypted_path):
+                    # The decrypted file only gets its real name once the hash checks out
+                    partial_path = decrypted_path + PARTIAL_SUFFIX
+                    try:
+                        with open(encrypted_path, 'rb') as in_file, open(partial_path, 'wb') as out_file:
+                            verified = decrypt_file(in_file, out_file, args.password, args.buffersize * 1024 * 1024)
+                    except Exception as e:
+                        print("Error: Unable to decrypt {}: {}".format(encrypted_path, e))
+                        verified = False
+                    if not verified:
+                        reject_decrypted_file(args, encrypted_path, partial_path, decrypted_name)
+                        return False
+                    os.rename(partial_path, decrypted_path)
+                    print("Decrypted file written to {}".format(os.path.abspath(decrypted_path)))
         else:
           try:
             print((os.path.abspath(encrypted_path)[4:] if sys.platform.startswith('win32') else os.path.abspath(encrypted_path)) + args.delimiter + decrypted_name)
           except:
             print("Error occurred with printing %s" % encrypted_path)
+    return True
+
+def reject_decrypted_file(args, encrypted_path, partial_path, decrypted_name):
+    print("Error: Hash mismatch for {}".format(encrypted_path))
+    if not os.path.isfile(partial_path):
+        return
+    if args.quarantine:
+        if not os.path.isdir(args.quarantine):
+            os.makedirs(args.quarantine)
+        quarantine_path = os.path.join(args.quarantine, decrypted_name)
+        if os.path.exists(quarantine_path):
+            quarantine_path += "." + str(int(time.time()))
+        shutil.move(partial_path, quarantine_path)
+        print("Decrypted file quarantined to {}".format(os.path.abspath(quarantine_path)))
+    else:
+        os.remove(partial_path)
+        print("Decrypted file removed")
 
 def all_files(args, file_path):
+    failed = set()
     filesRemain = True    
     while filesRemain:
         filesRemain = False
         for root, dirs, files in os.walk(file_path):
             for f in files:
-                if not f.endswith(('.cloud', '.cloudf')):
+                # Files that failed verification have no decrypted copy, don't retry them on every pass
+                if not f.endswith(('.cloud', '.cloudf')) and os.path.join(root, f) not in failed:
                     decrypted_file_name = decrypt_name(f, args.password)
                     decrypted_file_path = os.path.join(root, decrypted_file_name)
                     if ((decrypted_file_name != INVALID_NAME and not os.path.isfile(decrypted_file_path)) 
@@ -115,7 +247,8 @@ def all_files(args, file_path):
                          or (args.filter is not None and args.filter in os.path.join(root, decrypted_file_name)))):
                         if not args.nameonly:
                             filesRemain = True
-                        decrypt_and_rename(args,os.path.join(root, f), decrypted_file_name)
+                        if not decrypt_and_rename(args,os.path.join(root, f), decrypted_file_name):
+                            failed.add(os.path.join(root, f))
             for d in dirs:
                 if not d.endswith('.xlarge'):
                     decrypted_folder_name = decrypt_name(d, args.password)
@@ -126,54 +259,382 @@ def all_files(args, file_path):
                         if not args.nameonly:
                             filesRemain = True
                         decrypt_and_rename(args,os.path.join(root, d), decrypted_folder_name)
+    return failed
 
-def decrypt_file(in_file, out_file, password):
-    calcHash = hashlib.sha256()
-    in_file.seek(0)
-    versionNumber = in_file.read(VERSION_LENGTH)
-    salt = in_file.read(SALT_LENGTH)      
-    iv = in_file.read(Crypto.Cipher.AES.block_size)
-    key = derive_key(salt, password)
-    cipher = Crypto.Cipher.AES.new(key, Crypto.Cipher.AES.MODE_CBC, iv)
-    next_chunk = ''
-    finished = False
-    fileHash = None
-    while not finished:
-        chunk, next_chunk = next_chunk, cipher.decrypt(in_file.read(4096 * Crypto.Cipher.AES.block_size))
-        if len(next_chunk) == 0:
-            chunk = unpad_pkcs7(chunk)
-            fileHash = chunk[-(calcHash.digest_size):]
-            chunk = chunk[:-(calcHash.digest_size)]
-            finished = True
-        out_file.write(chunk)
-        calcHash.update(chunk)
-
-    print("Original Hash:   {}".format("".join("{:02x}".format(ord(c)) for c in fileHash)))
-    print("Calculated Hash: {}".format(calcHash.hexdigest()))
+def get_encrypted_files(args, file_path):
+    if os.path.isfile(file_path):
+        yield file_path
+        return
+    for root, dirs, files in os.walk(file_path):
+        for f in files:
+            if not f.endswith(('.cloud', '.cloudf')):
+                yield os.path.join(root, f)
+        if not args.recursive:
+            break
+
+def verify_file(job):
+    # Runs in a worker process, so everything it needs comes in with the job
+    encrypted_path, password, buffer_size, path_filter, backend = job
+    set_crypto_backend(backend)
+    decrypted_name = decrypt_name(os.path.basename(encrypted_path), password)
+    if decrypted_name == INVALID_NAME:
+        return encrypted_path, decrypted_name, None
+    if path_filter is not None and path_filter not in os.path.join(os.path.dirname(encrypted_path), decrypted_name):
+        return encrypted_path, decrypted_name, None
+    try:
+        with open(encrypted_path, 'rb') as in_file, open(os.devnull, 'wb') as out_file:
+            return encrypted_path, decrypted_name, decrypt_file(in_file, out_file, password, buffer_size, verbose=False)
+    except Exception as e:
+        print("Error: Unable to decrypt {}: {}".format(encrypted_path, e))
+        return encrypted_path, decrypted_name, False
+
+def verify_all_files(args, file_path):
+    jobs = ((encrypted_path, args.password, args.buffersize * 1024 * 1024, args.filter, crypto_backend)
+            for encrypted_path in get_encrypted_files(args, file_path))
+    verified = 0
+    failed = []
+    pool = multiprocessing.Pool(max(1, args.workers))
+    try:
+        for encrypted_path, decrypted_name, result in pool.imap_unordered(verify_file, jobs):
+            if result is None:
+                continue
+            if result:
+                verified += 1
+            else:
+                failed.append(encrypted_path)
+                print("Failed: {} ({})".format(encrypted_path, decrypted_name))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    print("Verified {} files, {} failed".format(verified + len(failed), len(failed)))
+    return failed
+
+class NameIndex(object):
+    # Maps the encrypted paths under a folder to their plaintext paths. Decrypted names are cached by ciphertext name,
+    # which always decrypts to the same thing with the same password, and folders whose mtime hasn't changed aren't
+    # listed again. The index only holds a salted hash of a key derived from the password, to rebuild it when the
+    # password changes
+    PLACEHOLDER_EXTENSIONS = (u'.cloudf', u'.cloud')
+
+    def __init__(self, index_path):
+        self.connection = sqlite3.connect(index_path)
+        self.connection.executescript(u"""
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS names (ciphertext TEXT PRIMARY KEY, plaintext TEXT);
+            CREATE TABLE IF NOT EXISTS folders (encrypted_path TEXT PRIMARY KEY, mtime REAL);
+            CREATE TABLE IF NOT EXISTS paths (encrypted_path TEXT PRIMARY KEY, parent TEXT, plaintext_path TEXT,
+                                              name TEXT, is_folder INTEGER, encrypted INTEGER);
+            CREATE INDEX IF NOT EXISTS paths_parent ON paths (parent);
+            CREATE INDEX IF NOT EXISTS paths_name ON paths (name);
+        """)
+        self.names_decrypted = 0
+        self.folders_listed = 0
+
+    def close(self):
+        self.connection.close()
+
+    def get_root(self):
+        row = self.connection.execute(u"SELECT value FROM settings WHERE key = 'root'").fetchone()
+        return row[0] if row else None
+
+    def update(self, root, password):
+        stored_root = self.get_root()
+        if stored_root is not None and stored_root != root:
+            raise ValueError("index was built for {}".format(stored_root))
+        self.connection.execute(u"INSERT OR REPLACE INTO settings VALUES ('root', ?)", (root,))
+        password_check = self.connection.execute(u"SELECT value FROM settings WHERE key = 'password'").fetchone()
+        if password_check is None or not self._is_password(password_check[0], password):
+            if password_check is not None:
+                print("The index was built with a different password, rebuilding it")
+            self._reset(password)
+        # Paths are stored relative to the root, u'' is the root itself
+        folders = [(u'', u'')]
+        while folders:
+            encrypted_path, plaintext_path = folders.pop()
+            try:
+                mtime = os.stat(os.path.join(root, encrypted_path)).st_mtime
+            except OSError:
+                continue
+            row = self.connection.execute(u"SELECT mtime FROM folders WHERE encrypted_path = ?", (encrypted_path,)).fetchone()
+            if row and row[0] == mtime:
+                folders.extend(self.connection.execute(
+                    u"SELECT encrypted_path, plaintext_path FROM paths WHERE parent = ? AND is_folder = 1", (encrypted_path,)))
+                continue
+            folders.extend(self._update_folder(root, encrypted_path, plaintext_path, password))
+            self.connection.execute(u"INSERT OR REPLACE INTO folders VALUES (?, ?)", (encrypted_path, mtime))
+        self.connection.commit()
+
+    def _is_password(self, password_check, password):
+        salt, key_hash = password_check.split(u":")
+        return self._get_key_hash(binascii.unhexlify(salt), password) == key_hash
+
+    def _get_key_hash(self, salt, password):
+        return hashlib.sha256(derive_key(salt, password)).hexdigest()
+
+    def _reset(self, password):
+        for table in (u"names", u"folders", u"paths"):
+            self.connection.execute(u"DELETE FROM {}".format(table))
+        salt = os.urandom(SALT_LENGTH)
+        self.connection.execute(u"INSERT OR REPLACE INTO settings VALUES ('password', ?)",
+                                (binascii.hexlify(salt).decode('ascii') + u":" + self._get_key_hash(salt, password),))
+
+    def _update_folder(self, root, encrypted_path, plaintext_path, password):
+        self.folders_listed += 1
+        subfolders = []
+        known = set(row[0] for row in self.connection.execute(
+            u"SELECT encrypted_path FROM paths WHERE parent = ?", (encrypted_path,)))
+        for entry in os.listdir(os.path.join(root, encrypted_path)):
+            entry_path = os.path.join(encrypted_path, entry)
+            is_folder = os.path.isdir(os.path.join(root, entry_path))
+            plaintext_name = self._get_plaintext_name(entry, password)
+            encrypted = plaintext_name is not None
+            if not encrypted:
+                if not is_folder:
+                    continue
+                # Folders renamed by --renamefolder and xl folders can still hold encrypted names
+                plaintext_name = entry
+            entry_plaintext_path = os.path.join(plaintext_path, plaintext_name)
+            known.discard(entry_path)
+            # Placeholders are looked up by the name of the file they stand for
+            if not is_folder and plaintext_name.endswith(self.PLACEHOLDER_EXTENSIONS):
+                plaintext_name = os.path.splitext(plaintext_name)[0]
+            self.connection.execute(u"INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?, ?, ?)",
+                                    (entry_path, encrypted_path, entry_plaintext_path, plaintext_name,
+                                     int(is_folder), int(encrypted)))
+            if is_folder:
+                subfolders.append((entry_path, entry_plaintext_path))
+        for removed_path in known:
+            for table in (u"paths", u"folders"):
+                self.connection.execute(u"DELETE FROM {} WHERE encrypted_path = ? OR substr(encrypted_path, 1, ?) = ?".format(table),
+                                        (removed_path, len(removed_path) + 1, removed_path + os.sep))
+        return subfolders
+
+    def _get_plaintext_name(self, ciphertext_name, password):
+        row = self.connection.execute(u"SELECT plaintext FROM names WHERE ciphertext = ?", (ciphertext_name,)).fetchone()
+        if row:
+            return row[0]
+        name, extension = ciphertext_name, u''
+        for placeholder_extension in self.PLACEHOLDER_EXTENSIONS:
+            if ciphertext_name.endswith(placeholder_extension):
+                name, extension = ciphertext_name[:-len(placeholder_extension)], placeholder_extension
+                break
+        # Unencrypted names are expected here, eg. folders renamed by --renamefolder, so they are not reported
+        plaintext_name = decrypt_name(name, password, quiet=True)
+        self.names_decrypted += 1
+        plaintext_name = None if plaintext_name == INVALID_NAME else plaintext_name + extension
+        self.connection.execute(u"INSERT INTO names VALUES (?, ?)", (ciphertext_name, plaintext_name))
+        return plaintext_name
+
+    def lookup(self, name):
+        return self.connection.execute(
+            u"SELECT encrypted_path, plaintext_path FROM paths WHERE name = ? AND encrypted = 1 ORDER BY plaintext_path", (name,)).fetchall()
+
+    def search(self, pattern):
+        return self.connection.execute(
+            u"SELECT encrypted_path, plaintext_path FROM paths WHERE (name GLOB ? OR plaintext_path GLOB ?) AND encrypted = 1 "
+            u"ORDER BY plaintext_path", (pattern, pattern)).fetchall()
+
+    def count(self):
+        return self.connection.execute(u"SELECT count(*) FROM paths WHERE encrypted = 1").fetchone()[0]
+
+def index_names(args):
+    name_index = NameIndex(os.path.expanduser(args.index))
+    try:
+        if args.path:
+            root = get_unicode(os.path.abspath(os.path.expanduser(args.path)))
+            if sys.platform.startswith('win32'):
+                root = u"\\\\?\\" + root
+            start_time = time.time()
+            try:
+                name_index.update(root, args.password)
+            except ValueError as e:
+                print("Error: {}".format(e))
+                return False
+            print("Indexed {} names in {:.1f}s ({} folders listed, {} names decrypted)".format(
+                name_index.count(), time.time() - start_time, name_index.folders_listed, name_index.names_decrypted))
+        root = name_index.get_root()
+        matches = []
+        if args.lookup:
+            matches = name_index.lookup(get_unicode(args.lookup))
+        elif args.search:
+            matches = name_index.search(get_unicode(args.search))
+        for encrypted_path, plaintext_path in matches:
+            encrypted_path = os.path.join(root, encrypted_path)
+            try:
+                print((encrypted_path[4:] if sys.platform.startswith('win32') else encrypted_path) + args.delimiter + plaintext_path)
+            except:
+                print("Error occurred with printing %s" % encrypted_path)
+    finally:
+        name_index.close()
+    return True
+
+def get_unicode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+class HashMismatchError(ValueError):
+    def __init__(self, file_hash, calculated_hash):
+        super(HashMismatchError, self).__init__("Original hash {} does not match calculated hash {}".format(
+            binascii.hexlify(file_hash).decode('ascii'), binascii.hexlify(calculated_hash).decode('ascii')))
+        self.file_hash = file_hash
+        self.calculated_hash = calculated_hash
+
+class DecryptedChunks(object):
+    # Iterates over the plaintext of an encrypted file as it is decrypted. Chunks may be views of a buffer that is
+    # reused for the next one, so they have to be written or copied before moving on. The original hash is at the end
+    # of the file, so a mismatch raises HashMismatchError after the last chunk
+    def __init__(self, in_file, password, buffer_size=DEFAULT_BUFFER_SIZE_MB * 1024 * 1024):
+        self.in_file = in_file
+        self.password = password
+        self.buffer_size = buffer_size
+        self.file_hash = None
+        self.calculated_hash = None
+
+    def __iter__(self):
+        calcHash = hashlib.sha256()
+        self.in_file.seek(0)
+        versionNumber = self.in_file.read(VERSION_LENGTH)
+        salt = self.in_file.read(SALT_LENGTH)      
+        iv = self.in_file.read(AES_BLOCK_SIZE)
+        key = derive_key(salt, self.password)
+        cipher = new_cipher(key, iv)
+        block_size = AES_BLOCK_SIZE
+        # The plaintext ends with the SHA-256 of the file and then the padding, which fits in one block,
+        # so only that much has to be held back until the end of the file is found
+        holdback_size = block_size + calcHash.digest_size
+        buffer_size = max(self.buffer_size - self.buffer_size % block_size, block_size)
+        in_buffer = bytearray(buffer_size)
+        in_view = memoryview(in_buffer)
+        # One block of slack, OpenSSL wants room for a block more than it is given
+        out_buffer = bytearray(buffer_size + block_size)
+        out_view = memoryview(out_buffer)
+        tail = b''
+        carried = 0
+        while True:
+            bytes_read = self.in_file.readinto(in_view[carried:])
+            if not bytes_read:
+                break
+            bytes_read += carried
+            # Short reads are possible, anything past the last whole block waits for the next read
+            usable = bytes_read - bytes_read % block_size
+            cipher.decrypt_into(in_view[:usable], out_view)
+            carried = bytes_read - usable
+            in_buffer[:carried] = in_buffer[usable:bytes_read]
+            if usable >= holdback_size:
+                if tail:
+                    calcHash.update(tail)
+                    yield tail
+                calcHash.update(out_view[:usable - holdback_size])
+                yield out_view[:usable - holdback_size]
+                tail = out_view[usable - holdback_size:usable].tobytes()
+            else:
+                tail += out_view[:usable].tobytes()
+                if len(tail) > holdback_size:
+                    calcHash.update(tail[:-holdback_size])
+                    yield tail[:-holdback_size]
+                    tail = tail[-holdback_size:]
+
+        tail = unpad_pkcs7(tail)
+        fileHash = tail[-(calcHash.digest_size):]
+        tail = tail[:-(calcHash.digest_size)]
+        calcHash.update(tail)
+        if tail:
+            yield tail
+        self.file_hash = fileHash
+        self.calculated_hash = calcHash.digest()
+        if self.file_hash != self.calculated_hash:
+            raise HashMismatchError(self.file_hash, self.calculated_hash)
+
+def decrypt_file(in_file, out_file, password, buffer_size=DEFAULT_BUFFER_SIZE_MB * 1024 * 1024, verbose=True):
+    chunks = DecryptedChunks(in_file, password, buffer_size)
+    try:
+        for chunk in chunks:
+            out_file.write(chunk)
+    except HashMismatchError:
+        pass
+    if verbose:
+        print("Original Hash:   {}".format(binascii.hexlify(chunks.file_hash).decode('ascii')))
+        print("Calculated Hash: {}".format(binascii.hexlify(chunks.calculated_hash).decode('ascii')))
+    return chunks.file_hash == chunks.calculated_hash
+
+def stream_file(args, file_path):
+    if not os.path.isfile(file_path):
+        sys.stderr.write("Error: File {} not found\n".format(file_path))
+        return False
+    if sys.platform.startswith('win32'):
+        import msvcrt
+        msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+    # A binary file on the stdout descriptor takes the chunks as they are, python 2's sys.stdout can't write memoryviews
+    out_file = io.open(sys.stdout.fileno(), 'wb', closefd=False)
+    try:
+        with open(file_path, 'rb') as in_file:
+            for chunk in DecryptedChunks(in_file, args.password, args.buffersize * 1024 * 1024):
+                out_file.write(chunk)
+    except HashMismatchError as e:
+        sys.stderr.write("Error: Hash mismatch for {}: {}\n".format(file_path, e))
+        return False
+    except Exception as e:
+        # eg. padding that can't be removed (a wrong password or a truncated file), or a read or write error
+        sys.stderr.write("Error: Unable to decrypt {}: {}\n".format(file_path, e))
+        return False
+    finally:
+        out_file.close()
+    return True
 
 def get_arguments():
     parser = argparse.ArgumentParser()
-    parser.add_argument(u"--path", type=str, help=u"The file to decrypt or the folder to start from. **Will not decrypt placeholder files**", required=True)
-    parser.add_argument(u"--password", type=str, help=u"The passphrase", required=True)
+    parser.add_argument(u"--path", type=str, help=u"The file to decrypt or the folder to start from. **Will not decrypt placeholder files**", required=False)
+    parser.add_argument(u"--password", type=str, help=u"The passphrase", required=False)
     parser.add_argument(u"--nameonly", action="store_true", default=False, help=u"Print the decrypted name, only", required=False)
     parser.add_argument(u"--delimiter", type=str, default=";", help=u"Delimeter to use for --nameonly printed output. Default is ';'", required=False)
     parser.add_argument(u"--renamefolder", action="store_true", default=False, help=u"Rename if the target is a folder", required=False)
     parser.add_argument(u"--recursive", action="store_true", default=False, help=u"Recurse through given path", required=False)
+    parser.add_argument(u"--buffersize", type=int, default=DEFAULT_BUFFER_SIZE_MB, help=u"Size in MB of the read and decrypt buffers. Default is {}".format(DEFAULT_BUFFER_SIZE_MB), required=False)
+    parser.add_argument(u"--stdout", action="store_true", default=False, help=u"Write the decrypted contents of the file to stdout instead of next to it", required=False)
+    parser.add_argument(u"--verifyonly", action="store_true", default=False, help=u"Decrypt without writing anything and report files that fail hash verification", required=False)
+    parser.add_argument(u"--workers", type=int, default=multiprocessing.cpu_count(), help=u"Number of files to verify at once with --verifyonly. Default is the number of CPUs", required=False)
+    parser.add_argument(u"--quarantine", type=str, help=u"Move decrypted files that fail hash verification into this folder instead of deleting them", required=False)
+    parser.add_argument(u"--backend", type=str, choices=get_crypto_backends(), help=u"Crypto library to use. Default is the fastest available: {}".format(", ".join(get_crypto_backends())), required=False)
     parser.add_argument(u"--filter", type=str, help=u"Only process files/folders with this simple substring path filter (ex: 'xlarge')", required=False)
-    return parser.parse_args()
+    parser.add_argument(u"--index", type=str, help=u"Name index file to update for --path, and to query with --lookup or --search", required=False)
+    parser.add_argument(u"--lookup", type=str, help=u"Print the encrypted paths of files/folders with this decrypted name from --index", required=False)
+    parser.add_argument(u"--search", type=str, help=u"Print the encrypted paths whose decrypted name or path matches this glob from --index (ex: '*.jpg')", required=False)
+    args = parser.parse_args()
+    if args.path and not args.password:
+        parser.error(u"--password is required with --path")
+    if not args.path and not (args.index and (args.lookup or args.search)):
+        parser.error(u"--path and --password are required unless querying an --index")
+    return args
 
 def main():
     args = get_arguments()
+    set_crypto_backend(args.backend)
+    if args.index:
+        if not index_names(args):
+            sys.exit(1)
+        return
     file_path = os.path.expanduser(args.path)
     if sys.platform.startswith('win32'):
         file_path = u"\\\\?\\" + file_path
     if (not os.path.isfile(file_path) and not os.path.isdir(file_path)):
         print("Error: File/Folder {} not found".format(file_path))
-        return
-    if args.recursive:
-        all_files(args, file_path)
+        sys.exit(1)
+    if args.stdout:
+        failed = [] if stream_file(args, file_path) else [file_path]
+    elif args.verifyonly:
+        failed = verify_all_files(args, file_path)
+    elif args.recursive:
+        failed = all_files(args, file_path)
     else:
-        single_file(args, file_path)
+        failed = [] if single_file(args, file_path) else [file_path]
+    if failed:
+        if not (args.verifyonly or args.stdout):
+            print("{} file(s) failed hash verification".format(len(failed)))
+        sys.exit(1)
     
 if __name__ == "__main__":
     main()
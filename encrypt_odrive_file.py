@@ -0,0 +1,192 @@
+from __future__ import print_function
+import sys
+import argparse
+import base64
+import hashlib
+import multiprocessing
+import os
+import time
+
+import decrypt_odrive_file
+
+PLACEHOLDER_EXTENSIONS = ('.cloud', '.cloudf')
+NAME_PREFIX = b'\0\0\0\0'
+
+def pad_pkcs7(s):
+    padding = decrypt_odrive_file.AES_BLOCK_SIZE - len(s) % decrypt_odrive_file.AES_BLOCK_SIZE
+    return s + bytearray([padding] * padding)
+
+def new_header(password):
+    salt = os.urandom(decrypt_odrive_file.SALT_LENGTH)
+    iv = os.urandom(decrypt_odrive_file.AES_BLOCK_SIZE)
+    cipher = decrypt_odrive_file.new_cipher(decrypt_odrive_file.derive_key(salt, password), iv)
+    return decrypt_odrive_file.VALID_VERSIONS[-1] + salt + iv, cipher
+
+def encrypt_name(plaintext_name, password):
+    header, cipher = new_header(password)
+    ciphertext = cipher.encrypt(bytes(pad_pkcs7(NAME_PREFIX + plaintext_name.encode('utf-8'))))
+    return base64.urlsafe_b64encode(header + ciphertext).decode('ascii')
+
+def encrypt_file(in_file, out_file, password, buffer_size=decrypt_odrive_file.DEFAULT_BUFFER_SIZE_MB * 1024 * 1024):
+    block_size = decrypt_odrive_file.AES_BLOCK_SIZE
+    header, cipher = new_header(password)
+    out_file.write(header)
+    fileHash = hashlib.sha256()
+    buffer_size = max(buffer_size - buffer_size % block_size, block_size)
+    in_buffer = bytearray(buffer_size)
+    in_view = memoryview(in_buffer)
+    # One block of slack, OpenSSL wants room for a block more than it is given
+    out_buffer = bytearray(buffer_size + block_size)
+    out_view = memoryview(out_buffer)
+    carried = 0
+    while True:
+        bytes_read = in_file.readinto(in_view[carried:])
+        if not bytes_read:
+            break
+        fileHash.update(in_view[carried:carried + bytes_read])
+        bytes_read += carried
+        # Anything past the last whole block waits for the next read, or for the hash and padding at the end
+        usable = bytes_read - bytes_read % block_size
+        cipher.encrypt_into(in_view[:usable], out_view)
+        out_file.write(out_view[:usable])
+        carried = bytes_read - usable
+        in_buffer[:carried] = in_buffer[usable:bytes_read]
+    # The plaintext ends with its own SHA-256, then the padding
+    tail = pad_pkcs7(in_buffer[:carried] + fileHash.digest())
+    out_file.write(cipher.encrypt(bytes(tail)))
+    return fileHash.digest()
+
+def verify_encrypted_file(encrypted_path, plaintext_name, file_hash, password, buffer_size):
+    if decrypt_odrive_file.decrypt_name(os.path.basename(encrypted_path), password) != plaintext_name:
+        return "name does not decrypt to {}".format(plaintext_name)
+    with open(encrypted_path, 'rb') as in_file:
+        chunks = decrypt_odrive_file.DecryptedChunks(in_file, password, buffer_size)
+        try:
+            for chunk in chunks:
+                pass
+        except decrypt_odrive_file.HashMismatchError as e:
+            return str(e)
+    if chunks.calculated_hash != file_hash:
+        return "decrypted contents do not match"
+    return None
+
+def encrypt_name_job(job):
+    plaintext_name, password, backend = job
+    decrypt_odrive_file.set_crypto_backend(backend)
+    return encrypt_name(plaintext_name, password)
+
+def encrypt_file_job(job):
+    # Runs in a worker process, so everything it needs comes in with the job
+    file_path, encrypted_folder, password, buffer_size, verify, backend = job
+    decrypt_odrive_file.set_crypto_backend(backend)
+    plaintext_name = os.path.basename(file_path)
+    try:
+        encrypted_path = os.path.join(encrypted_folder, encrypt_name(plaintext_name, password))
+        partial_path = encrypted_path + decrypt_odrive_file.PARTIAL_SUFFIX
+        try:
+            with open(file_path, 'rb') as in_file, open(partial_path, 'wb') as out_file:
+                file_hash = encrypt_file(in_file, out_file, password, buffer_size)
+            os.rename(partial_path, encrypted_path)
+        finally:
+            if os.path.isfile(partial_path):
+                os.remove(partial_path)
+        if verify:
+            error = verify_encrypted_file(encrypted_path, plaintext_name, file_hash, password, buffer_size)
+            if error:
+                os.remove(encrypted_path)
+                return file_path, None, error
+    except Exception as e:
+        return file_path, None, str(e)
+    return file_path, encrypted_path, None
+
+def get_plaintext_tree(path):
+    # Folders come out parents first so they can be created in order
+    if os.path.isfile(path):
+        return [], [path]
+    folders = [path]
+    files = []
+    for root, dirs, names in os.walk(path):
+        folders.extend(os.path.join(root, d) for d in dirs)
+        files.extend(os.path.join(root, f) for f in names if not f.endswith(PLACEHOLDER_EXTENSIONS))
+    return folders, files
+
+def encrypt_tree(path, password, output_folder=None, workers=1, buffer_size=decrypt_odrive_file.DEFAULT_BUFFER_SIZE_MB * 1024 * 1024, verify=False):
+    path = os.path.abspath(path)
+    output_folder = output_folder or os.path.dirname(path)
+    folders, files = get_plaintext_tree(path)
+    backend = decrypt_odrive_file.crypto_backend
+    pool = multiprocessing.Pool(max(1, workers))
+    try:
+        encrypted_names = pool.map(encrypt_name_job, [(os.path.basename(folder), password, backend) for folder in folders])
+        encrypted_folders = {os.path.dirname(path): output_folder}
+        for folder, encrypted_name in zip(folders, encrypted_names):
+            encrypted_folders[folder] = os.path.join(encrypted_folders[os.path.dirname(folder)], encrypted_name)
+            os.mkdir(encrypted_folders[folder])
+        jobs = ((file_path, encrypted_folders[os.path.dirname(file_path)], password, buffer_size, verify, backend)
+                for file_path in files)
+        results = []
+        for file_path, encrypted_path, error in pool.imap_unordered(encrypt_file_job, jobs):
+            if error:
+                print("Error: Unable to encrypt {}: {}".format(file_path, error))
+            results.append((file_path, encrypted_path))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return encrypted_folders.get(path), results
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(size) < 1000 or unit == 'TB':
+            break
+        size /= 1000.0
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{} B'.format(int(size))
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(u"--path", type=str, help=u"The file or folder to encrypt", required=True)
+    parser.add_argument(u"--password", type=str, help=u"The passphrase", required=True)
+    parser.add_argument(u"--output", type=str, help=u"Folder to write the encrypted file or folder to. Default is next to the path", required=False)
+    parser.add_argument(u"--workers", type=int, default=multiprocessing.cpu_count(), help=u"Number of files to encrypt at once. Default is the number of CPUs", required=False)
+    parser.add_argument(u"--buffersize", type=int, default=decrypt_odrive_file.DEFAULT_BUFFER_SIZE_MB, help=u"Size in MB of the read and encrypt buffers. Default is {}".format(decrypt_odrive_file.DEFAULT_BUFFER_SIZE_MB), required=False)
+    parser.add_argument(u"--verify", action="store_true", default=False, help=u"Decrypt every file and name after encrypting it and remove any that don't match", required=False)
+    parser.add_argument(u"--backend", type=str, choices=decrypt_odrive_file.get_crypto_backends(), help=u"Crypto library to use. Default is the fastest available: {}".format(", ".join(decrypt_odrive_file.get_crypto_backends())), required=False)
+    return parser.parse_args()
+
+def main():
+    args = get_arguments()
+    decrypt_odrive_file.set_crypto_backend(args.backend)
+    file_path = decrypt_odrive_file.get_unicode(os.path.expanduser(args.path))
+    output_folder = args.output and decrypt_odrive_file.get_unicode(os.path.expanduser(args.output))
+    if sys.platform.startswith('win32'):
+        file_path = u"\\\\?\\" + os.path.abspath(file_path)
+        if output_folder:
+            output_folder = u"\\\\?\\" + os.path.abspath(output_folder)
+
+    if not os.path.isfile(file_path) and not os.path.isdir(file_path):
+        print("Error: File/Folder {} not found".format(file_path))
+        sys.exit(1)
+    if output_folder and not os.path.isdir(output_folder):
+        print("Error: Folder {} not found".format(output_folder))
+        sys.exit(1)
+    start_time = time.time()
+    encrypted_folder, results = encrypt_tree(file_path, args.password, output_folder, args.workers,
+                                             args.buffersize * 1024 * 1024, args.verify)
+    elapsed = time.time() - start_time
+    encrypted = [plaintext_path for plaintext_path, encrypted_path in results if encrypted_path]
+    total_size = sum(os.path.getsize(plaintext_path) for plaintext_path in encrypted)
+    if encrypted_folder:
+        print(file_path + " encrypted into " + encrypted_folder)
+    elif encrypted:
+        print(file_path + " encrypted to " + results[0][1])
+    print("{} files, {} in {:.1f}s ({}/s){}".format(len(encrypted), format_size(total_size), elapsed,
+                                                    format_size(total_size / elapsed if elapsed else 0),
+                                                    ", verified" if args.verify else ""))
+    if len(encrypted) != len(results):
+        print("{} file(s) failed".format(len(results) - len(encrypted)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
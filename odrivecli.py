@@ -14,6 +14,16 @@ import socket
 import sys
 import time
 import codecs
+import collections
+import cProfile
+import fnmatch
+import hashlib
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 if sys.version_info < (3, 0):
    sys.stdout = codecs.getwriter("utf-8")(sys.stdout)
@@ -33,6 +43,7 @@ IS_WINDOWS = platform.system() == "Windows"
 IS_MAC = platform.system() == "Darwin"
 IS_LINUX = platform.system() == "Linux"
 MAX_LINE_LENGTH = 80
+UTILITIES_DATA_FOLDER_NAME = '.odrive-utilities'
 LINE_CLEAR_CONTROL_CODE = ' ' * (MAX_LINE_LENGTH - 1) + '\r' if IS_WINDOWS else '\x1b[2K'
 
 if IS_WINDOWS:
@@ -83,25 +94,153 @@ if IS_WINDOWS:
     )
 
 
+class CommandProfile(object):
+    # Timings of each phase of the commands sent to odrive, collected when --profile or --profile-json is given
+    PROFILE_ARGUMENT_HELP = "print p50/p95/p99 timings of each phase (connect, send, first response, response, output, " \
+                            "total, and walk and pass for recursive sync) per command to stderr when done"
+    PROFILE_ARGUMENT_NAME = "profile"
+    PROFILE_JSON_ARGUMENT_HELP = "write the same timings, with histogram buckets, to this JSON file"
+    PROFILE_JSON_ARGUMENT_NAME = "profile-json"
+    CPROFILE_ARGUMENT_HELP = "run under cProfile and save the stats to this file, eg. for python -m pstats FILE"
+    CPROFILE_ARGUMENT_NAME = "cprofile"
+    _PERCENTILES = (50, 95, 99)
+    _BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self):
+        self.enabled = False
+        self.timings = {}
+
+    def record(self, commandName, phase, seconds):
+        if self.enabled:
+            self.timings.setdefault(commandName, {}).setdefault(phase, []).append(seconds * 1000)
+
+    def get_summary(self):
+        summary = {}
+        for commandName, phases in self.timings.items():
+            for phase, timings in phases.items():
+                timings = sorted(timings)
+                phaseSummary = {'count': len(timings), 'max': timings[-1], 'total': sum(timings)}
+                for percentile in CommandProfile._PERCENTILES:
+                    # Nearest rank, so every value reported is one that was measured
+                    rank = max(int(-(-percentile * len(timings) // 100)), 1)
+                    phaseSummary['p{}'.format(percentile)] = timings[rank - 1]
+                buckets = []
+                for bucket in CommandProfile._BUCKETS_MS:
+                    buckets.append([bucket, len([timing for timing in timings if timing <= bucket])])
+                buckets.append([None, len(timings)])
+                phaseSummary['buckets'] = buckets
+                summary.setdefault(commandName, {})[phase] = phaseSummary
+        return summary
+
+    def print_summary(self):
+        summary = self.get_summary()
+        if not summary:
+            output_message(u'No commands were timed\n', stderr=True)
+            return
+        output_message(u'{:<18} {:<15} {:>7} {:>9} {:>9} {:>9} {:>9}\n'.format(
+            u'command', u'phase (ms)', u'count', u'p50', u'p95', u'p99', u'max'), stderr=True)
+        for commandName in sorted(summary):
+            for phase in sorted(summary[commandName], key=lambda phase: -summary[commandName][phase]['total']):
+                phaseSummary = summary[commandName][phase]
+                output_message(u'{:<18} {:<15} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}\n'.format(
+                    commandName, phase, phaseSummary['count'], phaseSummary['p50'], phaseSummary['p95'],
+                    phaseSummary['p99'], phaseSummary['max']), stderr=True)
+
+    def save_summary(self, path):
+        # Bucket counts are cumulative: timings at or under each bound in ms, the last bound (null) counts everything
+        try:
+            with open(path, 'w') as f:
+                f.write(json.dumps(self.get_summary(), indent=2, sort_keys=True))
+        except Exception as e:
+            output_message(u'Unable to write profile to {}: {}\n'.format(path, e), stderr=True)
+
+
+PROFILE = CommandProfile()
+
+
+class CommandPool(object):
+    # Runs commands on a bounded number of threads. The agent answers one request per connection, so this is how to
+    # have several requests in flight at once. More can be submitted while the results are being read
+    _POLL_INTERVAL = 0.5
+
+    def __init__(self, workers):
+        self._workers = max(1, workers)
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._threads = []
+        self._pending = 0
+
+    def submit(self, function, *args):
+        self._pending += 1
+        self._tasks.put((function, args))
+        if len(self._threads) < self._workers:
+            thread = threading.Thread(target=self._work)
+            # Daemon threads so that an interrupt doesn't wait on requests in flight
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def results(self):
+        # Yields (args, result, exception) as each function finishes, in no particular order
+        while self._pending:
+            try:
+                # A timeout keeps the wait interruptible on Python 2
+                result = self._results.get(timeout=CommandPool._POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            self._pending -= 1
+            yield result
+        self.close()
+
+    def close(self):
+        # Idle threads are joined. Busy ones (after an interrupt) are left to finish, they are daemon threads
+        threads, self._threads = self._threads, []
+        for _ in threads:
+            self._tasks.put(None)
+        if not self._pending:
+            for thread in threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            function, args = task
+            try:
+                self._results.put((args, function(*args), None))
+            except Exception as e:
+                self._results.put((args, None, e))
+
+
 class OdriveCommand(object):
     def __init__(self, agentPort, desktopPort):
         self._agentPort = agentPort
         self._desktopPort = desktopPort
 
     def execute(self):
+        startTime = time.time()
         sock = self._get_socket(self._agentPort) or self._get_socket(self._desktopPort)
+        self._record_timing('connect', time.time() - startTime)
         if sock:
             try:
                 commandData = self._get_command_data()
+                sendTime = time.time()
                 sock.sendall((json.dumps(commandData) + '\n').encode('utf-8'))
+                self._record_timing('send', time.time() - sendTime)
                 return True
             except Exception as e:
                 print(e)
                 return False
             finally:
                 sock.close()
+                self._record_timing('total', time.time() - startTime)
         return False
 
+    def _record_timing(self, phase, seconds):
+        # By class rather than command data, FolderSyncRule validates (and reports) when its data is built
+        PROFILE.record(getattr(self, 'COMMAND_NAME', type(self).__name__), phase, seconds)
+
     def _get_socket(self, port):
         if port:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -135,33 +274,52 @@ class OdriveSynchronousCommand(OdriveCommand):
         super(OdriveSynchronousCommand, self).__init__(agentPort=agentPort, desktopPort=desktopPort)
 
     def execute(self):
+        startTime = time.time()
         sock = self._get_socket(self._agentPort) or self._get_socket(self._desktopPort)
+        self._record_timing('connect', time.time() - startTime)
         if sock:
 
             def exit_function():
                 sock.close()
                 sys.exit(0)
 
-            signal.signal(signal.SIGINT, lambda signum, frame: exit_function())
-            signal.signal(signal.SIGTERM, lambda signum, frame: exit_function())
+            try:
+                signal.signal(signal.SIGINT, lambda signum, frame: exit_function())
+                signal.signal(signal.SIGTERM, lambda signum, frame: exit_function())
+            except ValueError:
+                # Only the main thread can set signal handlers, commands run from a CommandPool leave them alone
+                pass
 
             try:
+                sendTime = time.time()
                 sock.sendall((json.dumps(self._get_command_data()) + '\n').encode('utf-8'))
+                responseTime = time.time()
+                self._record_timing('send', responseTime - sendTime)
                 receivedStatusMessage = False
+                receivedResponse = False
                 lastMessageType = None
+                outputSeconds = 0
                 for messageType, message in self._read_responses(sock):
+                    if not receivedResponse:
+                        self._record_timing('first response', time.time() - responseTime)
+                        receivedResponse = True
+                    outputTime = time.time()
                     self._print_response(messageType, message)
+                    outputSeconds += time.time() - outputTime
                     if messageType == OdriveSynchronousCommand._STATUS_MESSAGE:
                         receivedStatusMessage = True
                     lastMessageType = messageType
 
                 self._print_final_response(lastMessageType, receivedStatusMessage)
+                self._record_timing('response', time.time() - responseTime)
+                self._record_timing('output', outputSeconds)
                 return True
             except Exception as e:
                 print(e)
                 return False
             finally:
                 sock.close()
+                self._record_timing('total', time.time() - startTime)
         return False
 
     def _read_responses(self, sock):
@@ -255,7 +413,9 @@ class Stream(OdriveCommand):
         }
 
     def execute(self):
+        startTime = time.time()
         sock = self._get_socket(self._agentPort) or self._get_socket(self._desktopPort)
+        self._record_timing('connect', time.time() - startTime)
         if sock:
 
             def exit_function():
@@ -266,7 +426,11 @@ class Stream(OdriveCommand):
             signal.signal(signal.SIGTERM, lambda signum, frame: exit_function())
 
             try:
+                sendTime = time.time()
                 sock.sendall((json.dumps(self._get_command_data()) + '\n').encode('utf-8'))
+                responseTime = time.time()
+                self._record_timing('send', responseTime - sendTime)
+                receivedResponse = False
 
                 if sys.version_info < (3,):
                     if IS_WINDOWS:
@@ -279,14 +443,19 @@ class Stream(OdriveCommand):
                 while True:
                     data = sock.recv(Stream._STREAMING_CHUNK_SIZE)
                     if data:
+                        if not receivedResponse:
+                            self._record_timing('first response', time.time() - responseTime)
+                            receivedResponse = True
                         outputStream.write(data)
                         outputStream.flush()
                     else:
+                        self._record_timing('response', time.time() - responseTime)
                         return True
             except Exception as e:
                 return False
             finally:
                 sock.close()
+                self._record_timing('total', time.time() - startTime)
         return False
 
 
@@ -443,11 +612,23 @@ class FolderSyncRule(OdriveCommand):
     EXPAND_SUBFOLDERS_ARGUMENT_NAME = 'expandsubfolders'
     EXPAND_SUBFOLDERS_ARGUMENT_HELP = 'Apply this rule to files and folders underneath the specified folder.'
 
-    def __init__(self, agentPort, desktopPort, path, threshold, expandSubfolders):
+    def __init__(self, agentPort, desktopPort, path, threshold, expandSubfolders, record=False):
         super(FolderSyncRule, self).__init__(agentPort=agentPort, desktopPort=desktopPort)
         self._path = path
         self._threshold = threshold
         self._expandSubfolders = expandSubfolders
+        # Whether to add the rule to the ones foldersyncrule --from compares against once it is sent
+        self._record = record
+        self._valid = False
+
+    def execute(self):
+        if not super(FolderSyncRule, self).execute():
+            return False
+        if self._record and self._valid:
+            FolderSyncRules(agentPort=self._agentPort, desktopPort=self._desktopPort, rulesPath=None).record(
+                os.path.abspath(expand_user(make_unicode(self._path))),
+                [unicode(self._threshold), bool(self._expandSubfolders)])
+        return True
 
     def _get_command_data(self):
         newFolderPath = make_unicode(self._path)
@@ -460,6 +641,7 @@ class FolderSyncRule(OdriveCommand):
         if not (unicode(self._threshold).isnumeric() or self._threshold == 'inf'):
             output_message('{}\n'.format(u"Invalid threshold specified"))
             return True
+        self._valid = True
         return {
             'command': FolderSyncRule.COMMAND_NAME,
             'parameters': {
@@ -469,6 +651,127 @@ class FolderSyncRule(OdriveCommand):
             }
         }
 
+class FolderSyncRules(object):
+    FROM_ARGUMENT_HELP = "send the rules in this file instead, one JSON object per line with path, threshold and " \
+                         "optionally expandsubfolders. Rules that are the same as when they were last sent from here " \
+                         "are skipped. odrive does not confirm rules, use --force to send one it may have missed again"
+    FROM_ARGUMENT_NAME = "from"
+    FORCE_ARGUMENT_HELP = "send every rule from the file, even the ones that are the same as when they were last sent " \
+                          "(used with --from)"
+    FORCE_ARGUMENT_NAME = "force"
+    WORKERS_ARGUMENT_HELP = "number of rules sent at once (used with --from, default 4)"
+    WORKERS_ARGUMENT_NAME = "workers"
+    DEFAULT_WORKERS = 4
+    _SENT_FILE_NAME = 'folder_sync_rules.json'
+
+    def __init__(self, agentPort, desktopPort, rulesPath, force=False, workers=DEFAULT_WORKERS):
+        self.agentPort = agentPort
+        self.desktopPort = desktopPort
+        self.rulesPath = rulesPath
+        self.force = force
+        self.workers = workers
+
+    def execute(self):
+        startTime = time.time()
+        rules, invalid = self._read_rules()
+        if rules is None:
+            return True
+        # odrive can't be asked for its rules and does not answer when one is set, so the diff is against what was last
+        # sent from here. A rule odrive ignored is only sent again with --force
+        lastSent = self._load_sent()
+        changed = [(path, rule) for path, rule in sorted(rules.items()) if self.force or lastSent.get(path) != rule]
+        sent = 0
+        failed = 0
+        pool = CommandPool(self.workers)
+        try:
+            for path, rule in changed:
+                pool.submit(self._send_rule, path, rule)
+            for (path, rule), success, error in pool.results():
+                if success:
+                    lastSent[path] = rule
+                    sent += 1
+                else:
+                    failed += 1
+                    output_message(u'Unable to send the rule for {}: {}\n'.format(path, error or ERROR_SENDING_COMMAND),
+                                   stderr=True)
+        finally:
+            pool.close()
+            self._save_sent(lastSent)
+        output_message(u'Sent {} rules, skipped {} unchanged{}{} in {:.1f}s\n'.format(
+            sent, len(rules) - len(changed),
+            u', {} failed'.format(failed) if failed else u'',
+            u', {} invalid'.format(invalid) if invalid else u'',
+            time.time() - startTime))
+        if failed or invalid:
+            sys.exit(1)
+        return True
+
+    def _read_rules(self):
+        # Returns {path: [threshold, expandSubfolders]}, later lines win, and the number of invalid lines
+        rules = {}
+        invalid = 0
+        try:
+            with open(get_os_encoded_path(self.rulesPath), 'rb') as f:
+                lines = f.read().decode('utf-8').splitlines()
+        except Exception as e:
+            output_message(u'Unable to read {}: {}\n'.format(self.rulesPath, e), stderr=True)
+            return None, 0
+        for lineNumber, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                rule = json.loads(line)
+                path = os.path.abspath(expand_user(make_unicode(rule[FolderSyncRule.LOCAL_PATH_ARGUMENT_NAME])))
+                threshold = unicode(rule[FolderSyncRule.THRESHOLD_ARGUMENT_NAME])
+                expandSubfolders = bool(rule.get(FolderSyncRule.EXPAND_SUBFOLDERS_ARGUMENT_NAME, False))
+            except Exception as e:
+                invalid += 1
+                output_message(u'Invalid rule on line {} of {}: {}\n'.format(lineNumber, self.rulesPath, line), stderr=True)
+                continue
+            # The same checks FolderSyncRule makes, so that a bad rule is reported rather than sent
+            if not os.path.isdir(get_os_encoded_path(path)):
+                invalid += 1
+                output_message(u'{} is not a folder (line {})\n'.format(path, lineNumber), stderr=True)
+            elif not (threshold.isnumeric() or threshold == 'inf'):
+                invalid += 1
+                output_message(u'Invalid threshold {} for {} (line {})\n'.format(threshold, path, lineNumber), stderr=True)
+            else:
+                rules[path] = [threshold, expandSubfolders]
+        return rules, invalid
+
+    def record(self, path, rule):
+        # For a rule sent on its own, so that the next --from run knows about it
+        lastSent = self._load_sent()
+        lastSent[path] = rule
+        self._save_sent(lastSent)
+
+    def _send_rule(self, path, rule):
+        threshold, expandSubfolders = rule
+        return FolderSyncRule(agentPort=self.agentPort, desktopPort=self.desktopPort, path=path,
+                              threshold=threshold, expandSubfolders=expandSubfolders).execute()
+
+    def _get_sent_path(self):
+        return os.path.join(expand_user('~'), UTILITIES_DATA_FOLDER_NAME, FolderSyncRules._SENT_FILE_NAME)
+
+    def _load_sent(self):
+        try:
+            with open(self._get_sent_path(), 'r') as f:
+                return json.loads(f.read())
+        except Exception as e:
+            return {}
+
+    def _save_sent(self, lastSent):
+        sentPath = self._get_sent_path()
+        try:
+            if not os.path.isdir(os.path.dirname(sentPath)):
+                os.makedirs(os.path.dirname(sentPath))
+            with open(sentPath, 'w') as f:
+                f.write(json.dumps(lastSent))
+        except Exception as e:
+            pass
+
+
 class EncPassphrase(OdriveSynchronousCommand):
     COMMAND_NAME = 'encpassphrase'
     HELP = "specify a passphrase for Encryptor folders"
@@ -660,47 +963,105 @@ class SyncAsynchronous(OdriveCommand):
 class RecursiveSync(object):
     COMMAND_NAME = "recursive"
     HELP = "recursively sync"
+    PROFILE_NAME = "sync --recursive"
     NO_DOWNLOAD_ARGUMENT_HELP = "do not download (used with --recursive)"
     NO_DOWNLOAD_ARGUMENT_NAME = "nodownload"
+    ORDER_ARGUMENT_HELP = "order in which placeholders are synced on each pass (used with --recursive): " \
+                          "name (default), folders (expand all folders before downloading any file, unless a pass " \
+                          "expands none of them) or newest (by the remote modification time on the placeholder)"
+    ORDER_ARGUMENT_NAME = "order"
+    ORDER_ARGUMENT_VALUES = ['name', 'folders', 'newest']
+    PRIORITY_ARGUMENT_HELP = "sync placeholders matching this glob first, eg. '*.pdf' or 'Projects/*'. " \
+                             "Can be given multiple times, earlier patterns win (used with --recursive)"
+    PRIORITY_ARGUMENT_NAME = "priority"
+    MAX_BYTES_ARGUMENT_HELP = "request no more downloads for the rest of the run once the files downloaded so far " \
+                              "add up to this many bytes. Folders are still expanded. A file's size is only known " \
+                              "once it has downloaded, so the files still downloading when the limit is reached can " \
+                              "take the total past it (used with --recursive)"
+    MAX_BYTES_ARGUMENT_NAME = "max-bytes"
+    MAX_INFLIGHT_ARGUMENT_HELP = "before requesting each download, wait while the agent has this many downloads in " \
+                                 "progress. Unlike --max-bytes and --max-files this pauses the sync rather than " \
+                                 "ending its downloads (used with --recursive)"
+    MAX_INFLIGHT_ARGUMENT_NAME = "max-inflight"
+    MAX_FILES_ARGUMENT_HELP = "request no more downloads for the rest of the run once this many files have been " \
+                              "requested. Folders are still expanded (used with --recursive)"
+    MAX_FILES_ARGUMENT_NAME = "max-files"
+    PLAN_ARGUMENT_HELP = "only count the placeholders a recursive sync would request, without syncing anything. " \
+                         "With --resume, estimate how long it would take from the downloads in the journal " \
+                         "(used with --recursive)"
+    PLAN_ARGUMENT_NAME = "plan"
+    RESUME_ARGUMENT_HELP = "append synced and failed placeholders to this journal file and, when restarting, skip " \
+                           "the folders it records as complete and the placeholders that keep failing. Once it " \
+                           "records the whole sync as complete, the next run starts over (used with --recursive)"
+    RESUME_ARGUMENT_NAME = "resume"
     # Hidden argument to send commands to the sync engine asynchronously (experimental)
     NO_WAIT_ARGUMENT_NAME = 'nowait'
+    _FOLDER_PLACEHOLDER_EXTENSIONS = (u'.cloudf', u'.cloudf-dev')
+    _FILE_PLACEHOLDER_EXTENSIONS = (u'.cloud', u'.cloud-dev')
+    _BUDGET_POLL_INTERVAL = 1
+    _PLAN_MAX_ROWS = 20
 
-    def __init__(self, agentPort, desktopPort, folderPath, noDownload, noWait=False):
+    def __init__(self, agentPort, desktopPort, folderPath, noDownload, noWait=False, order='name', priority=None,
+                 maxBytes=None, maxInflight=None, maxFiles=None, plan=False, journalPath=None):
         self.agentPort = agentPort
         self.desktopPort = desktopPort
         self.folderPath = folderPath
         self.noDownload = noDownload
         # Set async or sync
         self.noWait = noWait
+        self.order = order
+        self.priority = priority or []
+        self.maxBytes = maxBytes
+        self.maxInflight = maxInflight
+        self.maxFiles = maxFiles
+        self.plan = plan
+        self.journal = RecursiveSyncJournal(journalPath, noDownload) if journalPath else None
+        self._journalSkipped = 0
+        # With the 'folders' order, until a pass of folders only expands none of them
+        self._holdFiles = True
+        self._requestedPaths = set()
+        self._countedPaths = set()
+        self._requestedBytes = 0
 
     def execute(self):
-        newFolderPath = make_unicode(self.folderPath)
+        # Unprefixed the same way as the folders found by the walk, which the journal records
+        newFolderPath = get_unprefixed_path(self.folderPath)
         if not os.path.exists(get_os_encoded_path(newFolderPath)):
             output_message('{}\n'.format(newFolderPath + u" doesn't exist!"))
             return True
+        if self.journal:
+            try:
+                self.journal.open(readOnly=self.plan)
+            except Exception as e:
+                output_message(u'Unable to open journal {}: {}\n'.format(self.journal.journalPath, e), stderr=True)
+                return True
+            if newFolderPath in self.journal.completedFolders:
+                # Placeholders may have come back since, eg. from an unsync, so nothing the journal recorded is skipped
+                output_message(u'{} records a finished sync of {}, {}\n'.format(
+                    self.journal.journalPath, newFolderPath, u'a sync would start over' if self.plan else u'starting over'))
+                self.journal.restart(newFolderPath)
+            try:
+                return self._execute(newFolderPath)
+            finally:
+                self.journal.close()
+        return self._execute(newFolderPath)
+
+    def _execute(self, newFolderPath):
+        if self.plan:
+            return self._print_plan(newFolderPath)
         itemsRemain = 1
-        if newFolderPath.endswith((u'.cloud', u'.cloudf', u'.cloud-dev', u'.cloudf-dev')):
-            if self.noWait:
-                output_message(u'Syncing {}\n'.format(newFolderPath))
-                command = SyncAsynchronous(agentPort=self.agentPort,
-                               desktopPort=self.desktopPort,
-                               placeholderPath=newFolderPath)
-            else:
-                command = Sync(agentPort=self.agentPort,
-                            desktopPort=self.desktopPort,
-                            placeholderPath=newFolderPath)
-            if newFolderPath.endswith((u'.cloudf', u'.cloudf-dev')):
+        if newFolderPath.endswith(RecursiveSync._FOLDER_PLACEHOLDER_EXTENSIONS +
+                                  RecursiveSync._FILE_PLACEHOLDER_EXTENSIONS):
+            self._sync_placeholder(newFolderPath)
+            if newFolderPath.endswith(RecursiveSync._FOLDER_PLACEHOLDER_EXTENSIONS):
                 newFolderPath = os.path.splitext(newFolderPath)[0]
             else:
                 itemsRemain = 0
-            success = command.execute()
-            if not success:
-                output_message('{}\n'.format(ERROR_SENDING_COMMAND))
-                sys.exit(1)
         lastFilesRemain = 0
         lastPath = u''
         retries = 0
         newPath = None
+        overBudget = 0
         if self.noWait:
             # Need a slight delay because of the async comm
             time.sleep(1)
@@ -708,31 +1069,27 @@ class RecursiveSync(object):
             if self.noWait:
                 # Need a slight delay because of the async comm
                 time.sleep(1)
-            itemsRemain = 0
-            for root, dirs, files in os.walk(get_os_encoded_path(newFolderPath)):
-                root = make_unicode(root)
-                for f in sorted(files):  # Sort so that we always traverse the same way
-                    newPath = None
-                    f = make_unicode(f)
-                    if f.endswith((u'.cloudf', u'.cloudf-dev')) or (f.endswith((u'.cloud', u'.cloud-dev')) and not self.noDownload):
-                        itemsRemain += 1
-                        if sys.platform.startswith('win32'):
-                            newPath = os.path.join(root, f)[4:]  # odrive does its own prefixing, so remove it if on Win
-                        else:
-                            newPath = os.path.join(root, f)
-                        if self.noWait:
-                            output_message(u'Syncing {}\n'.format(newPath))
-                            command = SyncAsynchronous(agentPort=self.agentPort,
-                                                         desktopPort=self.desktopPort,
-                                                         placeholderPath=newPath)
-                        else:
-                            command = Sync(agentPort=self.agentPort,
-                                           desktopPort=self.desktopPort,
-                                           placeholderPath=newPath)
-                        success = command.execute()
-                        if not success:
-                            output_message('{}\n'.format(ERROR_SENDING_COMMAND))
-                            sys.exit(1)
+            newPath = None
+            overBudget = 0
+            passStartTime = time.time()
+            placeholders = self._get_placeholders(newFolderPath)
+            PROFILE.record(RecursiveSync.PROFILE_NAME, 'walk', time.time() - passStartTime)
+            orderedPlaceholders = self._order_placeholders(newFolderPath, placeholders)
+            for placeholderPath in orderedPlaceholders:
+                if placeholderPath.endswith(RecursiveSync._FILE_PLACEHOLDER_EXTENSIONS) and \
+                        not self._wait_for_download_budget(placeholderPath):
+                    overBudget += 1
+                    continue
+                newPath = placeholderPath
+                self._sync_placeholder(newPath)
+            PROFILE.record(RecursiveSync.PROFILE_NAME, 'pass', time.time() - passStartTime)
+            if len(orderedPlaceholders) < len(placeholders) and \
+                    all(os.path.exists(get_os_encoded_path(p)) for p in orderedPlaceholders):
+                # The folders held the files back without any of them expanding, so the files get their turn rather
+                # than the same folders being retried until the sync gives up
+                self._holdFiles = False
+            # Placeholders left out by the download budget no longer count as remaining work
+            itemsRemain = len(placeholders) - overBudget
             if lastFilesRemain == itemsRemain and newPath and lastPath == newPath:
                 # If we have the same number of unsynced items as we did on the last pass
                 # and the final item attempted was the same as before, then we did not make any progress
@@ -745,9 +1102,280 @@ class RecursiveSync(object):
                 retries = 0
             lastPath = newPath
             lastFilesRemain = itemsRemain
+        if overBudget:
+            output_message(u'Download budget reached after {} files ({} downloaded). {} placeholders not downloaded\n'.format(
+                len(self._requestedPaths), format_size(self._get_requested_bytes()), overBudget))
+        if self._journalSkipped:
+            output_message(u'Skipped {} placeholders that failed {} times according to {}\n'.format(
+                self._journalSkipped, RecursiveSyncJournal.MAX_FAILURES, self.journal.journalPath))
         output_message(u'Done with recursive sync of {}\n'.format(newFolderPath))
         return True
 
+    def _sync_placeholder(self, placeholderPath):
+        if self.noWait:
+            output_message(u'Syncing {}\n'.format(placeholderPath))
+            command = SyncAsynchronous(agentPort=self.agentPort,
+                                       desktopPort=self.desktopPort,
+                                       placeholderPath=placeholderPath)
+        else:
+            command = Sync(agentPort=self.agentPort,
+                           desktopPort=self.desktopPort,
+                           placeholderPath=placeholderPath)
+        startTime = time.time()
+        success = command.execute()
+        if not success:
+            output_message('{}\n'.format(ERROR_SENDING_COMMAND))
+            sys.exit(1)
+        if self.journal and not self.noWait:
+            # The agent reports sync errors as messages rather than failing the command, so check the placeholder
+            if os.path.exists(get_os_encoded_path(placeholderPath)):
+                self.journal.record(RecursiveSyncJournal.FAILED, placeholderPath)
+                return
+            download = None
+            downloadedPath = get_os_encoded_path(os.path.splitext(placeholderPath)[0])
+            if placeholderPath.endswith(RecursiveSync._FILE_PLACEHOLDER_EXTENSIONS) and os.path.isfile(downloadedPath):
+                # Synchronous syncs return once the download is done, so time them for --plan estimates
+                download = {'bytes': os.path.getsize(downloadedPath), 'seconds': round(time.time() - startTime, 3)}
+            self.journal.record(RecursiveSyncJournal.SYNCED, placeholderPath, download)
+
+    def _wait_for_download_budget(self, placeholderPath):
+        if placeholderPath in self._requestedPaths:
+            # With --nowait a download still in progress is requested again on every pass, it only counts once
+            return True
+        if self.maxFiles is not None and len(self._requestedPaths) >= self.maxFiles:
+            return False
+        if self.maxBytes is not None and self._get_requested_bytes() >= self.maxBytes:
+            return False
+        if self.maxInflight is not None:
+            paused = False
+            while True:
+                downloads = self._get_inflight_downloads()
+                if len(downloads) < self.maxInflight:
+                    break
+                if not paused:
+                    output_message(u'Pausing, {} downloads in progress\n'.format(len(downloads)))
+                    paused = True
+                time.sleep(RecursiveSync._BUDGET_POLL_INTERVAL)
+        self._requestedPaths.add(placeholderPath)
+        return True
+
+    def _get_requested_bytes(self):
+        # Placeholders are empty, the size of a download is only known once the file has arrived
+        for placeholderPath in self._requestedPaths - self._countedPaths:
+            downloadedPath = get_os_encoded_path(os.path.splitext(placeholderPath)[0])
+            if os.path.isfile(downloadedPath):
+                self._requestedBytes += os.path.getsize(downloadedPath)
+                self._countedPaths.add(placeholderPath)
+        return self._requestedBytes
+
+    def _get_inflight_downloads(self):
+        command = InflightDownloadsStatus(agentPort=self.agentPort, desktopPort=self.desktopPort)
+        if not command.execute():
+            output_message('{}\n'.format(ERROR_SENDING_COMMAND))
+            sys.exit(1)
+        return command.downloads
+
+    def _print_plan(self, folderPath):
+        folders = 0
+        files = 0
+        byDirectory = {}
+        byExtension = {}
+        if folderPath.endswith(RecursiveSync._FOLDER_PLACEHOLDER_EXTENSIONS + RecursiveSync._FILE_PLACEHOLDER_EXTENSIONS):
+            placeholders = [folderPath]
+            folderPath = os.path.dirname(folderPath)
+        else:
+            placeholders = self._get_placeholders(folderPath)
+        for placeholderPath in placeholders:
+            relativePath = os.path.relpath(placeholderPath, folderPath)
+            directory = relativePath.split(os.sep, 1)[0] if os.sep in relativePath else u'.'
+            if placeholderPath.endswith(RecursiveSync._FOLDER_PLACEHOLDER_EXTENSIONS):
+                folders += 1
+                extension = u'(folder)'
+            else:
+                files += 1
+                extension = os.path.splitext(os.path.splitext(relativePath)[0])[1].lower() or u'(none)'
+            for totals, key in ((byDirectory, directory), (byExtension, extension)):
+                totals[key] = totals.get(key, 0) + 1
+
+        output_message(u'Plan for recursive sync of {}\n'.format(folderPath))
+        output_message(u'Folders to expand: {}\n'.format(folders))
+        output_message(u'Files to download: {}\n'.format(files))
+        if folders:
+            output_message(u'Contents of folders that are not expanded yet are not included\n')
+        for title, totals in ((u'By directory', byDirectory), (u'By extension', byExtension)):
+            if totals:
+                output_message(u'\n{}:\n'.format(title))
+                rows = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+                for key, count in rows[:RecursiveSync._PLAN_MAX_ROWS]:
+                    output_message(u'  {:<40} {:>14}\n'.format(key, u'{} items'.format(count)))
+                if len(rows) > RecursiveSync._PLAN_MAX_ROWS:
+                    output_message(u'... {} more\n'.format(len(rows) - RecursiveSync._PLAN_MAX_ROWS))
+
+        output_message(u'\n')
+        if not self.journal:
+            output_message(u'Estimated time: unknown, pass the --{} journal of an earlier recursive sync to estimate '
+                           u'from its downloads\n'.format(RecursiveSync.RESUME_ARGUMENT_NAME))
+        elif not (self.journal.downloadedFiles and self.journal.downloadSeconds):
+            output_message(u'Estimated time: unknown, {} has no downloads recorded\n'.format(self.journal.journalPath))
+        else:
+            secondsPerFile = self.journal.downloadSeconds / float(self.journal.downloadedFiles)
+            output_message(u'Estimated time: {} at {:.1f}s per file ({} downloads at {}/s in the journal)\n'.format(
+                format_duration(files * secondsPerFile), secondsPerFile, self.journal.downloadedFiles,
+                format_size(self.journal.downloadedBytes / float(self.journal.downloadSeconds))))
+        return True
+
+    def _get_placeholders(self, folderPath):
+        placeholders = []
+        journalSkipped = []
+        walkedFolders = []
+        for root, dirs, files in os.walk(get_os_encoded_path(folderPath)):
+            root = get_unprefixed_path(root)  # odrive does its own prefixing, so remove it if on Win
+            if self.journal:
+                dirs[:] = [d for d in dirs if os.path.join(root, make_unicode(d)) not in self.journal.completedFolders]
+                walkedFolders.append(root)
+            for f in sorted(files):  # Sort so that we always traverse the same way
+                f = make_unicode(f)
+                if f.endswith(RecursiveSync._FOLDER_PLACEHOLDER_EXTENSIONS) or \
+                        (f.endswith(RecursiveSync._FILE_PLACEHOLDER_EXTENSIONS) and not self.noDownload):
+                    placeholderPath = os.path.join(root, f)
+                    if self.journal and self.journal.is_done(placeholderPath):
+                        journalSkipped.append(placeholderPath)
+                    else:
+                        placeholders.append(placeholderPath)
+        if self.journal:
+            self._journalSkipped = len(journalSkipped)
+            if not self.plan:
+                self._record_completed_folders(folderPath, walkedFolders, placeholders + journalSkipped)
+        return placeholders
+
+    def _record_completed_folders(self, folderPath, walkedFolders, placeholders):
+        pendingFolders = set()
+        for placeholderPath in placeholders:
+            folder = os.path.dirname(placeholderPath)
+            while folder not in pendingFolders:
+                pendingFolders.add(folder)
+                if folder == folderPath or os.path.dirname(folder) == folder:
+                    break
+                folder = os.path.dirname(folder)
+        for folder in walkedFolders:
+            # Only the top of a completed subtree is recorded, it prunes everything underneath on later walks
+            if folder not in pendingFolders and (folder == folderPath or os.path.dirname(folder) in pendingFolders):
+                self.journal.record(RecursiveSyncJournal.COMPLETE, folder)
+
+    def _order_placeholders(self, folderPath, placeholders):
+        # Walk order is kept for ties, so the default 'name' order is exactly the os.walk traversal
+        if self.order == 'folders':
+            folders = [p for p in placeholders if p.endswith(RecursiveSync._FOLDER_PLACEHOLDER_EXTENSIONS)]
+            if folders and self._holdFiles:
+                # Files are held back until a pass finds no folders left to expand
+                placeholders = sorted(folders, key=lambda p: p.count(os.sep))
+            elif folders:
+                # Folders that would not expand still go first, then the files
+                folderSet = set(folders)
+                placeholders = sorted(folders, key=lambda p: p.count(os.sep)) + \
+                               [p for p in placeholders if p not in folderSet]
+        elif self.order == 'newest':
+            # Placeholders are empty files, so their modification time is the only thing odrive records on them
+            mtimes = dict((p, self._get_placeholder_mtime(p)) for p in placeholders)
+            placeholders = sorted(placeholders, key=lambda p: -mtimes[p])
+        if self.priority:
+            placeholders = sorted(placeholders, key=lambda p: self._get_priority(folderPath, p))
+        return placeholders
+
+    def _get_placeholder_mtime(self, placeholderPath):
+        # Placeholders carry the remote modification time
+        try:
+            return os.path.getmtime(get_os_encoded_path(placeholderPath))
+        except Exception as e:
+            return 0
+
+    def _get_priority(self, folderPath, placeholderPath):
+        relativePath = os.path.splitext(os.path.relpath(placeholderPath, folderPath))[0].replace(os.sep, '/')
+        name = relativePath.rsplit('/', 1)[-1]
+        for index, pattern in enumerate(self.priority):
+            if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relativePath, pattern):
+                return index
+        return len(self.priority)
+
+
+class RecursiveSyncJournal(object):
+    # Append-only log of recursive sync results, one JSON object per line
+    SYNCED = 'synced'
+    FAILED = 'failed'
+    COMPLETE = 'complete'
+    RESTART = 'restart'
+    MAX_FAILURES = 5
+
+    def __init__(self, journalPath, noDownload):
+        self.journalPath = journalPath
+        self.failures = {}
+        self.completedFolders = set()
+        self.downloadedBytes = 0
+        self.downloadedFiles = 0
+        self.downloadSeconds = 0
+        self._noDownload = noDownload
+        self._journalFile = None
+
+    def open(self, readOnly=False):
+        # Read only for --plan, which must leave the journal as it is: entries are then only applied in memory
+        needsNewline = False
+        if os.path.isfile(self.journalPath):
+            with open(self.journalPath, 'rb') as f:
+                for line in f:
+                    needsNewline = not line.endswith(b'\n')
+                    try:
+                        self._apply(json.loads(line.decode('utf-8')))
+                    except ValueError as e:
+                        pass  # an interrupted run can leave a partial last line
+        if readOnly:
+            return
+        self._journalFile = open(self.journalPath, 'ab')
+        if needsNewline:
+            self._journalFile.write(b'\n')
+
+    def close(self):
+        if self._journalFile:
+            self._journalFile.close()
+            self._journalFile = None
+
+    def restart(self, folderPath):
+        # Recorded rather than only forgotten, or a restarted run that is interrupted would be skipped on resume
+        self.record(RecursiveSyncJournal.RESTART, folderPath)
+
+    def is_done(self, placeholderPath):
+        # A placeholder recorded as synced that is found again has been unsynced since, so only failures count
+        return self.failures.get(placeholderPath, 0) >= RecursiveSyncJournal.MAX_FAILURES
+
+    def record(self, status, path, download=None):
+        entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'status': status, 'path': path}
+        if download:
+            entry.update(download)
+        if status == RecursiveSyncJournal.COMPLETE:
+            entry['nodownload'] = self._noDownload
+        self._apply(entry)
+        if self._journalFile:
+            self._journalFile.write((json.dumps(entry) + '\n').encode('utf-8'))
+            self._journalFile.flush()
+
+    def _apply(self, entry):
+        status = entry.get('status')
+        path = entry.get('path')
+        if status == RecursiveSyncJournal.SYNCED:
+            if 'seconds' in entry:
+                self.downloadedBytes += entry.get('bytes', 0)
+                self.downloadedFiles += 1
+                self.downloadSeconds += entry['seconds']
+        elif status == RecursiveSyncJournal.FAILED:
+            self.failures[path] = self.failures.get(path, 0) + 1
+        elif status == RecursiveSyncJournal.COMPLETE:
+            # A folder completed without downloads can still hold file placeholders
+            if self._noDownload or not entry.get('nodownload'):
+                self.completedFolders.add(path)
+        elif status == RecursiveSyncJournal.RESTART:
+            # Downloads are kept, they are still good for --plan estimates
+            self.failures = {}
+            self.completedFolders = set()
+
 
 class Refresh(OdriveSynchronousCommand):
     COMMAND_NAME = 'refresh'
@@ -797,6 +1425,131 @@ class Refresh(OdriveSynchronousCommand):
             pass
 
 
+class QuietRefresh(Refresh):
+    # Collects the refreshed sync states instead of printing them
+
+    def __init__(self, agentPort, desktopPort, folderPath):
+        super(QuietRefresh, self).__init__(agentPort=agentPort, desktopPort=desktopPort, folderPath=folderPath)
+        self.syncState = None
+        self.childSyncStates = {}
+        self.errors = []
+
+    def _print_response(self, messageType, message):
+        try:
+            if messageType == OdriveSynchronousCommand._STATUS_MESSAGE:
+                jsonResponse = json.loads(message)
+                self.syncState = jsonResponse.get('syncState')
+                self.childSyncStates = jsonResponse.get('childSyncStates') or {}
+            elif messageType == OdriveSynchronousCommand._ERROR_MESSAGE:
+                self.errors.append(message)
+        except Exception as e:
+            pass
+
+
+class RecursiveRefresh(object):
+    COMMAND_NAME = "recursive"
+    HELP = "refresh the folder and every expanded folder under it"
+    WORKERS_ARGUMENT_HELP = "number of refreshes in flight at once (used with --recursive, default 4)"
+    WORKERS_ARGUMENT_NAME = "workers"
+    PRUNE_ARGUMENT_HELP = "do not descend into folders whose children have the same sync states as on the last " \
+                          "recursive refresh (used with --recursive). Only looks one level down, so changes deeper " \
+                          "in such a folder are missed"
+    PRUNE_ARGUMENT_NAME = "prune"
+    DEFAULT_WORKERS = 4
+    _STATES_FILE_NAME = 'recursive_refresh_states.json'
+
+    def __init__(self, agentPort, desktopPort, folderPath, workers=DEFAULT_WORKERS, prune=False):
+        self.agentPort = agentPort
+        self.desktopPort = desktopPort
+        self.folderPath = folderPath
+        self.workers = workers
+        self.prune = prune
+
+    def execute(self):
+        folderPath = make_unicode(self.folderPath)
+        if not os.path.isdir(get_os_encoded_path(folderPath)):
+            output_message('{}\n'.format(folderPath + u" doesn't exist!"))
+            return True
+        # Only a hash of each folder's child states is kept, thousands of folders would make for a big file otherwise
+        statesHashes = self._load_states_hashes()
+        stateCounts = {}
+        refreshed = 0
+        pruned = 0
+        failed = 0
+        startTime = time.time()
+        pool = CommandPool(self.workers)
+        try:
+            pool.submit(self._refresh, folderPath)
+            for (path,), command, error in pool.results():
+                if error or command.errors or command.syncState is None:
+                    failed += 1
+                    output_message(u'Unable to refresh {}: {}\n'.format(
+                        path, error or u' '.join(command.errors) or u'no sync state returned'), stderr=True)
+                    continue
+                refreshed += 1
+                for childSyncState in command.childSyncStates.values():
+                    stateCounts[childSyncState] = stateCounts.get(childSyncState, 0) + 1
+                statesHash = hashlib.sha1(json.dumps(command.childSyncStates, sort_keys=True).encode('utf-8')).hexdigest()
+                unchanged = statesHashes.get(path) == statesHash
+                statesHashes[path] = statesHash
+                if self.prune and unchanged:
+                    pruned += 1
+                    continue
+                for subfolderPath in self._get_subfolders(path):
+                    pool.submit(self._refresh, subfolderPath)
+        finally:
+            pool.close()
+        self._save_states_hashes(statesHashes)
+
+        output_message(u'Refreshed {} folders under {} in {:.1f}s{}{}\n'.format(
+            refreshed, folderPath, time.time() - startTime,
+            u', {} unchanged and not descended into'.format(pruned) if pruned else u'',
+            u', {} failed'.format(failed) if failed else u''))
+        for syncState, count in sorted(stateCounts.items(), key=lambda item: -item[1]):
+            output_message(u'{}: {}\n'.format(syncState, count))
+        if failed:
+            sys.exit(1)
+        return True
+
+    def _refresh(self, folderPath):
+        command = QuietRefresh(agentPort=self.agentPort, desktopPort=self.desktopPort, folderPath=folderPath)
+        if not command.execute():
+            raise Exception(ERROR_SENDING_COMMAND)
+        return command
+
+    def _get_subfolders(self, folderPath):
+        # Expanded folders only, folder placeholders are files and have nothing to refresh yet
+        subfolders = []
+        try:
+            for name in sorted(os.listdir(get_os_encoded_path(folderPath))):
+                subfolderPath = os.path.join(folderPath, make_unicode(name))
+                if os.path.isdir(get_os_encoded_path(subfolderPath)):
+                    subfolders.append(subfolderPath)
+        except Exception as e:
+            pass
+        return subfolders
+
+    def _get_states_path(self):
+        return os.path.join(expand_user('~'), UTILITIES_DATA_FOLDER_NAME, RecursiveRefresh._STATES_FILE_NAME)
+
+    def _load_states_hashes(self):
+        try:
+            with open(self._get_states_path(), 'r') as f:
+                return json.loads(f.read())
+        except Exception as e:
+            return {}
+
+    def _save_states_hashes(self, statesHashes):
+        statesPath = self._get_states_path()
+        try:
+            if not os.path.isdir(os.path.dirname(statesPath)):
+                os.makedirs(os.path.dirname(statesPath))
+            with open(statesPath, 'w') as f:
+                f.write(json.dumps(statesHashes))
+        except Exception as e:
+            pass
+
+
 class Unsync(OdriveSynchronousCommand):
     COMMAND_NAME = 'unsync'
     HELP = "unsync a file or a folder"
@@ -889,6 +1642,205 @@ class SyncState(OdriveSynchronousCommand):
             pass
 
 
+class QuietSyncState(SyncState):
+    # Collects the sync states instead of printing them
+
+    def __init__(self, agentPort, desktopPort, path):
+        super(QuietSyncState, self).__init__(agentPort=agentPort, desktopPort=desktopPort, path=path, textonly=True)
+        self.syncState = None
+        self.childSyncStates = {}
+        self.errors = []
+
+    def _print_response(self, messageType, message):
+        try:
+            if messageType == OdriveSynchronousCommand._STATUS_MESSAGE:
+                jsonResponse = json.loads(message)
+                self.syncState = jsonResponse.get('syncState')
+                self.childSyncStates = jsonResponse.get('childSyncStates') or {}
+            elif messageType == OdriveSynchronousCommand._ERROR_MESSAGE:
+                self.errors.append(message)
+        except Exception as e:
+            pass
+
+
+class RecursiveSyncState(object):
+    COMMAND_NAME = "recursive"
+    HELP = "get the sync state of everything under the folder, expanded folders included"
+    SUMMARY_ARGUMENT_HELP = "instead of every item, print a tree of folders with their item counts by sync state and " \
+                            "local bytes, subfolders included (used with --recursive)"
+    SUMMARY_ARGUMENT_NAME = "summary"
+    DEPTH_ARGUMENT_HELP = "levels of subfolders to show in the summary (used with --summary, default 1)"
+    DEPTH_ARGUMENT_NAME = "depth"
+    WORKERS_ARGUMENT_HELP = "number of syncstate requests in flight at once (used with --recursive, default 4)"
+    WORKERS_ARGUMENT_NAME = "workers"
+    MAX_AGE_ARGUMENT_HELP = "cache sync states and reuse those of folders that have not changed on disk since an " \
+                            "earlier --max-age syncstate up to this many seconds ago, marking them as cached. Changes " \
+                            "odrive has not written to disk yet are missed (used with --recursive, default 0, no cache)"
+    MAX_AGE_ARGUMENT_NAME = "max-age"
+    DEFAULT_WORKERS = 4
+    DEFAULT_MAX_AGE = 0
+    SUMMARY_STATES = ('Synced', 'Active', 'Locked')
+    _CACHE_FILE_NAME = 'syncstate_cache.json'
+
+    def __init__(self, agentPort, desktopPort, folderPath, summary=False, depth=1, workers=DEFAULT_WORKERS,
+                 maxAge=DEFAULT_MAX_AGE):
+        self.agentPort = agentPort
+        self.desktopPort = desktopPort
+        self.folderPath = folderPath
+        self.summary = summary
+        self.depth = depth
+        self.workers = workers
+        self.maxAge = maxAge
+        self._cache = {}
+        self._listings = {}
+        self._childSyncStates = {}
+        self._cachedPaths = set()
+
+    def execute(self):
+        folderPath = make_unicode(self.folderPath)
+        if not os.path.isdir(get_os_encoded_path(folderPath)):
+            output_message('{}\n'.format(folderPath + u" is not a folder!"))
+            return True
+        self._cache = self._load_cache() if self.maxAge else {}
+        failed = 0
+        startTime = time.time()
+        pool = CommandPool(self.workers)
+        try:
+            self._visit([folderPath], pool, startTime)
+            for (path,), command, error in pool.results():
+                if error or command.errors or command.syncState is None:
+                    failed += 1
+                    output_message(u'Unable to get the sync state of {}: {}\n'.format(
+                        path, error or u' '.join(command.errors) or u'no sync state returned'), stderr=True)
+                else:
+                    self._childSyncStates[path] = command.childSyncStates
+                    self._cache[path] = {'time': startTime,
+                                         'mtime': self._listings[path][2],
+                                         'childSyncStates': command.childSyncStates}
+                # Subfolders of a folder that failed are still counted
+                self._visit(self._listings[path][0], pool, startTime)
+        finally:
+            pool.close()
+        if self.maxAge:
+            self._save_cache(startTime)
+
+        if self.summary:
+            self._print_summary(folderPath)
+            output_message(u'{} folders in {:.1f}s{}{}\n'.format(
+                len(self._listings), time.time() - startTime,
+                u', {} from cache'.format(len(self._cachedPaths)) if self._cachedPaths else u'',
+                u', {} failed'.format(failed) if failed else u''))
+        else:
+            for path in sorted(self._childSyncStates):
+                subfolderNames = set(os.path.basename(subfolderPath) for subfolderPath in self._listings[path][0])
+                for name, syncState in sorted(self._childSyncStates[path].items()):
+                    if name not in subfolderNames:
+                        output_message(u'{}: {}{}\n'.format(syncState, os.path.relpath(os.path.join(path, name), folderPath),
+                                                            u' (cached)' if path in self._cachedPaths else u''))
+        if failed:
+            sys.exit(1)
+        return True
+
+    def _visit(self, folderPaths, pool, startTime):
+        # Lists folders on disk and asks odrive for the ones that aren't cached, cached ones are descended into now
+        folderPaths = list(folderPaths)
+        while folderPaths:
+            path = folderPaths.pop()
+            self._listings[path] = self._list_folder(path)
+            cached = self._cache.get(path)
+            if cached and startTime - cached.get('time', 0) <= self.maxAge and cached.get('mtime') == self._listings[path][2]:
+                self._childSyncStates[path] = cached.get('childSyncStates') or {}
+                self._cachedPaths.add(path)
+                folderPaths.extend(self._listings[path][0])
+            else:
+                pool.submit(self._get_sync_states, path)
+
+    def _get_sync_states(self, path):
+        command = QuietSyncState(agentPort=self.agentPort, desktopPort=self.desktopPort, path=path)
+        if not command.execute():
+            raise Exception(ERROR_SENDING_COMMAND)
+        return command
+
+    def _list_folder(self, folderPath):
+        # Expanded subfolders, bytes of the local files (placeholders are stubs, not local data) and the folder's mtime
+        subfolders = []
+        localBytes = 0
+        try:
+            encodedFolderPath = get_os_encoded_path(folderPath)
+            mtime = os.path.getmtime(encodedFolderPath)
+            for name in sorted(os.listdir(encodedFolderPath)):
+                path = os.path.join(folderPath, make_unicode(name))
+                encodedPath = get_os_encoded_path(path)
+                if os.path.isdir(encodedPath):
+                    subfolders.append(path)
+                elif not path.endswith(RecursiveSync._FOLDER_PLACEHOLDER_EXTENSIONS + RecursiveSync._FILE_PLACEHOLDER_EXTENSIONS):
+                    localBytes += os.path.getsize(encodedPath)
+        except Exception as e:
+            mtime = None
+        return subfolders, localBytes, mtime
+
+    def _get_totals(self):
+        # Per folder: a count per SUMMARY_STATES, then other states, then local bytes, with every subfolder added in
+        totals = {}
+        for path, (subfolders, localBytes, mtime) in self._listings.items():
+            counts = [0] * (len(RecursiveSyncState.SUMMARY_STATES) + 1) + [localBytes]
+            subfolderNames = set(os.path.basename(subfolderPath) for subfolderPath in subfolders)
+            for name, syncState in self._childSyncStates.get(path, {}).items():
+                # Expanded folders are counted through their own contents
+                if name not in subfolderNames:
+                    if syncState in RecursiveSyncState.SUMMARY_STATES:
+                        counts[RecursiveSyncState.SUMMARY_STATES.index(syncState)] += 1
+                    else:
+                        counts[len(RecursiveSyncState.SUMMARY_STATES)] += 1
+            totals[path] = counts
+        # Deepest first, so every folder is complete before it is added to its parent
+        for path in sorted(totals, key=lambda path: -path.count(os.sep)):
+            parentPath = os.path.dirname(path)
+            if parentPath != path and parentPath in totals:
+                totals[parentPath] = [parentTotal + total for parentTotal, total in zip(totals[parentPath], totals[path])]
+        return totals
+
+    def _print_summary(self, folderPath):
+        totals = self._get_totals()
+        output_message(u'{:>9} {:>9} {:>9} {:>9} {:>12}  {}\n'.format(
+            *(RecursiveSyncState.SUMMARY_STATES + (u'Other', u'Local', u'Folder'))))
+        pending = [(folderPath, 0)]
+        while pending:
+            path, level = pending.pop()
+            counts = totals[path]
+            output_message(u'{:>9} {:>9} {:>9} {:>9} {:>12}  {}{}\n'.format(
+                *(counts[:-1] + [format_size(counts[-1]), u'  ' * level, path if not level else os.path.basename(path)])))
+            if level < self.depth:
+                # Largest first, like du | sort. Reversed because pending is a stack
+                subfolders = sorted(self._listings[path][0], key=lambda subfolderPath: (-totals[subfolderPath][-1],
+                                                                                        -sum(totals[subfolderPath][:-1]),
+                                                                                        subfolderPath))
+                pending.extend((subfolderPath, level + 1) for subfolderPath in reversed(subfolders))
+
+    def _get_cache_path(self):
+        return os.path.join(expand_user('~'), UTILITIES_DATA_FOLDER_NAME, RecursiveSyncState._CACHE_FILE_NAME)
+
+    def _load_cache(self):
+        try:
+            with open(self._get_cache_path(), 'r') as f:
+                return json.loads(f.read())
+        except Exception as e:
+            return {}
+
+    def _save_cache(self, startTime):
+        # Entries too old to be reused are dropped
+        cache = dict((path, cached) for path, cached in self._cache.items()
+                     if startTime - cached.get('time', 0) <= self.maxAge)
+        cachePath = self._get_cache_path()
+        try:
+            if not os.path.isdir(os.path.dirname(cachePath)):
+                os.makedirs(os.path.dirname(cachePath))
+            with open(cachePath, 'w') as f:
+                f.write(json.dumps(cache))
+        except Exception as e:
+            pass
+
+
 class Status(OdriveSynchronousCommand):
     COMMAND_NAME = 'status'
     HELP = "get status info"
@@ -1116,6 +2068,21 @@ class DownloadsStatus(Status):
                 pass
 
 
+class InflightDownloadsStatus(DownloadsStatus):
+    # Collects the agent's current downloads instead of printing them
+
+    def __init__(self, agentPort, desktopPort):
+        super(InflightDownloadsStatus, self).__init__(agentPort=agentPort, desktopPort=desktopPort)
+        self.downloads = []
+
+    def _print_response(self, messageType, message):
+        if messageType == OdriveSynchronousCommand._STATUS_MESSAGE:
+            try:
+                self.downloads = message.get('downloads') or []
+            except Exception as e:
+                pass
+
+
 class TrashStatus(Status):
     HELP = 'get status of trash items'
     TRASH_STATUS_ARGUMENT_NAME = '--trash'
@@ -1184,6 +2151,228 @@ class NotAllowedStatus(Status):
                 pass
 
 
+class MetricsStatus(Status):
+    HELP = 'write the status as gauges to this Prometheus textfile collector file, eg. /var/lib/node_exporter/odrive.prom'
+    METRICS_STATUS_ARGUMENT_NAME = '--metrics'
+    INTERVAL_ARGUMENT_HELP = 'with --metrics, rewrite the file every this many seconds until interrupted. With ' \
+                             '--transfers, seconds between samples (default 2)'
+    INTERVAL_ARGUMENT_NAME = '--interval'
+    _METRIC_PREFIX = 'odrive_'
+    _QUEUES = (('sync_requests', ('expandRequests', 'syncRequests'), 'Sync requests (expand and sync) queued'),
+               ('background_requests', ('refreshChildOperations',), 'Background requests queued'),
+               ('uploads', ('uploads',), 'Uploads in progress'),
+               ('downloads', ('downloads',), 'Downloads in progress'),
+               ('trash_items', ('trashItems',), 'Items in the odrive trash'),
+               ('waiting_items', ('waitingItems',), 'Items waiting to sync'),
+               ('not_allowed_items', ('notAllowedItems',), 'Items that are not allowed to sync'))
+    _FLAGS = (('activated', 'isActivated', 'Whether odrive is activated'),
+              ('has_session', 'hasSession', 'Whether odrive has a session'),
+              ('sync_enabled', 'syncEnabled', 'Whether sync is enabled'))
+    _THRESHOLDS = ('placeholderThreshold', 'autoUnsyncThreshold', 'autoTrashThreshold', 'xlFileThreshold',
+                   'downloadThrottlingThreshold', 'uploadThrottlingThreshold')
+
+    def __init__(self, agentPort, desktopPort, metricsPath, interval=None, registryPaths=None):
+        super(MetricsStatus, self).__init__(agentPort=agentPort, desktopPort=desktopPort)
+        self.metricsPath = metricsPath
+        self.interval = interval
+        # Agent and desktop .oreg files. odrive picks a new port when it restarts, so they are read again on every poll
+        self.registryPaths = registryPaths
+        self._written = False
+        self._answered = False
+        self._pollStartTime = 0
+        self._lastStatusTime = None
+
+    def execute(self):
+        # The agent closes the connection after every response, so each poll is a new (loopback) connection
+        while True:
+            self._written = False
+            self._answered = False
+            self._pollStartTime = time.time()
+            if self.registryPaths:
+                self._agentPort, self._desktopPort = [get_protocol_server_port(registryPath)
+                                                      for registryPath in self.registryPaths]
+            success = super(MetricsStatus, self).execute()
+            if not self._written and not self._answered:
+                # Nothing answered, which is what an alert on odrive_up should catch. A status that could not be
+                # turned into metrics leaves the last file, whose timestamp then goes stale
+                self._write_metrics(None)
+            if not self.interval:
+                return success
+            time.sleep(max(self.interval - (time.time() - self._pollStartTime), 0))
+
+    def _print_response(self, messageType, message):
+        if messageType == OdriveSynchronousCommand._STATUS_MESSAGE:
+            self._answered = True
+            try:
+                self._write_metrics(message)
+            except Exception as e:
+                self._output_message('Unable to write metrics from the status: {}\n'.format(e), stderr=True)
+        elif messageType == OdriveSynchronousCommand._ERROR_MESSAGE:
+            self._output_message('{}\n'.format(message), stderr=True)
+
+    def _write_metrics(self, message):
+        metrics = [('up', 'Whether the odrive agent answered the status request', [({}, 1 if message else 0)])]
+        if message:
+            self._lastStatusTime = time.time()
+            metrics.append(('status_duration_seconds', 'Time taken to get the status',
+                            [({}, self._lastStatusTime - self._pollStartTime)]))
+            for name, key, help in MetricsStatus._FLAGS:
+                metrics.append((name, help, [({}, 1 if message.get(key) else 0)]))
+            metrics.append(('info', 'odrive version and account type',
+                            [({'version': message.get('productVersion'),
+                               'account_type': message.get('authorizedAccountSourceType')}, 1)]))
+            metrics.append(('mounts', 'Mounted folders',
+                            [({}, len(message.get('proSyncFolders') or []) +
+                              (1 if (message.get('odriveFolder') or {}).get('path') else 0))]))
+            metrics.append(('backups', 'Backup jobs', [({}, len(message.get('backupJobs') or []))]))
+            for name, keys, help in MetricsStatus._QUEUES:
+                metrics.append((name, help, [({}, sum(len(message.get(key) or []) for key in keys))]))
+            metrics.append(('threshold_info', 'Threshold settings, the value is in the label',
+                            [({'threshold': key, 'value': message.get(key)}, 1) for key in MetricsStatus._THRESHOLDS]))
+        if self._lastStatusTime:
+            metrics.append(('last_status_timestamp_seconds', 'When the agent last answered the status request',
+                            [({}, self._lastStatusTime)]))
+
+        lines = []
+        for name, help, samples in metrics:
+            lines.append('# HELP {}{} {}'.format(MetricsStatus._METRIC_PREFIX, name, help))
+            lines.append('# TYPE {}{} gauge'.format(MetricsStatus._METRIC_PREFIX, name))
+            for labels, value in samples:
+                labelText = ','.join('{}="{}"'.format(label, self._escape_label_value(labels[label]))
+                                     for label in sorted(labels))
+                # repr keeps full precision for timestamps on Python 2
+                lines.append('{}{}{} {}'.format(MetricsStatus._METRIC_PREFIX, name,
+                                                '{' + labelText + '}' if labelText else '',
+                                                repr(value) if isinstance(value, float) else value))
+
+        # The collector may read at any moment, so it must only ever see a complete file
+        metricsPath = get_os_encoded_path(self.metricsPath)
+        temporaryPath = get_os_encoded_path(self.metricsPath + '.tmp')
+        try:
+            with open(temporaryPath, 'wb') as f:
+                f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            if hasattr(os, 'replace'):
+                os.replace(temporaryPath, metricsPath)
+            else:
+                if IS_WINDOWS and os.path.exists(metricsPath):
+                    os.remove(metricsPath)
+                os.rename(temporaryPath, metricsPath)
+            self._written = True
+        except Exception as e:
+            self._output_message('Unable to write metrics to {}: {}\n'.format(self.metricsPath, e), stderr=True)
+
+    def _escape_label_value(self, value):
+        return make_unicode('{}'.format(value)).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TransfersStatus(Status):
+    HELP = 'sample uploads and downloads until interrupted, showing their throughput, ETA and the slowest transfers'
+    TRANSFERS_STATUS_ARGUMENT_NAME = '--transfers'
+    TOP_ARGUMENT_HELP = 'with --transfers, number of slowest transfers to list (default 10)'
+    TOP_ARGUMENT_NAME = '--top'
+    DEFAULT_INTERVAL = 2
+    _HISTORY_LENGTH = 30
+    _DIRECTIONS = (('downloads', 'down'), ('uploads', 'up'))
+
+    def __init__(self, agentPort, desktopPort, interval=None, top=10):
+        super(TransfersStatus, self).__init__(agentPort=agentPort, desktopPort=desktopPort)
+        self.interval = interval or TransfersStatus.DEFAULT_INTERVAL
+        self.top = top
+        # (direction, path) -> ring buffer of (time, percentComplete) samples
+        self._history = {}
+        self._sizes = {}
+
+    def execute(self):
+        # One poll that fails, eg. while odrive restarts, is reported and the next one carries on
+        while True:
+            pollStartTime = time.time()
+            if not super(TransfersStatus, self).execute():
+                self._output_message('Unable to get the status, trying again\n', stderr=True)
+            time.sleep(max(self.interval - (time.time() - pollStartTime), 0))
+
+    def _print_response(self, messageType, message):
+        if messageType == OdriveSynchronousCommand._STATUS_MESSAGE:
+            try:
+                self._sample(message, time.time())
+                self._print_transfers()
+            except Exception as e:
+                self._output_message('Unable to sample transfers: {}\n'.format(e), stderr=True)
+        elif messageType == OdriveSynchronousCommand._ERROR_MESSAGE:
+            self._output_message('{}\n'.format(message), stderr=True)
+
+    def _sample(self, message, sampleTime):
+        current = set()
+        for key, direction in TransfersStatus._DIRECTIONS:
+            for transfer in message.get(key) or []:
+                transferKey = (direction, transfer.get('path') or transfer.get('name'))
+                current.add(transferKey)
+                if transferKey not in self._history:
+                    self._history[transferKey] = collections.deque(maxlen=TransfersStatus._HISTORY_LENGTH)
+                self._history[transferKey].append((sampleTime, float(transfer.get('percentComplete') or 0)))
+        for transferKey in list(self._history):
+            if transferKey not in current:
+                del self._history[transferKey]
+                self._sizes.pop(transferKey, None)
+
+    def _get_size(self, transferKey):
+        # The status only has percentages, so bytes need the size of the local file. That is only known for uploads,
+        # a download's placeholder is an empty stub until the download finishes
+        if not self._sizes.get(transferKey):
+            try:
+                self._sizes[transferKey] = os.path.getsize(get_os_encoded_path(transferKey[1]))
+            except Exception as e:
+                self._sizes[transferKey] = 0
+        return self._sizes[transferKey]
+
+    def _get_rate(self, history):
+        # Percent per second across the whole ring buffer, None until there are two samples
+        (firstTime, firstPercent), (lastTime, lastPercent) = history[0], history[-1]
+        if lastTime <= firstTime:
+            return None
+        return max(lastPercent - firstPercent, 0) / (lastTime - firstTime)
+
+    def _print_transfers(self):
+        rows = []
+        totals = dict((direction, [0, 0, 0, 0]) for key, direction in TransfersStatus._DIRECTIONS)
+        for transferKey, history in self._history.items():
+            direction, path = transferKey
+            percent = history[-1][1]
+            rate = self._get_rate(history)
+            size = self._get_size(transferKey) if direction == 'up' else None
+            bytesPerSecond = rate * size / 100 if rate is not None and size else None
+            eta = (100 - percent) / rate if rate else None
+            rows.append((rate, direction, percent, bytesPerSecond, eta, path))
+            count, directionBytesPerSecond, unknownSizes, directionEta = totals[direction]
+            totals[direction] = [count + 1,
+                                 directionBytesPerSecond + (bytesPerSecond or 0),
+                                 unknownSizes + (1 if size == 0 else 0),
+                                 # All of them are done when the last one is
+                                 max(directionEta, eta or 0)]
+
+        self._clear_tty()
+        for key, direction in TransfersStatus._DIRECTIONS:
+            count, bytesPerSecond, unknownSizes, eta = totals[direction]
+            self._output_message('{}: {}{}{}{}\n'.format(
+                key.capitalize(), count,
+                ' at {}/s'.format(format_size(bytesPerSecond)) if direction == 'up' else '',
+                ', all done in {}'.format(format_duration(eta)) if eta else '',
+                ' ({} of unknown size)'.format(unknownSizes) if unknownSizes else ''))
+        if rows:
+            # Slowest first: stalled transfers, then by rate. New ones have no rate yet and go last
+            rows.sort(key=lambda row: (row[0] is None, row[0] or 0))
+            self._output_message('\nSlowest transfers:\n')
+            self._output_message('{:<5} {:>6} {:>9} {:>12} {:>9}  {}\n'.format('', 'done', 'rate', 'speed', 'eta', 'path'))
+            for rate, direction, percent, bytesPerSecond, eta, path in rows[:self.top]:
+                self._output_message('{:<5} {:>5.1f}% {:>9} {:>12} {:>9}  {}\n'.format(
+                    direction, percent,
+                    '{:.2f}%/s'.format(rate) if rate is not None else '...',
+                    '{}/s'.format(format_size(bytesPerSecond)) if bytesPerSecond is not None else
+                    ('-' if direction == 'down' else '?'),
+                    format_duration(eta) if eta else ('stalled' if rate == 0 else '?'),
+                    path))
+        self._output_message('\n')
+
+
 class EmptyTrash(OdriveSynchronousCommand):
     COMMAND_NAME = 'emptytrash'
     HELP = "empty odrive trash"
@@ -1237,6 +2426,23 @@ def unicode_path(string):
 
 def parse_args():
     parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--" + CommandProfile.PROFILE_ARGUMENT_NAME,
+                        action="store_true",
+                        default=False,
+                        help=CommandProfile.PROFILE_ARGUMENT_HELP,
+                        required=False)
+    parser.add_argument("--" + CommandProfile.PROFILE_JSON_ARGUMENT_NAME,
+                        type=unicode_path,
+                        default=None,
+                        metavar='FILE',
+                        help=CommandProfile.PROFILE_JSON_ARGUMENT_HELP,
+                        required=False)
+    parser.add_argument("--" + CommandProfile.CPROFILE_ARGUMENT_NAME,
+                        type=unicode_path,
+                        default=None,
+                        metavar='FILE',
+                        help=CommandProfile.CPROFILE_ARGUMENT_HELP,
+                        required=False)
     subparsers = parser.add_subparsers(help='commands', dest='command')
 
     authenticateParser = subparsers.add_parser(Authenticate.COMMAND_NAME, help=Authenticate.HELP)
@@ -1286,6 +2492,48 @@ def parse_args():
                             default=False,
                             help=RecursiveSync.NO_DOWNLOAD_ARGUMENT_HELP,
                             required=False)
+    syncParser.add_argument("--" + RecursiveSync.ORDER_ARGUMENT_NAME,
+                            choices=RecursiveSync.ORDER_ARGUMENT_VALUES,
+                            default='name',
+                            help=RecursiveSync.ORDER_ARGUMENT_HELP,
+                            required=False)
+    syncParser.add_argument("--" + RecursiveSync.PRIORITY_ARGUMENT_NAME,
+                            action="append",
+                            default=None,
+                            help=RecursiveSync.PRIORITY_ARGUMENT_HELP,
+                            required=False)
+    syncParser.add_argument("--" + RecursiveSync.MAX_BYTES_ARGUMENT_NAME,
+                            dest=RecursiveSync.MAX_BYTES_ARGUMENT_NAME,
+                            type=int,
+                            default=None,
+                            metavar='BYTES',
+                            help=RecursiveSync.MAX_BYTES_ARGUMENT_HELP,
+                            required=False)
+    syncParser.add_argument("--" + RecursiveSync.MAX_INFLIGHT_ARGUMENT_NAME,
+                            dest=RecursiveSync.MAX_INFLIGHT_ARGUMENT_NAME,
+                            type=int,
+                            default=None,
+                            metavar='DOWNLOADS',
+                            help=RecursiveSync.MAX_INFLIGHT_ARGUMENT_HELP,
+                            required=False)
+    syncParser.add_argument("--" + RecursiveSync.MAX_FILES_ARGUMENT_NAME,
+                            dest=RecursiveSync.MAX_FILES_ARGUMENT_NAME,
+                            type=int,
+                            default=None,
+                            metavar='FILES',
+                            help=RecursiveSync.MAX_FILES_ARGUMENT_HELP,
+                            required=False)
+    syncParser.add_argument("--" + RecursiveSync.PLAN_ARGUMENT_NAME,
+                            action="store_true",
+                            default=False,
+                            help=RecursiveSync.PLAN_ARGUMENT_HELP,
+                            required=False)
+    syncParser.add_argument("--" + RecursiveSync.RESUME_ARGUMENT_NAME,
+                            type=unicode_path,
+                            default=None,
+                            metavar='JOURNAL',
+                            help=RecursiveSync.RESUME_ARGUMENT_HELP,
+                            required=False)
     syncParser.add_argument("--" + RecursiveSync.NO_WAIT_ARGUMENT_NAME,
                             action="store_true",
                             default=False,
@@ -1305,6 +2553,21 @@ def parse_args():
     refreshParser.add_argument(Refresh.FOLDER_PATH_ARGUMENT_NAME,
                                type=unicode_path,
                                help=Refresh.FOLDER_PATH_ARGUMENT_HELP)
+    refreshParser.add_argument("--" + RecursiveRefresh.COMMAND_NAME,
+                               action="store_true",
+                               default=False,
+                               help=RecursiveRefresh.HELP,
+                               required=False)
+    refreshParser.add_argument("--" + RecursiveRefresh.WORKERS_ARGUMENT_NAME,
+                               type=int,
+                               default=RecursiveRefresh.DEFAULT_WORKERS,
+                               help=RecursiveRefresh.WORKERS_ARGUMENT_HELP,
+                               required=False)
+    refreshParser.add_argument("--" + RecursiveRefresh.PRUNE_ARGUMENT_NAME,
+                               action="store_true",
+                               default=False,
+                               help=RecursiveRefresh.PRUNE_ARGUMENT_HELP,
+                               required=False)
 
     unsyncParser = subparsers.add_parser(Unsync.COMMAND_NAME, help=Unsync.HELP)
     unsyncParser.add_argument(Unsync.PATH_ARGUMENT_NAME,
@@ -1337,14 +2600,32 @@ def parse_args():
     folderSyncRuleParser = subparsers.add_parser(FolderSyncRule.COMMAND_NAME,
                                                        help=FolderSyncRule.HELP)
     folderSyncRuleParser.add_argument(FolderSyncRule.LOCAL_PATH_ARGUMENT_NAME,
+                                            nargs='?',
                                             help=FolderSyncRule.LOCAL_PATH_ARGUMENT_HELP)
     folderSyncRuleParser.add_argument(FolderSyncRule.THRESHOLD_ARGUMENT_NAME,
+                                      nargs='?',
                                       help=FolderSyncRule.THRESHOLD_ARGUMENT_HELP)
     folderSyncRuleParser.add_argument("--" + FolderSyncRule.EXPAND_SUBFOLDERS_ARGUMENT_NAME,
                                      help=FolderSyncRule.EXPAND_SUBFOLDERS_ARGUMENT_HELP,
                                      required=False,
                                      action="store_true",
                                      default=False)
+    folderSyncRuleParser.add_argument("--" + FolderSyncRules.FROM_ARGUMENT_NAME,
+                                      type=unicode_path,
+                                      default=None,
+                                      metavar='FILE',
+                                      help=FolderSyncRules.FROM_ARGUMENT_HELP,
+                                      required=False)
+    folderSyncRuleParser.add_argument("--" + FolderSyncRules.FORCE_ARGUMENT_NAME,
+                                      action="store_true",
+                                      default=False,
+                                      help=FolderSyncRules.FORCE_ARGUMENT_HELP,
+                                      required=False)
+    folderSyncRuleParser.add_argument("--" + FolderSyncRules.WORKERS_ARGUMENT_NAME,
+                                      type=int,
+                                      default=FolderSyncRules.DEFAULT_WORKERS,
+                                      help=FolderSyncRules.WORKERS_ARGUMENT_HELP,
+                                      required=False)
 
     encPassphraseParser = subparsers.add_parser(EncPassphrase.COMMAND_NAME, help=EncPassphrase.HELP)
     encPassphraseParser.add_argument(EncPassphrase.PASSPHRASE_ARGUMENT_NAME,
@@ -1364,6 +2645,31 @@ def parse_args():
     syncStateParser.add_argument(SyncState.TEXTONLY_ARGUMENT_NAME,
                                  action='store_true',
                                  help=SyncState.TEXTONLY_ARGUMENT_HELP)
+    syncStateParser.add_argument("--" + RecursiveSyncState.COMMAND_NAME,
+                                 action="store_true",
+                                 default=False,
+                                 help=RecursiveSyncState.HELP,
+                                 required=False)
+    syncStateParser.add_argument("--" + RecursiveSyncState.SUMMARY_ARGUMENT_NAME,
+                                 action="store_true",
+                                 default=False,
+                                 help=RecursiveSyncState.SUMMARY_ARGUMENT_HELP,
+                                 required=False)
+    syncStateParser.add_argument("--" + RecursiveSyncState.DEPTH_ARGUMENT_NAME,
+                                 type=int,
+                                 default=1,
+                                 help=RecursiveSyncState.DEPTH_ARGUMENT_HELP,
+                                 required=False)
+    syncStateParser.add_argument("--" + RecursiveSyncState.WORKERS_ARGUMENT_NAME,
+                                 type=int,
+                                 default=RecursiveSyncState.DEFAULT_WORKERS,
+                                 help=RecursiveSyncState.WORKERS_ARGUMENT_HELP,
+                                 required=False)
+    syncStateParser.add_argument("--" + RecursiveSyncState.MAX_AGE_ARGUMENT_NAME,
+                                 type=float,
+                                 default=RecursiveSyncState.DEFAULT_MAX_AGE,
+                                 help=RecursiveSyncState.MAX_AGE_ARGUMENT_HELP,
+                                 required=False)
 
     statusParser = subparsers.add_parser(Status.COMMAND_NAME, help=Status.HELP)
     statusMutuallyExclusiveGroup = statusParser.add_mutually_exclusive_group()
@@ -1394,6 +2700,22 @@ def parse_args():
     statusMutuallyExclusiveGroup.add_argument(NotAllowedStatus.NOT_ALLOWED_STATUS_ARGUMENT_NAME,
                                               action='store_true',
                                               help=NotAllowedStatus.HELP)
+    statusMutuallyExclusiveGroup.add_argument(MetricsStatus.METRICS_STATUS_ARGUMENT_NAME,
+                                              type=unicode_path,
+                                              default=None,
+                                              metavar='FILE',
+                                              help=MetricsStatus.HELP)
+    statusMutuallyExclusiveGroup.add_argument(TransfersStatus.TRANSFERS_STATUS_ARGUMENT_NAME,
+                                              action='store_true',
+                                              help=TransfersStatus.HELP)
+    statusParser.add_argument(TransfersStatus.TOP_ARGUMENT_NAME,
+                              type=int,
+                              default=10,
+                              help=TransfersStatus.TOP_ARGUMENT_HELP)
+    statusParser.add_argument(MetricsStatus.INTERVAL_ARGUMENT_NAME,
+                              type=float,
+                              default=None,
+                              help=MetricsStatus.INTERVAL_ARGUMENT_HELP)
     subparsers.add_parser(Deauthorize.COMMAND_NAME, help=Deauthorize.HELP)
     subparsers.add_parser(Diagnostics.COMMAND_NAME, help=Diagnostics.HELP)
     subparsers.add_parser(BackupNow.COMMAND_NAME, help=BackupNow.HELP)
@@ -1404,7 +2726,20 @@ def parse_args():
     if not sys.argv[1:]:
         parser.print_usage()
         return None
-    return parser.parse_args()
+    args = parser.parse_args()
+    if getattr(args, RecursiveSync.PLAN_ARGUMENT_NAME, False) and not getattr(args, RecursiveSync.COMMAND_NAME):
+        syncParser.error("--{} is only used with --{}".format(RecursiveSync.PLAN_ARGUMENT_NAME, RecursiveSync.COMMAND_NAME))
+    if getattr(args, 'interval', None) is not None and not (args.metrics or args.transfers):
+        statusParser.error("{} is only used with {} or {}".format(MetricsStatus.INTERVAL_ARGUMENT_NAME,
+                                                                  MetricsStatus.METRICS_STATUS_ARGUMENT_NAME,
+                                                                  TransfersStatus.TRANSFERS_STATUS_ARGUMENT_NAME))
+    if args.command == FolderSyncRule.COMMAND_NAME and not getattr(args, FolderSyncRules.FROM_ARGUMENT_NAME) and \
+            getattr(args, FolderSyncRule.THRESHOLD_ARGUMENT_NAME) is None:
+        # Both are optional so that --from can be used instead
+        folderSyncRuleParser.error("the following arguments are required: {}, {} (or --{} FILE)".format(
+            FolderSyncRule.LOCAL_PATH_ARGUMENT_NAME, FolderSyncRule.THRESHOLD_ARGUMENT_NAME,
+            FolderSyncRules.FROM_ARGUMENT_NAME))
+    return args
 
 
 def get_protocol_server_port(registryPath):
@@ -1469,6 +2804,25 @@ def get_os_encoded_path(path):
         path = path.encode('utf-8')
     return path
 
+def get_unprefixed_path(path):
+    # The reverse of get_os_encoded_path, for comparing paths from os.walk with paths given on the command line
+    path = make_unicode(path)
+    if sys.platform.startswith('win32') and path.startswith(u'\\\\?\\'):
+        path = path[4:]
+    return os.path.normpath(path)
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(size) < 1000 or unit == 'TB':
+            break
+        size /= 1000.0
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{} B'.format(int(size))
+
 def make_unicode(path):
     if not isinstance(path, unicode):
         path = unicode(path, 'utf-8')
@@ -1489,7 +2843,10 @@ def main():
     agentProtocolServerPort = get_protocol_server_port(AGENT_PORT_REGISTRY_FILE_PATH)
     desktopProtocolServerPort = get_protocol_server_port(DESKTOP_PORT_REGISTRY_FILE_PATH)
 
-    if not (agentProtocolServerPort or desktopProtocolServerPort):
+    # A recursive sync plan only walks the local tree, so it does not need odrive running, and the metrics exporter
+    # reports odrive_up 0 rather than exiting
+    if not (agentProtocolServerPort or desktopProtocolServerPort) and not getattr(args, RecursiveSync.PLAN_ARGUMENT_NAME, False) \
+            and not getattr(args, 'metrics', None):
         print(REQUIRES_ODRIVE)
         sys.exit(1)
 
@@ -1528,7 +2885,14 @@ def main():
                                     desktopPort=desktopProtocolServerPort,
                                     folderPath=syncPath,
                                     noDownload=getattr(args, RecursiveSync.NO_DOWNLOAD_ARGUMENT_NAME),
-                                    noWait=getattr(args, RecursiveSync.NO_WAIT_ARGUMENT_NAME))
+                                    noWait=getattr(args, RecursiveSync.NO_WAIT_ARGUMENT_NAME),
+                                    order=getattr(args, RecursiveSync.ORDER_ARGUMENT_NAME),
+                                    priority=getattr(args, RecursiveSync.PRIORITY_ARGUMENT_NAME),
+                                    maxBytes=getattr(args, RecursiveSync.MAX_BYTES_ARGUMENT_NAME),
+                                    maxInflight=getattr(args, RecursiveSync.MAX_INFLIGHT_ARGUMENT_NAME),
+                                    maxFiles=getattr(args, RecursiveSync.MAX_FILES_ARGUMENT_NAME),
+                                    plan=getattr(args, RecursiveSync.PLAN_ARGUMENT_NAME),
+                                    journalPath=os.path.abspath(expand_user(args.resume)) if args.resume else None)
         else:
             command = Sync(agentPort=agentProtocolServerPort,
                            desktopPort=desktopProtocolServerPort,
@@ -1543,11 +2907,30 @@ def main():
                              desktopPort=desktopProtocolServerPort,
                              path=os.path.abspath(expand_user(getattr(args, Stream.PATH_ARGUMENT_NAME))))
     elif args.command == Refresh.COMMAND_NAME:
-        command = Refresh(agentPort=agentProtocolServerPort,
-                          desktopPort=desktopProtocolServerPort,
-                          folderPath=os.path.abspath(expand_user(getattr(args, Refresh.FOLDER_PATH_ARGUMENT_NAME))))
+        refreshPath = os.path.abspath(expand_user(getattr(args, Refresh.FOLDER_PATH_ARGUMENT_NAME)))
+        if getattr(args, RecursiveRefresh.COMMAND_NAME):
+            command = RecursiveRefresh(agentPort=agentProtocolServerPort,
+                                       desktopPort=desktopProtocolServerPort,
+                                       folderPath=refreshPath,
+                                       workers=getattr(args, RecursiveRefresh.WORKERS_ARGUMENT_NAME),
+                                       prune=getattr(args, RecursiveRefresh.PRUNE_ARGUMENT_NAME))
+        else:
+            command = Refresh(agentPort=agentProtocolServerPort,
+                              desktopPort=desktopProtocolServerPort,
+                              folderPath=refreshPath)
     elif args.command == Status.COMMAND_NAME:
-        if args.mounts:
+        if args.metrics:
+            command = MetricsStatus(agentPort=agentProtocolServerPort,
+                                    desktopPort=desktopProtocolServerPort,
+                                    metricsPath=os.path.abspath(expand_user(args.metrics)),
+                                    interval=args.interval,
+                                    registryPaths=(AGENT_PORT_REGISTRY_FILE_PATH, DESKTOP_PORT_REGISTRY_FILE_PATH))
+        elif args.transfers:
+            command = TransfersStatus(agentPort=agentProtocolServerPort,
+                                      desktopPort=desktopProtocolServerPort,
+                                      interval=args.interval,
+                                      top=args.top)
+        elif args.mounts:
             command = MountsStatus(agentPort=agentProtocolServerPort, desktopPort=desktopProtocolServerPort)
         elif args.backups:
             command = BackupsStatus(agentPort=agentProtocolServerPort, desktopPort=desktopProtocolServerPort)
@@ -1568,10 +2951,20 @@ def main():
         else:
             command = Status(agentPort=agentProtocolServerPort, desktopPort=desktopProtocolServerPort)
     elif args.command == SyncState.COMMAND_NAME:
-        command = SyncState(agentPort=agentProtocolServerPort,
-                            desktopPort=desktopProtocolServerPort,
-                            path=os.path.abspath(expand_user(getattr(args, SyncState.PATH_ARGUMENT_NAME))),
-                            textonly=args.textonly)
+        syncStatePath = os.path.abspath(expand_user(getattr(args, SyncState.PATH_ARGUMENT_NAME)))
+        if getattr(args, RecursiveSyncState.COMMAND_NAME):
+            command = RecursiveSyncState(agentPort=agentProtocolServerPort,
+                                         desktopPort=desktopProtocolServerPort,
+                                         folderPath=syncStatePath,
+                                         summary=getattr(args, RecursiveSyncState.SUMMARY_ARGUMENT_NAME),
+                                         depth=getattr(args, RecursiveSyncState.DEPTH_ARGUMENT_NAME),
+                                         workers=getattr(args, RecursiveSyncState.WORKERS_ARGUMENT_NAME),
+                                         maxAge=args.max_age)
+        else:
+            command = SyncState(agentPort=agentProtocolServerPort,
+                                desktopPort=desktopProtocolServerPort,
+                                path=syncStatePath,
+                                textonly=args.textonly)
     elif args.command == Unsync.COMMAND_NAME:
         if args.force:
             command = ForceUnsync(agentPort=agentProtocolServerPort,
@@ -1597,12 +2990,19 @@ def main():
         command = PlaceholderThreshold(agentPort=agentProtocolServerPort,
                               desktopPort=desktopProtocolServerPort,
                               threshold=getattr(args, PlaceholderThreshold.THRESHOLD_ARGUMENT_NAME))
+    elif args.command == FolderSyncRule.COMMAND_NAME and getattr(args, FolderSyncRules.FROM_ARGUMENT_NAME):
+        command = FolderSyncRules(agentPort=agentProtocolServerPort,
+                                  desktopPort=desktopProtocolServerPort,
+                                  rulesPath=os.path.abspath(expand_user(getattr(args, FolderSyncRules.FROM_ARGUMENT_NAME))),
+                                  force=getattr(args, FolderSyncRules.FORCE_ARGUMENT_NAME),
+                                  workers=getattr(args, FolderSyncRules.WORKERS_ARGUMENT_NAME))
     elif args.command == FolderSyncRule.COMMAND_NAME:
         command = FolderSyncRule(agentPort=agentProtocolServerPort,
                               desktopPort=desktopProtocolServerPort,
                               path=getattr(args, FolderSyncRule.LOCAL_PATH_ARGUMENT_NAME),
                               threshold=getattr(args, FolderSyncRule.THRESHOLD_ARGUMENT_NAME),
-                              expandSubfolders=getattr(args, FolderSyncRule.EXPAND_SUBFOLDERS_ARGUMENT_NAME))
+                              expandSubfolders=getattr(args, FolderSyncRule.EXPAND_SUBFOLDERS_ARGUMENT_NAME),
+                              record=True)
     elif args.command == EncPassphrase.COMMAND_NAME:
         command = EncPassphrase(agentPort=agentProtocolServerPort,
                                 desktopPort=desktopProtocolServerPort,
@@ -1619,7 +3019,21 @@ def main():
         print(INVALID_OPTION)
         sys.exit(1)
 
-    success = command.execute()
+    PROFILE.enabled = args.profile or bool(args.profile_json)
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler:
+        profiler.enable()
+    try:
+        success = command.execute()
+    finally:
+        # Recursive sync and interrupted commands exit from inside execute, so report on the way out
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(os.path.abspath(expand_user(args.cprofile)))
+        if args.profile:
+            PROFILE.print_summary()
+        if args.profile_json:
+            PROFILE.save_summary(os.path.abspath(expand_user(args.profile_json)))
 
     if success:
         sys.exit(0)
@@ -0,0 +1,159 @@
+from __future__ import print_function
+import sys
+import argparse
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import assemble_xl_file
+
+# Same thresholds the odrive agent offers for xlthreshold, in bytes (base 10)
+XL_THRESHOLDS = {
+    'small': 100 * 1000 * 1000,
+    'medium': 500 * 1000 * 1000,
+    'large': 1000 * 1000 * 1000,
+    'xlarge': 2000 * 1000 * 1000
+}
+CHUNK_SIZE = 4096 * 1024 #4MB
+
+class SegmentHasher(threading.Thread):
+    # Hashes the chunks of one segment as the reader hands them over, releasing one chunk slot per chunk
+    def __init__(self, hash_name, chunk_slots, worker_slots):
+        super(SegmentHasher, self).__init__()
+        self.daemon = True
+        self.segment_hash = None
+        self._hash = hashlib.new(hash_name)
+        self._chunks = queue.Queue()
+        self._chunk_slots = chunk_slots
+        self._worker_slots = worker_slots
+
+    def add_chunk(self, chunk):
+        self._chunk_slots.acquire()
+        self._chunks.put(chunk)
+
+    def finish(self):
+        self._chunks.put(None)
+
+    def run(self):
+        try:
+            while True:
+                chunk = self._chunks.get()
+                if chunk is None:
+                    break
+                self._hash.update(chunk)
+                self._chunk_slots.release()
+            self.segment_hash = self._hash.hexdigest()
+        finally:
+            self._worker_slots.release()
+
+def get_xl_folder_name(file_path, output_folder):
+    # assemble_xl_file strips the last 40 characters of the folder name to get the file name back
+    return os.path.join(output_folder, os.path.basename(file_path) + "." + uuid.uuid4().hex + ".xlarge")
+
+def split_xl_file(file_path, threshold, output_folder=None, workers=1, hash_name='sha1'):
+    file_size = os.path.getsize(file_path)
+    if not file_size:
+        print("Error: {} is empty".format(file_path))
+        return None
+    xl_folder = get_xl_folder_name(file_path, output_folder or os.path.dirname(os.path.abspath(file_path)))
+    os.mkdir(xl_folder)
+    worker_slots = threading.BoundedSemaphore(max(1, workers))
+    # Bounds memory to two chunks per worker no matter how far hashing falls behind reading
+    chunk_slots = threading.BoundedSemaphore(2 * max(1, workers))
+    segments = []
+
+    with open(file_path, 'rb') as in_file:
+        while True:
+            chunk = in_file.read(min(CHUNK_SIZE, threshold))
+            if not chunk:
+                break
+            worker_slots.acquire()
+            hasher = SegmentHasher(hash_name, chunk_slots, worker_slots)
+            hasher.start()
+            segment_file_name = os.path.join(xl_folder, ".segment-{}".format(len(segments)))
+            segment_size = 0
+            with open(segment_file_name, 'wb') as segment_file:
+                while chunk:
+                    segment_file.write(chunk)
+                    hasher.add_chunk(chunk)
+                    segment_size += len(chunk)
+                    if segment_size >= threshold:
+                        break
+                    chunk = in_file.read(min(CHUNK_SIZE, threshold - segment_size))
+            hasher.finish()
+            segments.append((segment_file_name, segment_size, hasher))
+
+    meta_file_contents = [assemble_xl_file.CLOUD_FORMAT_KEY,
+                          assemble_xl_file.CLOUD_FORMAT_VERSION_KEY + str(assemble_xl_file.CURRENT_VERSION),
+                          assemble_xl_file.XL_FORMAT_KEY,
+                          assemble_xl_file.XL_SIZE_KEY + str(file_size),
+                          assemble_xl_file.XL_THRESHOLD_KEY + str(threshold),
+                          assemble_xl_file.XL_SEGMENTS_KEY + str(len(segments))]
+    for segment_number, (segment_file_name, segment_size, hasher) in enumerate(segments):
+        hasher.join()
+        hashed_file_name = os.path.join(xl_folder, hasher.segment_hash)
+        if os.path.isfile(hashed_file_name):
+            # Identical segments share one file
+            os.remove(segment_file_name)
+        else:
+            os.rename(segment_file_name, hashed_file_name)
+        meta_file_contents.append(assemble_xl_file.XL_SEGMENT_NUMBER_KEY + str(segment_number))
+        meta_file_contents.append(assemble_xl_file.XL_SEGMENT_SIZE_KEY + str(segment_size))
+        meta_file_contents.append(assemble_xl_file.XL_SEGMENT_HASH_KEY + hasher.segment_hash)
+    # The .meta goes in last, until then assemble_xl_file treats the folder as incomplete
+    with open(os.path.join(xl_folder, ".meta"), 'wb') as meta_file:
+        meta_file.write(u"\n".join(meta_file_contents).encode('utf-8'))
+    return xl_folder
+
+def get_threshold(value):
+    if value in XL_THRESHOLDS:
+        return XL_THRESHOLDS[value]
+    try:
+        threshold = int(value)
+    except ValueError:
+        threshold = 0
+    if threshold <= 0:
+        raise argparse.ArgumentTypeError("choose from {} or give a size in bytes".format(", ".join(sorted(XL_THRESHOLDS))))
+    return threshold
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(u"--path", type=str, help=u"The file to split into an xl folder", required=True)
+    parser.add_argument(u"--threshold", type=get_threshold, default='large', help=u"Segment size: small (100MB), medium (500MB), large (1GB), xlarge (2GB) or a size in bytes. Default is large", required=False)
+    parser.add_argument(u"--output", type=str, help=u"Folder to create the xl folder in. Default is next to the file", required=False)
+    parser.add_argument(u"--workers", type=int, default=multiprocessing.cpu_count(), help=u"Number of segments to hash at once. Default is the number of CPUs", required=False)
+    parser.add_argument(u"--hash", type=str, default='sha1', choices=['md5', 'sha1', 'sha256'], help=u"Hash used to name the segment files. Default is sha1", required=False)
+    return parser.parse_args()
+
+def main():
+    args = get_arguments()
+    file_path = args.path
+    output_folder = args.output
+    if sys.platform.startswith('win32'):
+        file_path = u"\\\\?\\" + file_path
+        if output_folder:
+            output_folder = u"\\\\?\\" + output_folder
+
+    if not os.path.isfile(file_path):
+        print("Error: File {} not found".format(file_path))
+        sys.exit(1)
+    start_time = time.time()
+    xl_folder = split_xl_file(file_path, args.threshold, output_folder, args.workers, args.hash)
+    if not xl_folder:
+        sys.exit(1)
+    elapsed = time.time() - start_time
+    file_size = os.path.getsize(file_path)
+    print(file_path + " split into " + xl_folder)
+    print("{} in {:.1f}s ({}/s)".format(assemble_xl_file.format_size(file_size), elapsed,
+                                        assemble_xl_file.format_size(file_size / elapsed if elapsed else 0)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# Shared fixtures for the encryption tests, which need pycrypto/pycryptodome or cryptography
+import io
+import unittest
+
+import decrypt_odrive_file
+import encrypt_odrive_file
+
+PASSWORD = u"correct horse battery staple"
+BUFFER_SIZE = 4 * decrypt_odrive_file.AES_BLOCK_SIZE
+
+
+def encrypt(data, buffer_size=BUFFER_SIZE):
+    out_file = io.BytesIO()
+    encrypt_odrive_file.encrypt_file(io.BytesIO(data), out_file, PASSWORD, buffer_size)
+    return out_file.getvalue()
+
+
+def decrypt(encrypted, password=PASSWORD, buffer_size=BUFFER_SIZE):
+    out_file = io.BytesIO()
+    valid = decrypt_odrive_file.decrypt_file(io.BytesIO(encrypted), out_file, password, buffer_size, verbose=False)
+    return valid, out_file.getvalue()
+
+
+class BackendTestCase(unittest.TestCase):
+    def tearDown(self):
+        decrypt_odrive_file.set_crypto_backend()
+
+    def for_each_backend(self, test):
+        for backend in decrypt_odrive_file.get_crypto_backends():
+            decrypt_odrive_file.set_crypto_backend(backend)
+            test(backend)
@@ -0,0 +1,168 @@
+# Shared fixtures for the tests. Nothing here needs a crypto library, the encryption tests import their own.
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import unittest
+
+import assemble_xl_file
+import odrivecli
+import split_xl_file
+from benchmarks import fake_agent, generators
+
+SEGMENT_SIZE = 64 * 1024
+
+
+class Output(object):
+    # Collects what is printed, on Python 2 and 3
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def getvalue(self):
+        return u"".join(self.parts)
+
+
+def write_partial(xl_folder, data, segments_done, damaged=False):
+    # What an interrupted assembly leaves behind once it has written segments_done segments, the last one damaged or not
+    segments = assemble_xl_file.read_xl_segments(xl_folder)
+    partial_file_name = assemble_xl_file.get_out_file_name(xl_folder) + assemble_xl_file.PARTIAL_SUFFIX
+    last_segment = segments[segments_done - 1]
+    partial = bytearray(data[:last_segment.segment_offset + last_segment.segment_size])
+    if damaged:
+        partial[-1] ^= 1
+    with open(partial_file_name, 'wb') as partial_file:
+        partial_file.write(partial)
+    return partial_file_name
+
+
+class XLFolderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix=u"odrive-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def make_xl_folder(self, size, name=u"data.bin", seed=0, **split_arguments):
+        # Splits a synthetic file and keeps its contents to compare against
+        folder = os.path.join(self.folder, str(seed))
+        if not os.path.isdir(folder):
+            os.mkdir(folder)
+        file_path = generators.write_data_file(os.path.join(folder, name), size, seed)
+        with open(file_path, 'rb') as data_file:
+            data = data_file.read()
+        xl_folder = split_xl_file.split_xl_file(file_path, SEGMENT_SIZE, folder, **split_arguments)
+        os.remove(file_path)
+        return xl_folder, data
+
+    def read_file(self, file_path):
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+
+class RecordingFakeAgent(fake_agent.FakeAgent):
+    # Keeps every request it is sent, in order
+    def __init__(self, *args, **kwargs):
+        super(RecordingFakeAgent, self).__init__(*args, **kwargs)
+        self.received = []
+
+    def handle(self, line, out_file):
+        try:
+            request = json.loads(line.decode('utf-8'))
+        except ValueError:
+            request = None
+        with self._lock:
+            self.received.append(request)
+        super(RecordingFakeAgent, self).handle(line, out_file)
+
+    def get_paths(self, command, parameter, folder):
+        # The paths sent with each command, relative to folder and without placeholder extensions
+        paths = []
+        for request in list(self.received):
+            if isinstance(request, dict) and request.get('command') == command:
+                path = self._get_synced_path(request['parameters'][parameter])
+                paths.append(os.path.relpath(path, folder).replace(os.sep, u"/"))
+        return paths
+
+
+class FakeAgentTestCase(unittest.TestCase):
+    # A fake agent serving a generated remote tree into a mount folder. HOME points into the test folder, so that
+    # odrivecli finds the agent there and keeps its files in a temporary ~/.odrive-utilities, and what odrivecli
+    # prints is captured
+    DEPTH = 1
+    FOLDERS = 2
+    FILES = 2
+    FILE_SIZE = 0
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix=u"odrive-test-")
+        self.remote = os.path.join(self.folder, u"remote")
+        self.mount = os.path.join(self.folder, u"mount")
+        self.home = os.path.join(self.folder, u"home")
+        os.mkdir(self.remote)
+        os.mkdir(self.home)
+        generators.make_remote_tree(self.remote, self.DEPTH, self.FOLDERS, self.FILES, self.FILE_SIZE)
+        self.agent = RecordingFakeAgent(self.mount, self.remote, **self.get_agent_arguments())
+        self.port = self.agent.start()
+        self.agent.write_registry(self.home)
+        self._home = os.environ.get('HOME')
+        os.environ['HOME'] = self.home
+        self._signal_handlers = [(signum, signal.getsignal(signum)) for signum in (signal.SIGINT, signal.SIGTERM)]
+        self._stdout, self._stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = Output(), Output()
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+        # Synchronous commands set their own interrupt handlers
+        for signum, handler in self._signal_handlers:
+            signal.signal(signum, handler)
+        if self._home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = self._home
+        self.agent.stop()
+        shutil.rmtree(self.folder)
+
+    def get_agent_arguments(self):
+        return {}
+
+    def get_stdout(self):
+        return sys.stdout.getvalue()
+
+    def get_stderr(self):
+        return sys.stderr.getvalue()
+
+    def get_argv(self, argv):
+        # Arguments are native strings, as sys.argv holds bytes on Python 2
+        return ["odrivecli.py"] + [argument if isinstance(argument, str) else argument.encode(sys.getfilesystemencoding())
+                                   for argument in argv]
+
+    def parse_args(self, *argv):
+        argv, sys.argv = sys.argv, self.get_argv(argv)
+        try:
+            return odrivecli.parse_args()
+        finally:
+            sys.argv = argv
+
+    def run_main(self, *argv):
+        # Runs odrivecli as the command line would, and returns the code it exits with
+        argv, sys.argv = sys.argv, self.get_argv(argv)
+        try:
+            odrivecli.main()
+        except SystemExit as e:
+            return e.code
+        finally:
+            sys.argv = argv
+
+    def get_synced_paths(self):
+        return self.agent.get_paths(u"sync", u"placeholderPath", self.mount)
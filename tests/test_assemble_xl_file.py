@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+import unittest
+
+import assemble_xl_file
+from tests.support import SEGMENT_SIZE, XLFolderTestCase
+
+
+class AssembleTest(XLFolderTestCase):
+    def test_round_trip(self):
+        for size in (1, SEGMENT_SIZE - 1, SEGMENT_SIZE, SEGMENT_SIZE + 1, 5 * SEGMENT_SIZE + 123):
+            xl_folder, data = self.make_xl_folder(size, seed=size)
+            self.assertEqual(len(assemble_xl_file.read_xl_segments(xl_folder)), -(-size // SEGMENT_SIZE))
+            self.assertEqual(assemble_xl_file.assemble_one_xl_file(xl_folder), size)
+            out_file_name = assemble_xl_file.get_out_file_name(xl_folder)
+            self.assertEqual(self.read_file(out_file_name), data)
+            self.assertFalse(os.path.exists(out_file_name + assemble_xl_file.PARTIAL_SUFFIX))
+
+    def test_existing_file_is_kept(self):
+        xl_folder, data = self.make_xl_folder(SEGMENT_SIZE)
+        out_file_name = assemble_xl_file.get_out_file_name(xl_folder)
+        with open(out_file_name, 'wb') as out_file:
+            out_file.write(b"mine")
+        self.assertEqual(assemble_xl_file.assemble_one_xl_file(xl_folder), 0)
+        self.assertEqual(self.read_file(out_file_name), b"mine")
+
+    def test_not_an_xl_folder(self):
+        self.assertEqual(assemble_xl_file.assemble_one_xl_file(self.folder), 0)
+
+    def test_recursive(self):
+        xl_folders = [self.make_xl_folder(3 * SEGMENT_SIZE, seed=seed) for seed in range(3)]
+        assemble_xl_file.assemble_all_xl_files(self.folder, workers=2)
+        for xl_folder, data in xl_folders:
+            self.assertEqual(self.read_file(assemble_xl_file.get_out_file_name(xl_folder)), data)
+
+    def assemble_all_counting(self, **arguments):
+        # The most xl files assembled at once
+        assemble_one_xl_file = assemble_xl_file.assemble_one_xl_file
+        lock = threading.Lock()
+        counts = {'running': 0, 'most': 0}
+
+        def counting(xl_folder, store=None):
+            with lock:
+                counts['running'] += 1
+                counts['most'] = max(counts['most'], counts['running'])
+            try:
+                time.sleep(0.1)
+                return assemble_one_xl_file(xl_folder, store)
+            finally:
+                with lock:
+                    counts['running'] -= 1
+
+        assemble_xl_file.assemble_one_xl_file = counting
+        try:
+            assemble_xl_file.assemble_all_xl_files(self.folder, **arguments)
+        finally:
+            assemble_xl_file.assemble_one_xl_file = assemble_one_xl_file
+        return counts['most']
+
+    def test_workers(self):
+        # Every folder is on the same disk, eg. a RAID array, which all the workers assemble from
+        for seed in range(4):
+            self.make_xl_folder(SEGMENT_SIZE, seed=seed)
+        self.assertEqual(self.assemble_all_counting(workers=2), 2)
+
+    def test_device_workers(self):
+        # A lower per-disk limit holds the other workers back when there is only one disk
+        for seed in range(4):
+            self.make_xl_folder(SEGMENT_SIZE, seed=seed)
+        self.assertEqual(self.assemble_all_counting(workers=4, device_workers=1), 1)
+        for xl_folder in assemble_xl_file.find_all_xl_folders(self.folder):
+            os.remove(assemble_xl_file.get_out_file_name(xl_folder))
+        self.assertEqual(self.assemble_all_counting(workers=3, device_workers=4), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import unittest
+
+import decrypt_odrive_file
+from tests.crypto_support import BUFFER_SIZE, BackendTestCase, decrypt, encrypt
+
+
+class CryptoBackendTest(BackendTestCase):
+    def test_default_is_the_fastest_available(self):
+        decrypt_odrive_file.set_crypto_backend()
+        self.assertEqual(decrypt_odrive_file.crypto_backend, decrypt_odrive_file.get_crypto_backends()[0])
+
+    def test_unavailable_backend(self):
+        self.assertRaises(ValueError, decrypt_odrive_file.set_crypto_backend, u"missing")
+
+    def test_keys_are_the_same(self):
+        salt = b"saltsalt"
+        keys = []
+        for backend in decrypt_odrive_file.get_crypto_backends():
+            decrypt_odrive_file.set_crypto_backend(backend)
+            keys.append(decrypt_odrive_file.derive_key(salt, u"password"))
+        self.assertEqual(len(set(keys)), 1)
+        self.assertEqual(len(keys[0]), decrypt_odrive_file.KEY_LENGTH)
+
+    def test_backends_are_compatible(self):
+        backends = decrypt_odrive_file.get_crypto_backends()
+        data = os.urandom(2 * BUFFER_SIZE + 3)
+        for encrypt_backend in backends:
+            decrypt_odrive_file.set_crypto_backend(encrypt_backend)
+            encrypted = encrypt(data)
+            for decrypt_backend in backends:
+                decrypt_odrive_file.set_crypto_backend(decrypt_backend)
+                self.assertEqual(decrypt(encrypted), (True, data))
+
+
+if __name__ == "__main__":
+    unittest.main()
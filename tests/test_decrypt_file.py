@@ -0,0 +1,38 @@
+import os
+import unittest
+
+import decrypt_odrive_file
+from tests.crypto_support import BUFFER_SIZE, BackendTestCase, decrypt, encrypt
+
+
+class DecryptFileTest(BackendTestCase):
+    SIZES = (0, 1, 15, 16, 17, BUFFER_SIZE - 1, BUFFER_SIZE, BUFFER_SIZE + 1, 10 * BUFFER_SIZE + 5)
+
+    def test_round_trip(self):
+        def test(backend):
+            for size in self.SIZES:
+                data = os.urandom(size)
+                encrypted = encrypt(data)
+                header_size = decrypt_odrive_file.VERSION_LENGTH + decrypt_odrive_file.SALT_LENGTH + decrypt_odrive_file.AES_BLOCK_SIZE
+                self.assertEqual((len(encrypted) - header_size) % decrypt_odrive_file.AES_BLOCK_SIZE, 0)
+                self.assertEqual(decrypt(encrypted), (True, data), "{} bytes with {}".format(size, backend))
+        self.for_each_backend(test)
+
+    def test_buffer_sizes_do_not_change_the_plaintext(self):
+        data = os.urandom(3 * BUFFER_SIZE + 7)
+        encrypted = encrypt(data, buffer_size=BUFFER_SIZE + 3)
+        for buffer_size in (1, decrypt_odrive_file.AES_BLOCK_SIZE, BUFFER_SIZE + 5, 1024 * 1024):
+            self.assertEqual(decrypt(encrypted, buffer_size=buffer_size), (True, data))
+
+    def test_wrong_password(self):
+        encrypted = encrypt(os.urandom(100))
+        try:
+            valid = decrypt(encrypted, password=u"wrong")[0]
+        except (ValueError, IndexError):
+            # The padding can't be removed from garbage
+            valid = False
+        self.assertFalse(valid)
+
+
+if __name__ == "__main__":
+    unittest.main()
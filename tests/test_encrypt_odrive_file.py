@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import decrypt_odrive_file
+import encrypt_odrive_file
+from tests.crypto_support import BUFFER_SIZE, PASSWORD, BackendTestCase
+from tests.support import Output
+
+
+class NameEncryptionTest(BackendTestCase):
+    NAMES = (u"a", u"report.pdf", u"x" * 100, u"café über.txt", u"文件.cloud")
+
+    def test_round_trip(self):
+        def test(backend):
+            for name in self.NAMES:
+                encrypted = encrypt_odrive_file.encrypt_name(name, PASSWORD)
+                self.assertNotEqual(encrypted, name)
+                self.assertEqual(decrypt_odrive_file.decrypt_name(encrypted, PASSWORD), name)
+        self.for_each_backend(test)
+
+    def test_unencrypted_names(self):
+        self.assertEqual(decrypt_odrive_file.decrypt_name(u"plain.txt.oenc", PASSWORD), u"plain.txt")
+        output = Output()
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            for name in (u"plain.txt", u"café", u"AAAA"):
+                self.assertEqual(decrypt_odrive_file.decrypt_name(name, PASSWORD, quiet=True),
+                                 decrypt_odrive_file.INVALID_NAME)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output.parts, [])
+
+    def test_wrong_password(self):
+        encrypted = encrypt_odrive_file.encrypt_name(u"secret.txt", PASSWORD)
+        self.assertEqual(decrypt_odrive_file.decrypt_name(encrypted, u"wrong", quiet=True),
+                         decrypt_odrive_file.INVALID_NAME)
+
+
+
+class EncryptTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix=u"odrive-test-")
+        self.plaintext = os.path.join(self.folder, u"docs")
+        self.output = os.path.join(self.folder, u"output")
+        os.makedirs(os.path.join(self.plaintext, u"sub"))
+        os.mkdir(self.output)
+        self.files = {u"a.txt": os.urandom(10), os.path.join(u"sub", u"b.bin"): os.urandom(3 * BUFFER_SIZE + 1),
+                      u"empty": b""}
+        for name, data in self.files.items():
+            with open(os.path.join(self.plaintext, name), 'wb') as f:
+                f.write(data)
+        open(os.path.join(self.plaintext, u"skipped.cloud"), 'wb').close()
+        self._stdout, sys.stdout = sys.stdout, Output()
+
+    def tearDown(self):
+        sys.stdout = self._stdout
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        encrypted_folder, results = encrypt_odrive_file.encrypt_tree(self.plaintext, PASSWORD, self.output, workers=2,
+                                                                     buffer_size=BUFFER_SIZE, verify=True)
+        self.assertEqual(sorted(os.path.relpath(file_path, self.plaintext) for file_path, _ in results), sorted(self.files))
+        self.assertTrue(all(encrypted_path for _, encrypted_path in results))
+        self.assertEqual(os.listdir(self.output), [os.path.basename(encrypted_folder)])
+        # Decrypting the encrypted tree in place gives the plaintext back, next to the encrypted files
+        args = argparse.Namespace(password=PASSWORD, nameonly=False, renamefolder=True, buffersize=1, quarantine=None,
+                                  filter=None, delimiter=u";", recursive=True)
+        self.assertEqual(decrypt_odrive_file.all_files(args, self.output), set())
+        for name, data in self.files.items():
+            with open(os.path.join(self.output, u"docs", name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+        self.assertNotIn(u"Error", sys.stdout.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
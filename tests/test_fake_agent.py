@@ -0,0 +1,72 @@
+import os
+import time
+import unittest
+
+import odrivecli
+from benchmarks import fake_agent
+from tests.support import FakeAgentTestCase
+
+
+class FakeAgentTest(FakeAgentTestCase):
+    FILE_SIZE = 1000
+
+    def get_sync_states(self, port, path):
+        command = odrivecli.QuietSyncState(agentPort=port, desktopPort=None, path=path)
+        self.assertTrue(command.execute())
+        return command.syncState, command.childSyncStates
+
+    def test_placeholders(self):
+        self.assertEqual(sorted(os.listdir(self.mount)),
+                         [u"file0.txt.cloud", u"file1.txt.cloud", u"folder0.cloudf", u"folder1.cloudf"])
+        self.assertEqual(self.get_sync_states(self.port, self.mount), (u"Synced", {
+            u"file0.txt": u"NotSynced", u"file1.txt": u"NotSynced", u"folder0": u"NotSynced", u"folder1": u"NotSynced"}))
+
+    def test_sync(self):
+        placeholderPath = os.path.join(self.mount, u"folder0.cloudf")
+        self.assertTrue(odrivecli.Sync(agentPort=self.port, desktopPort=None, placeholderPath=placeholderPath).execute())
+        self.assertEqual(sorted(os.listdir(os.path.join(self.mount, u"folder0"))), [u"file0.txt.cloud", u"file1.txt.cloud"])
+        placeholderPath = os.path.join(self.mount, u"folder0", u"file1.txt.cloud")
+        self.assertTrue(odrivecli.Sync(agentPort=self.port, desktopPort=None, placeholderPath=placeholderPath).execute())
+        with open(os.path.join(self.mount, u"folder0", u"file1.txt"), 'rb') as f:
+            with open(os.path.join(self.remote, u"folder0", u"file1.txt"), 'rb') as remote_file:
+                self.assertEqual(f.read(), remote_file.read())
+        self.assertFalse(os.path.exists(placeholderPath))
+
+    def test_fail_pattern(self):
+        self.agent.fail_pattern = u"file1*"
+        placeholderPath = os.path.join(self.mount, u"file1.txt.cloud")
+        self.assertTrue(odrivecli.Sync(agentPort=self.port, desktopPort=None, placeholderPath=placeholderPath).execute())
+        self.assertIn(u"Injected failure", self.get_stderr())
+        self.assertTrue(os.path.exists(placeholderPath))
+
+    def test_latency(self):
+        self.agent.latency = 200
+        startTime = time.time()
+        self.get_sync_states(self.port, self.mount)
+        self.assertGreaterEqual(time.time() - startTime, 0.2)
+
+    def test_record_and_replay(self):
+        # A recording agent in front of the fake one, then a replaying one on its own
+        recordPath = os.path.join(self.folder, u"sessions")
+        recorder = fake_agent.FakeAgent(record_file=recordPath, upstream_port=self.port)
+        recorderPort = recorder.start()
+        try:
+            recorded = self.get_sync_states(recorderPort, self.mount)
+        finally:
+            recorder.stop()
+        self.assertEqual(recorded, self.get_sync_states(self.port, self.mount))
+        replayer = fake_agent.FakeAgent(replay_file=recordPath, speed=10)
+        replayerPort = replayer.start()
+        try:
+            self.assertEqual(self.get_sync_states(replayerPort, self.mount), recorded)
+            # Requests that were not recorded get an error
+            command = odrivecli.QuietSyncState(agentPort=replayerPort, desktopPort=None, path=self.remote)
+            self.assertTrue(command.execute())
+            self.assertEqual(len(command.errors), 1)
+        finally:
+            replayer.stop()
+        self.assertEqual(replayer.requests, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
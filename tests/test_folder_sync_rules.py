@@ -0,0 +1,104 @@
+import json
+import os
+import time
+import unittest
+
+import odrivecli
+from tests.support import FakeAgentTestCase
+
+
+class FolderSyncRulesTest(FakeAgentTestCase):
+    def setUp(self):
+        super(FolderSyncRulesTest, self).setUp()
+        for name in (u"folder0", u"folder1"):
+            self.assertTrue(odrivecli.Sync(agentPort=self.port, desktopPort=None,
+                                           placeholderPath=os.path.join(self.mount, name + u".cloudf")).execute())
+        self.rulesPath = os.path.join(self.folder, u"rules")
+        self.sentPath = os.path.join(self.home, odrivecli.UTILITIES_DATA_FOLDER_NAME,
+                                     odrivecli.FolderSyncRules._SENT_FILE_NAME)
+
+    def get_sent_rules(self, count):
+        # Rules are sent without an answer, so wait for the agent to have them
+        for _ in range(100):
+            rules = [request[u"parameters"] for request in self.agent.received
+                     if isinstance(request, dict) and request.get(u"command") == odrivecli.FolderSyncRule.COMMAND_NAME]
+            if len(rules) >= count:
+                break
+            time.sleep(0.01)
+        return sorted((rule[u"path"], rule[u"threshold"], rule[u"expandsubfolders"]) for rule in rules)
+
+    def write_rules(self, *rules):
+        with open(self.rulesPath, 'w') as f:
+            f.write(u"# Rules\n" + u"".join(json.dumps(rule) + u"\n" for rule in rules))
+
+    def get_recorded(self):
+        with open(self.sentPath) as f:
+            return json.load(f)
+
+    def send_rules(self, *arguments):
+        del self.agent.received[:]
+        printed = len(self.get_stdout())
+        code = self.run_main("foldersyncrule", "--from", self.rulesPath, *arguments)
+        return code, self.get_stdout()[printed:]
+
+    def test_from(self):
+        folder0, folder1 = os.path.join(self.mount, u"folder0"), os.path.join(self.mount, u"folder1")
+        self.write_rules({u"path": folder0, u"threshold": u"100", u"expandsubfolders": True},
+                         {u"path": folder1, u"threshold": u"0"})
+        code, output = self.send_rules()
+        self.assertEqual(code, 0)
+        self.assertTrue(output.startswith(u"Sent 2 rules, skipped 0 unchanged in "))
+        self.assertEqual(self.get_sent_rules(2), [(folder0, u"100", True), (folder1, u"0", False)])
+        self.assertEqual(self.get_recorded(), {folder0: [u"100", True], folder1: [u"0", False]})
+        # Only what changed since is sent
+        code, output = self.send_rules()
+        self.assertTrue(output.startswith(u"Sent 0 rules, skipped 2 unchanged in "))
+        self.write_rules({u"path": folder0, u"threshold": u"100", u"expandsubfolders": True},
+                         {u"path": folder1, u"threshold": u"inf"})
+        code, output = self.send_rules()
+        self.assertTrue(output.startswith(u"Sent 1 rules, skipped 1 unchanged in "))
+        self.assertEqual(self.get_sent_rules(1), [(folder1, u"inf", False)])
+        # Unless every rule is asked for
+        code, output = self.send_rules("--force")
+        self.assertTrue(output.startswith(u"Sent 2 rules, skipped 0 unchanged in "))
+        self.assertEqual(len(self.get_sent_rules(2)), 2)
+
+    def test_invalid(self):
+        self.write_rules({u"path": self.mount, u"threshold": u"10"},
+                         {u"path": os.path.join(self.mount, u"missing"), u"threshold": u"10"},
+                         {u"path": self.mount, u"threshold": u"lots"})
+        with open(self.rulesPath, 'a') as f:
+            f.write(u"not json\n")
+        code, output = self.send_rules()
+        self.assertEqual(code, 1)
+        self.assertIn(u", 3 invalid in ", output)
+        self.assertIn(u"Invalid rule on line 5 of", self.get_stderr())
+        # The last valid rule for a path wins
+        self.assertEqual(self.get_recorded(), {self.mount: [u"10", False]})
+
+    def test_single_rule(self):
+        # A rule sent on its own is recorded, so a file with the same rule does not send it again
+        folder0 = os.path.join(self.mount, u"folder0")
+        self.assertEqual(self.run_main("foldersyncrule", folder0, "50", "--expandsubfolders"), 0)
+        self.assertEqual(self.get_sent_rules(1), [(folder0, u"50", True)])
+        self.assertEqual(self.get_recorded(), {folder0: [u"50", True]})
+        self.write_rules({u"path": folder0, u"threshold": u"50", u"expandsubfolders": True})
+        code, output = self.send_rules()
+        self.assertTrue(output.startswith(u"Sent 0 rules, skipped 1 unchanged in "))
+
+    def test_single_invalid_rule(self):
+        self.assertEqual(self.run_main("foldersyncrule", self.mount, "lots"), 0)
+        self.assertIn(u"Invalid threshold specified", self.get_stdout())
+        self.assertFalse(os.path.exists(self.sentPath))
+
+    def test_arguments(self):
+        args = self.parse_args("foldersyncrule", "--from", "rules", "--force")
+        self.assertEqual(getattr(args, odrivecli.FolderSyncRules.FROM_ARGUMENT_NAME), u"rules")
+        self.assertEqual(getattr(args, odrivecli.FolderSyncRule.THRESHOLD_ARGUMENT_NAME), None)
+        for argv in (("foldersyncrule",), ("foldersyncrule", "folder")):
+            self.assertRaises(SystemExit, self.parse_args, *argv)
+        self.assertEqual(self.get_stderr().count(u"the following arguments are required: path, threshold (or --from FILE)"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
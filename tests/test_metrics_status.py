@@ -0,0 +1,97 @@
+import os
+import unittest
+
+import odrivecli
+from tests.support import FakeAgentTestCase, RecordingFakeAgent
+
+
+class PollingMetricsStatus(odrivecli.MetricsStatus):
+    # Calls on_poll with the port it polled and the metrics it wrote, after every poll
+    def __init__(self, on_poll, **kwargs):
+        super(PollingMetricsStatus, self).__init__(**kwargs)
+        self.on_poll = on_poll
+
+    def _write_metrics(self, message):
+        super(PollingMetricsStatus, self)._write_metrics(message)
+        with open(self.metricsPath) as f:
+            self.on_poll(self._agentPort, f.read())
+
+
+class MetricsStatusTest(FakeAgentTestCase):
+    def setUp(self):
+        super(MetricsStatusTest, self).setUp()
+        self.metricsPath = os.path.join(self.folder, u"odrive.prom")
+
+    def get_agent_arguments(self):
+        return {'status_items': 3}
+
+    def get_metrics(self, metrics):
+        # Samples by name, labels included
+        return dict(line.rsplit(u" ", 1) for line in metrics.splitlines() if not line.startswith(u"#"))
+
+    def test_metrics(self):
+        self.assertEqual(self.run_main("status", "--metrics", self.metricsPath), 0)
+        with open(self.metricsPath) as f:
+            metrics = self.get_metrics(f.read())
+        self.assertEqual(metrics[u"odrive_up"], u"1")
+        self.assertEqual(metrics[u"odrive_uploads"], u"3")
+        self.assertEqual(metrics[u"odrive_downloads"], u"3")
+        self.assertEqual(metrics[u"odrive_mounts"], u"1")
+        self.assertEqual(metrics[u"odrive_threshold_info{threshold=\"xlFileThreshold\",value=\"large\"}"], u"1")
+        self.assertFalse(os.path.exists(self.metricsPath + u".tmp"))
+
+    def test_unexpected_status(self):
+        # A status the metrics can't be read from is reported, and the agent is not reported as down
+        self.assertEqual(self.run_main("status", "--metrics", self.metricsPath), 0)
+        with open(self.metricsPath) as f:
+            metrics = f.read()
+        self.agent._command_status = lambda parameters, out_file: self.agent._send_status(out_file, {'backupJobs': 5})
+        self.assertEqual(self.run_main("status", "--metrics", self.metricsPath), 0)
+        self.assertIn(u"Unable to write metrics from the status: ", self.get_stderr())
+        with open(self.metricsPath) as f:
+            self.assertEqual(f.read(), metrics)
+
+    def test_down(self):
+        self.agent.stop()
+        self.assertEqual(self.run_main("status", "--metrics", self.metricsPath), 1)
+        with open(self.metricsPath) as f:
+            metrics = self.get_metrics(f.read())
+        self.assertEqual(metrics[u"odrive_up"], u"0")
+        self.assertNotIn(u"odrive_last_status_timestamp_seconds", metrics)
+
+    def test_agent_restart(self):
+        # odrive comes back on another port, which the next poll finds in the registry
+        registryPath = os.path.join(self.home, u".odrive-agent", u".oreg")
+        polls = []
+
+        def on_poll(port, metrics):
+            polls.append((port, self.get_metrics(metrics)[u"odrive_up"]))
+            if len(polls) == 1:
+                self.agent.stop()
+                self.agent = RecordingFakeAgent(self.mount, self.remote)
+                self.agent.start()
+                self.agent.write_registry(self.home)
+            elif len(polls) == 2:
+                self.agent.stop()
+                os.remove(registryPath)
+            else:
+                raise KeyboardInterrupt()
+
+        command = PollingMetricsStatus(on_poll, agentPort=self.port, desktopPort=None, metricsPath=self.metricsPath,
+                                       interval=0.01,
+                                       registryPaths=(registryPath, os.path.join(self.home, u".odrive", u".oreg")))
+        self.assertRaises(KeyboardInterrupt, command.execute)
+        self.assertEqual(polls[0], (self.port, u"1"))
+        self.assertNotEqual(polls[1][0], self.port)
+        self.assertEqual(polls[1][1], u"1")
+        self.assertEqual(polls[2], (None, u"0"))
+
+    def test_interval_arguments(self):
+        self.assertEqual(self.parse_args("status", "--metrics", "odrive.prom", "--interval", "5").interval, 5)
+        self.assertEqual(self.parse_args("status", "--transfers", "--interval", "5").interval, 5)
+        self.assertRaises(SystemExit, self.parse_args, "status", "--interval", "5")
+        self.assertIn(u"--interval is only used with --metrics or --transfers", self.get_stderr())
+
+
+if __name__ == "__main__":
+    unittest.main()
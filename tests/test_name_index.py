@@ -0,0 +1,98 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import decrypt_odrive_file
+import encrypt_odrive_file
+from tests.crypto_support import PASSWORD
+from tests.support import Output
+
+
+class NameIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix=u"odrive-test-")
+        self.root = os.path.join(self.folder, u"root")
+        os.mkdir(self.root)
+        self.index_path = os.path.join(self.folder, u"index.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def add_file(self, folder, name, password=PASSWORD):
+        path = os.path.join(folder, encrypt_odrive_file.encrypt_name(name, password))
+        with open(path, 'wb'):
+            pass
+        return path
+
+    def update(self, password=PASSWORD):
+        output = Output()
+        stdout, sys.stdout = sys.stdout, output
+        name_index = decrypt_odrive_file.NameIndex(self.index_path)
+        try:
+            name_index.update(self.root, password)
+            return name_index, u"".join(output.parts)
+        finally:
+            sys.stdout = stdout
+
+    def test_lookup(self):
+        folder = os.path.join(self.root, encrypt_odrive_file.encrypt_name(u"docs", PASSWORD))
+        os.mkdir(folder)
+        os.mkdir(os.path.join(self.root, u"plain folder"))
+        path = self.add_file(folder, u"report.pdf")
+        name_index, output = self.update()
+        try:
+            self.assertEqual(output, u"")
+            self.assertEqual(name_index.lookup(u"report.pdf"),
+                             [(os.path.relpath(path, self.root), os.path.join(u"docs", u"report.pdf"))])
+            self.assertEqual(name_index.count(), 2)
+        finally:
+            name_index.close()
+
+    def test_search(self):
+        folder = os.path.join(self.root, encrypt_odrive_file.encrypt_name(u"photos", PASSWORD))
+        os.mkdir(folder)
+        for name in (u"a.jpg", u"b.jpg", u"c.png"):
+            self.add_file(folder, name)
+        name_index = self.update()[0]
+        try:
+            self.assertEqual([plaintext_path for _, plaintext_path in name_index.search(u"*.jpg")],
+                             [os.path.join(u"photos", u"a.jpg"), os.path.join(u"photos", u"b.jpg")])
+            self.assertEqual(len(name_index.search(os.path.join(u"photos", u"*"))), 3)
+        finally:
+            name_index.close()
+
+    def test_updates_only_changed_folders(self):
+        self.add_file(self.root, u"a.txt")
+        self.update()[0].close()
+        self.add_file(self.root, u"b.txt")
+        name_index = self.update()[0]
+        try:
+            self.assertEqual(name_index.names_decrypted, 1)
+            self.assertEqual(name_index.count(), 2)
+        finally:
+            name_index.close()
+
+    def test_rebuilds_for_another_password(self):
+        self.add_file(self.root, u"a.txt")
+        name_index, output = self.update(password=u"wrong")
+        name_index.close()
+        name_index, output = self.update()
+        try:
+            self.assertIn(u"different password", output)
+            self.assertEqual([plaintext_path for _, plaintext_path in name_index.lookup(u"a.txt")], [u"a.txt"])
+        finally:
+            name_index.close()
+
+    def test_other_root(self):
+        self.update()[0].close()
+        name_index = decrypt_odrive_file.NameIndex(self.index_path)
+        try:
+            self.assertRaises(ValueError, name_index.update, self.folder, PASSWORD)
+        finally:
+            name_index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
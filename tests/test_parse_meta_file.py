@@ -0,0 +1,40 @@
+import sys
+import unittest
+
+import assemble_xl_file
+from benchmarks import generators
+from tests.support import Output
+
+
+class ParseMetaFileTest(unittest.TestCase):
+    def test_segments(self):
+        segments = assemble_xl_file.parse_meta_file(generators.make_meta_file_contents(3, 100).split(u"\n"))
+        self.assertEqual([(s.segment_number, s.segment_size, s.segment_offset) for s in segments],
+                         [(0, 100, 0), (1, 100, 100), (2, 100, 200)])
+
+    def test_windows_line_endings(self):
+        lines = generators.make_meta_file_contents(2, 100).replace(u"\n", u"\r\n").split(u"\n")
+        segments = assemble_xl_file.parse_meta_file(lines)
+        self.assertEqual([(s.segment_size, s.segment_offset) for s in segments], [(100, 0), (100, 100)])
+        self.assertFalse([s for s in segments if s.segment_hash.endswith(u"\r")])
+
+    def test_invalid(self):
+        lines = generators.make_meta_file_contents(3, 100).split(u"\n")
+        for invalid in ([], lines[:-3], [line for line in lines if not line.startswith(assemble_xl_file.XL_SIZE_KEY)],
+                        [line.replace(u"SIZE:100", u"SIZE:x") for line in lines]):
+            self.assertIsNone(assemble_xl_file.parse_meta_file(invalid))
+
+    def test_key_without_value(self):
+        lines = generators.make_meta_file_contents(1, 100).split(u"\n")
+        for key in (assemble_xl_file.CLOUD_FORMAT_VERSION_KEY, assemble_xl_file.XL_SEGMENTS_KEY):
+            stderr, sys.stderr = sys.stderr, Output()
+            try:
+                self.assertIsNone(assemble_xl_file.parse_meta_file(
+                    [key.rstrip(u":") if line.startswith(key) else line for line in lines]))
+                self.assertIn(u"{} has no value".format(key), sys.stderr.getvalue())
+            finally:
+                sys.stderr = stderr
+
+
+if __name__ == "__main__":
+    unittest.main()
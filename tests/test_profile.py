@@ -0,0 +1,65 @@
+import json
+import os
+import unittest
+
+import odrivecli
+from tests.support import FakeAgentTestCase
+
+
+class ProfileTest(FakeAgentTestCase):
+    def setUp(self):
+        super(ProfileTest, self).setUp()
+        # Timings are collected for the whole process, so each test gets its own
+        self._profile = odrivecli.PROFILE
+        odrivecli.PROFILE = odrivecli.CommandProfile()
+
+    def tearDown(self):
+        odrivecli.PROFILE = self._profile
+        super(ProfileTest, self).tearDown()
+
+    def get_agent_arguments(self):
+        return {'latency': 50}
+
+    def test_disabled(self):
+        self.assertEqual(self.run_main("syncstate", self.mount), 0)
+        self.assertEqual(odrivecli.PROFILE.timings, {})
+
+    def test_print(self):
+        self.assertEqual(self.run_main("--profile", "syncstate", self.mount), 0)
+        summary = odrivecli.PROFILE.get_summary()
+        self.assertEqual(sorted(summary), [u"syncstate"])
+        self.assertEqual(sorted(summary[u"syncstate"]), [u"connect", u"first response", u"output", u"response",
+                                                         u"send", u"total"])
+        # The agent's latency is spent waiting for the first response
+        self.assertGreaterEqual(summary[u"syncstate"][u"first response"][u"p50"], 50)
+        self.assertGreaterEqual(summary[u"syncstate"][u"total"][u"max"], 50)
+        lines = self.get_stderr().splitlines()
+        self.assertTrue(lines[0].startswith(u"command "))
+        self.assertEqual(len(lines), 7)
+
+    def test_recursive(self):
+        profilePath = os.path.join(self.folder, u"profile.json")
+        self.assertEqual(self.run_main("--profile-json", profilePath, "sync", self.mount, "--recursive"), 0)
+        with open(profilePath) as f:
+            summary = json.load(f)
+        # A pass for each level of the tree, then one that finds nothing left to sync
+        self.assertEqual(summary[u"sync --recursive"][u"pass"][u"count"], 3)
+        self.assertEqual(summary[u"sync"][u"total"][u"count"], 8)
+        buckets = summary[u"sync"][u"total"][u"buckets"]
+        self.assertEqual(buckets[-1], [None, 8])
+        self.assertEqual([count for bound, count in buckets if bound is not None and bound < 50], [0] * 5)
+        # Only the JSON file was asked for, so nothing is printed
+        self.assertNotIn(u"p50", self.get_stderr())
+
+    def test_percentiles(self):
+        profile = odrivecli.CommandProfile()
+        profile.enabled = True
+        for milliseconds in range(1, 101):
+            profile.record(u"sync", u"total", milliseconds / 1000.0)
+        summary = profile.get_summary()[u"sync"][u"total"]
+        self.assertEqual([round(summary[key]) for key in (u"p50", u"p95", u"p99", u"max")], [50, 95, 99, 100])
+        self.assertEqual(summary[u"count"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import unittest
+
+import odrivecli
+from benchmarks import generators
+from tests.support import FakeAgentTestCase
+
+
+class RecursiveRefreshTest(FakeAgentTestCase):
+    DEPTH = 2
+
+    def setUp(self):
+        super(RecursiveRefreshTest, self).setUp()
+        # Every folder is expanded, files stay placeholders
+        for folder in (u"folder0", u"folder1", u"folder0/folder0", u"folder0/folder1", u"folder1/folder0",
+                       u"folder1/folder1"):
+            placeholderPath = os.path.join(self.mount, *folder.split(u"/")) + u".cloudf"
+            self.assertTrue(odrivecli.Sync(agentPort=self.port, desktopPort=None, placeholderPath=placeholderPath).execute())
+        del self.agent.received[:]
+
+    def refresh(self, prune=False):
+        command = odrivecli.RecursiveRefresh(agentPort=self.port, desktopPort=None, folderPath=self.mount, workers=2,
+                                             prune=prune)
+        self.assertTrue(command.execute())
+        return sorted(self.agent.get_paths(u"refresh", odrivecli.Refresh.FOLDER_PATH_ARGUMENT_NAME, self.mount))
+
+    def add_remote_file(self, path):
+        generators.write_data_file(os.path.join(self.remote, path), 0, 0)
+
+    def test_refresh(self):
+        self.assertEqual(self.refresh(), [u".", u"folder0", u"folder0/folder0", u"folder0/folder1", u"folder1",
+                                          u"folder1/folder0", u"folder1/folder1"])
+        self.assertIn(u"Refreshed 7 folders under", self.get_stdout())
+        self.assertIn(u"NotSynced: 14\n", self.get_stdout())
+        self.assertIn(u"Synced: 6\n", self.get_stdout())
+
+    def test_prune(self):
+        self.refresh()
+        del self.agent.received[:]
+        self.assertEqual(self.refresh(prune=True), [u"."])
+        self.assertIn(u"Refreshed 1 folders under {} in".format(self.mount), self.get_stdout())
+        self.assertIn(u", 1 unchanged and not descended into", self.get_stdout())
+
+    def test_prune_one_level(self):
+        self.refresh()
+        del self.agent.received[:]
+        # A change in the folder's children is seen, its subfolders are refreshed and pruned as they are unchanged
+        self.add_remote_file(u"new.txt")
+        self.assertEqual(self.refresh(prune=True), [u".", u"folder0", u"folder1"])
+        self.assertTrue(os.path.exists(os.path.join(self.mount, u"new.txt.cloud")))
+        del self.agent.received[:]
+        # A change further down is not, the children of the folder above it look the same
+        self.add_remote_file(u"folder1/new.txt")
+        self.assertEqual(self.refresh(prune=True), [u"."])
+        self.assertFalse(os.path.exists(os.path.join(self.mount, u"folder1", u"new.txt.cloud")))
+        self.refresh()
+        self.assertTrue(os.path.exists(os.path.join(self.mount, u"folder1", u"new.txt.cloud")))
+
+    def test_failures(self):
+        # A folder that fails is reported and not descended into, the rest carries on
+        self.agent.fail_pattern = u"folder1"
+        command = odrivecli.RecursiveRefresh(agentPort=self.port, desktopPort=None, folderPath=self.mount, workers=2)
+        self.assertRaises(SystemExit, command.execute)
+        failed = [line.split(u":")[0] for line in self.get_stderr().splitlines()]
+        self.assertEqual(sorted(failed), [u"Unable to refresh " + os.path.join(self.mount, u"folder0", u"folder1"),
+                                          u"Unable to refresh " + os.path.join(self.mount, u"folder1")])
+        self.assertIn(u"Refreshed 3 folders under {} in".format(self.mount), self.get_stdout())
+        self.assertIn(u", 2 failed", self.get_stdout())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+import os
+import threading
+
+import odrivecli
+from tests.support import FakeAgentTestCase
+
+
+class RecursiveSyncTestCase(FakeAgentTestCase):
+    def sync(self, **arguments):
+        arguments.setdefault('noDownload', False)
+        command = odrivecli.RecursiveSync(agentPort=self.port, desktopPort=None, folderPath=self.mount, **arguments)
+        self.assertTrue(command.execute())
+        return command
+
+    def get_placeholders(self):
+        return [os.path.join(root, name) for root, dirs, files in os.walk(self.mount) for name in files
+                if name.endswith((u".cloud", u".cloudf"))]
+
+
+class OrderTest(RecursiveSyncTestCase):
+    def test_name(self):
+        self.sync()
+        synced = self.get_synced_paths()
+        # Files are sorted within a folder, subfolders are walked in the order the filesystem lists them
+        self.assertEqual(synced[:4], [u"file0.txt", u"file1.txt", u"folder0", u"folder1"])
+        self.assertEqual(sorted(synced[4:]), [
+            u"folder0/file0.txt", u"folder0/file1.txt", u"folder1/file0.txt", u"folder1/file1.txt"])
+        for folder in (u"folder0", u"folder1"):
+            self.assertLess(synced.index(folder + u"/file0.txt"), synced.index(folder + u"/file1.txt"))
+        self.assertEqual(self.get_placeholders(), [])
+
+    def test_folders(self):
+        self.sync(order=u"folders")
+        synced = self.get_synced_paths()
+        self.assertEqual(synced[:2], [u"folder0", u"folder1"])
+        self.assertEqual(sorted(synced[2:]), [
+            u"file0.txt", u"file1.txt",
+            u"folder0/file0.txt", u"folder0/file1.txt", u"folder1/file0.txt", u"folder1/file1.txt"])
+        self.assertEqual(self.get_placeholders(), [])
+
+    def test_folders_failing(self):
+        # A folder that never expands does not hold the files back until the sync gives up
+        self.agent.fail_pattern = u"folder1"
+        command = odrivecli.RecursiveSync(agentPort=self.port, desktopPort=None, folderPath=self.mount,
+                                          noDownload=False, order=u"folders")
+        self.assertRaises(SystemExit, command.execute)
+        self.assertEqual(self.get_placeholders(), [os.path.join(self.mount, u"folder1.cloudf")])
+        self.assertEqual(sorted(set(self.get_synced_paths()) - set([u"folder1"])), [
+            u"file0.txt", u"file1.txt", u"folder0", u"folder0/file0.txt", u"folder0/file1.txt"])
+        self.assertIn(u"Unable to sync 1 items", self.get_stdout())
+
+    def test_newest(self):
+        # The fake agent puts the remote modification time on the placeholders, as the agent does
+        for number, name in enumerate([u"file1.txt.cloud", u"folder0.cloudf", u"file0.txt.cloud", u"folder1.cloudf"]):
+            os.utime(os.path.join(self.mount, name), (1000000000 - number, 1000000000 - number))
+        self.sync(order=u"newest")
+        self.assertEqual(self.get_synced_paths()[:4], [u"file1.txt", u"folder0", u"file0.txt", u"folder1"])
+
+    def test_priority(self):
+        self.sync(priority=[u"*1.txt", u"folder1"])
+        synced = self.get_synced_paths()
+        self.assertEqual(synced[:4], [u"file1.txt", u"folder1", u"file0.txt", u"folder0"])
+        # Patterns match names at any depth, so the next pass starts with both file1.txt
+        self.assertEqual(sorted(synced[4:6]), [u"folder0/file1.txt", u"folder1/file1.txt"])
+
+    def test_priority_path(self):
+        self.sync(priority=[u"folder1/*"])
+        synced = self.get_synced_paths()
+        self.assertEqual(synced[4:], [u"folder1/file0.txt", u"folder1/file1.txt", u"folder0/file0.txt", u"folder0/file1.txt"])
+
+
+class BudgetTest(RecursiveSyncTestCase):
+    FILE_SIZE = 1000
+
+    def get_file_placeholders(self):
+        return [path for path in self.get_placeholders() if path.endswith(u".cloud")]
+
+    def test_max_files(self):
+        self.sync(maxFiles=3)
+        self.assertEqual(len([path for path in self.get_synced_paths() if path.endswith(u".txt")]), 3)
+        # Downloads stop for the rest of the run, but every folder is still expanded
+        self.assertEqual(len(self.get_file_placeholders()), 3)
+        self.assertEqual(len(self.get_placeholders()), 3)
+        self.assertIn(u"Download budget reached after 3 files", self.get_stdout())
+
+    def test_max_bytes(self):
+        # Syncs are synchronous, so each file has downloaded before the next is considered
+        self.sync(maxBytes=2500)
+        self.assertEqual(len(self.get_file_placeholders()), 3)
+        self.assertEqual(len(self.get_placeholders()), 3)
+        self.assertIn(u"after 3 files (3.0 KB downloaded)", self.get_stdout())
+
+    def test_max_inflight(self):
+        # A download the agent is busy with holds up the sync until it is done, then everything is downloaded
+        self.agent._downloads[u"other"] = {'name': u"other", 'path': u"other", 'percentComplete': 0}
+        pollInterval = odrivecli.RecursiveSync._BUDGET_POLL_INTERVAL
+        odrivecli.RecursiveSync._BUDGET_POLL_INTERVAL = 0.05
+        timer = threading.Timer(0.3, self.agent._downloads.pop, [u"other"])
+        timer.start()
+        try:
+            self.sync(maxInflight=1)
+        finally:
+            odrivecli.RecursiveSync._BUDGET_POLL_INTERVAL = pollInterval
+            timer.join()
+        self.assertIn(u"Pausing, 1 downloads in progress", self.get_stdout())
+        self.assertEqual(self.get_placeholders(), [])
+        self.assertNotIn(u"Download budget reached", self.get_stdout())
+
+    def test_arguments(self):
+        args = self.parse_args("sync", "folder", "--recursive", "--max-bytes", "100", "--max-inflight", "2",
+                               "--max-files", "3")
+        self.assertEqual(getattr(args, odrivecli.RecursiveSync.MAX_BYTES_ARGUMENT_NAME), 100)
+        self.assertEqual(getattr(args, odrivecli.RecursiveSync.MAX_INFLIGHT_ARGUMENT_NAME), 2)
+        self.assertEqual(getattr(args, odrivecli.RecursiveSync.MAX_FILES_ARGUMENT_NAME), 3)
+
+
+class PlanTest(RecursiveSyncTestCase):
+    def test_plan(self):
+        self.sync(plan=True)
+        output = self.get_stdout()
+        self.assertIn(u"Folders to expand: 2\n", output)
+        self.assertIn(u"Files to download: 2\n", output)
+        self.assertIn(u"  .txt ", output)
+        self.assertIn(u"Estimated time: unknown", output)
+        # Nothing is synced, so nothing is sent to the agent
+        self.assertEqual(self.agent.received, [])
+        self.assertEqual(len(self.get_placeholders()), 4)
+
+    def test_estimate(self):
+        journalPath = os.path.join(self.folder, u"journal")
+        self.sync(maxFiles=2, journalPath=journalPath)
+        self.sync(plan=True, journalPath=journalPath)
+        output = self.get_stdout()
+        self.assertIn(u"Files to download: 4\n", output)
+        self.assertIn(u"(2 downloads at ", output)
+
+    def test_needs_recursive(self):
+        self.assertTrue(getattr(self.parse_args("sync", "folder", "--recursive", "--plan"),
+                                odrivecli.RecursiveSync.PLAN_ARGUMENT_NAME))
+        self.assertRaises(SystemExit, self.parse_args, "sync", "folder", "--plan")
+        self.assertIn(u"--plan is only used with --recursive", self.get_stderr())
+
+
+class JournalTest(RecursiveSyncTestCase):
+    def setUp(self):
+        super(JournalTest, self).setUp()
+        self.journalPath = os.path.join(self.folder, u"journal")
+
+    def make_interrupted_sync(self, syncs):
+        # A sync with the journal that is interrupted once it has synced this many placeholders
+        command = odrivecli.RecursiveSync(agentPort=self.port, desktopPort=None, folderPath=self.mount,
+                                          noDownload=False, journalPath=self.journalPath)
+        sync_placeholder = command._sync_placeholder
+        synced = []
+
+        def interrupt(placeholderPath):
+            if len(synced) == syncs:
+                raise KeyboardInterrupt()
+            sync_placeholder(placeholderPath)
+            synced.append(placeholderPath)
+
+        command._sync_placeholder = interrupt
+        return command
+
+    def unsync(self, path):
+        self.assertTrue(odrivecli.Unsync(agentPort=self.port, desktopPort=None,
+                                         path=os.path.join(self.mount, path)).execute())
+
+    def test_resume(self):
+        self.assertRaises(KeyboardInterrupt, self.make_interrupted_sync(3).execute)
+        self.sync(journalPath=self.journalPath)
+        synced = self.get_synced_paths()
+        # Nothing synced before the interruption is synced again
+        self.assertEqual(len(synced), 8)
+        self.assertEqual(len(set(synced)), 8)
+        self.assertEqual(self.get_placeholders(), [])
+
+    def test_restart(self):
+        self.sync(journalPath=self.journalPath)
+        self.unsync(u"folder0/file0.txt")
+        self.unsync(u"folder0/file1.txt")
+        # The journal records the whole sync as complete, so this run starts over, and is interrupted
+        self.assertRaises(KeyboardInterrupt, self.make_interrupted_sync(1).execute)
+        self.assertEqual(self.get_stdout().count(u"starting over"), 1)
+        self.assertEqual(len(self.get_placeholders()), 1)
+        # Resuming carries on with the restarted sync rather than the one that finished
+        self.sync(journalPath=self.journalPath)
+        self.assertEqual(self.get_stdout().count(u"starting over"), 1)
+        self.assertEqual(self.get_placeholders(), [])
+        self.assertEqual(self.get_synced_paths()[8:], [u"folder0/file0.txt", u"folder0/file1.txt"])
+
+    def test_plan(self):
+        # A plan only reads the journal, it is not created nor restarted
+        self.sync(plan=True, journalPath=self.journalPath)
+        self.assertFalse(os.path.exists(self.journalPath))
+        self.sync(journalPath=self.journalPath)
+        self.unsync(u"folder0/file0.txt")
+        with open(self.journalPath, 'rb') as f:
+            journal = f.read()
+        self.sync(plan=True, journalPath=self.journalPath)
+        self.assertIn(u"a sync would start over", self.get_stdout())
+        self.assertIn(u"Files to download: 1\n", self.get_stdout())
+        with open(self.journalPath, 'rb') as f:
+            self.assertEqual(f.read(), journal)
+
+    def test_failures(self):
+        # Placeholders that keep failing are given up on, in this run and the next
+        self.agent.fail_pattern = u"file1.txt"
+        self.sync(journalPath=self.journalPath)
+        self.assertEqual(len(self.get_placeholders()), 3)
+        synced = self.get_synced_paths()
+        self.sync(journalPath=self.journalPath)
+        self.assertEqual(self.get_synced_paths(), synced)
+        self.assertEqual(self.get_stdout().count(u"Skipped 3 placeholders that failed 5 times"), 2)
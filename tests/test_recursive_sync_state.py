@@ -0,0 +1,82 @@
+import os
+import time
+import unittest
+
+import odrivecli
+from tests.support import FakeAgentTestCase
+
+
+class RecursiveSyncStateTest(FakeAgentTestCase):
+    FILE_SIZE = 1000
+
+    def setUp(self):
+        super(RecursiveSyncStateTest, self).setUp()
+        for path in (u"folder0.cloudf", u"folder1.cloudf", u"file0.txt.cloud"):
+            self.sync(path)
+        del self.agent.received[:]
+
+    def sync(self, path):
+        self.assertTrue(odrivecli.Sync(agentPort=self.port, desktopPort=None,
+                                       placeholderPath=os.path.join(self.mount, *path.split(u"/"))).execute())
+
+    def sync_state(self, **arguments):
+        printed = len(self.get_stdout())
+        command = odrivecli.RecursiveSyncState(agentPort=self.port, desktopPort=None, folderPath=self.mount, workers=2,
+                                               **arguments)
+        self.assertTrue(command.execute())
+        paths = sorted(self.agent.get_paths(u"syncstate", odrivecli.SyncState.PATH_ARGUMENT_NAME, self.mount))
+        del self.agent.received[:]
+        return paths, self.get_stdout()[printed:].splitlines()
+
+    def test_list(self):
+        paths, lines = self.sync_state()
+        self.assertEqual(paths, [u".", u"folder0", u"folder1"])
+        # Files only, expanded folders are listed through their contents
+        self.assertEqual(lines, [
+            u"Synced: file0.txt", u"NotSynced: file1.txt",
+            u"NotSynced: " + os.path.join(u"folder0", u"file0.txt"), u"NotSynced: " + os.path.join(u"folder0", u"file1.txt"),
+            u"NotSynced: " + os.path.join(u"folder1", u"file0.txt"), u"NotSynced: " + os.path.join(u"folder1", u"file1.txt")])
+
+    def test_summary(self):
+        self.sync(u"folder1/file0.txt.cloud")
+        paths, lines = self.sync_state(summary=True)
+        self.assertEqual(lines[0].split(), [u"Synced", u"Active", u"Locked", u"Other", u"Local", u"Folder"])
+        # Largest first
+        self.assertEqual(lines[1].split(), [u"2", u"0", u"0", u"4", u"2.0", u"KB", self.mount])
+        self.assertEqual(lines[2].split(), [u"1", u"0", u"0", u"1", u"1.0", u"KB", u"folder1"])
+        self.assertEqual(lines[3].split(), [u"0", u"0", u"0", u"2", u"0", u"B", u"folder0"])
+        self.assertTrue(lines[4].startswith(u"3 folders in "))
+
+    def test_no_cache(self):
+        self.sync_state()
+        paths, lines = self.sync_state()
+        self.assertEqual(paths, [u".", u"folder0", u"folder1"])
+        self.assertFalse([line for line in lines if line.endswith(u"(cached)")])
+        self.assertFalse(os.path.exists(os.path.join(self.home, odrivecli.UTILITIES_DATA_FOLDER_NAME,
+                                                     odrivecli.RecursiveSyncState._CACHE_FILE_NAME)))
+
+    def test_cache(self):
+        self.sync_state(maxAge=60)
+        paths, lines = self.sync_state(maxAge=60)
+        self.assertEqual(paths, [])
+        self.assertEqual(len(lines), 6)
+        self.assertEqual([line for line in lines if not line.endswith(u" (cached)")], [])
+        # A folder that changed on disk is asked for again, the rest comes from the cache
+        self.sync(u"folder0/file1.txt.cloud")
+        paths, lines = self.sync_state(maxAge=60)
+        self.assertEqual(paths, [u"folder0"])
+        self.assertIn(u"Synced: " + os.path.join(u"folder0", u"file1.txt"), lines)
+        self.assertIn(u"NotSynced: " + os.path.join(u"folder1", u"file1.txt") + u" (cached)", lines)
+        paths, lines = self.sync_state(maxAge=60, summary=True)
+        self.assertTrue(lines[-1].endswith(u", 3 from cache"))
+
+    def test_cache_expires(self):
+        self.sync_state(maxAge=0.05)
+        time.sleep(0.1)
+        paths, lines = self.sync_state(maxAge=0.05)
+        self.assertEqual(paths, [u".", u"folder0", u"folder1"])
+        self.assertFalse([line for line in lines if line.endswith(u"(cached)")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+import assemble_xl_file
+from tests.support import SEGMENT_SIZE, XLFolderTestCase, write_partial
+
+
+class ResumeTest(XLFolderTestCase):
+    def resume(self, xl_folder, segments_done, meta_hash=None):
+        partial_file_name = assemble_xl_file.get_out_file_name(xl_folder) + assemble_xl_file.PARTIAL_SUFFIX
+        progress_file_name = partial_file_name + assemble_xl_file.PROGRESS_SUFFIX
+        assemble_xl_file.save_segments_done(progress_file_name, meta_hash or assemble_xl_file.get_meta_hash(xl_folder),
+                                            segments_done)
+        segments = assemble_xl_file.read_xl_segments(xl_folder)
+        return assemble_xl_file.get_segments_done(xl_folder, segments, partial_file_name, progress_file_name,
+                                                  assemble_xl_file.get_meta_hash(xl_folder))
+
+    def test_resumes_after_last_good_segment(self):
+        xl_folder, data = self.make_xl_folder(5 * SEGMENT_SIZE)
+        write_partial(xl_folder, data, 3)
+        self.assertEqual(self.resume(xl_folder, 3), 3)
+        assemble_xl_file.assemble_one_xl_file(xl_folder)
+        self.assertEqual(self.read_file(assemble_xl_file.get_out_file_name(xl_folder)), data)
+
+    def test_progress_is_removed_when_complete(self):
+        xl_folder, data = self.make_xl_folder(5 * SEGMENT_SIZE)
+        partial_file_name = write_partial(xl_folder, data, 2)
+        self.resume(xl_folder, 2)
+        self.assertEqual(assemble_xl_file.assemble_one_xl_file(xl_folder), len(data))
+        self.assertFalse(os.path.exists(partial_file_name))
+        self.assertFalse(os.path.exists(partial_file_name + assemble_xl_file.PROGRESS_SUFFIX))
+
+    def test_damaged_last_segment_is_written_again(self):
+        xl_folder, data = self.make_xl_folder(5 * SEGMENT_SIZE)
+        write_partial(xl_folder, data, 3, damaged=True)
+        self.assertEqual(self.resume(xl_folder, 3), 2)
+        assemble_xl_file.assemble_one_xl_file(xl_folder)
+        self.assertEqual(self.read_file(assemble_xl_file.get_out_file_name(xl_folder)), data)
+
+    def test_progress_for_another_version_starts_over(self):
+        xl_folder, data = self.make_xl_folder(5 * SEGMENT_SIZE)
+        write_partial(xl_folder, data, 3)
+        self.assertEqual(self.resume(xl_folder, 3, meta_hash=u"0" * 40), 0)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+import assemble_xl_file
+from tests.support import SEGMENT_SIZE, Output, XLFolderTestCase
+
+
+class SegmentStoreTest(XLFolderTestCase):
+    def get_folder_state(self, xl_folder):
+        return sorted((name, os.stat(os.path.join(xl_folder, name)).st_ino, self.read_file(os.path.join(xl_folder, name)))
+                      for name in os.listdir(xl_folder))
+
+    def test_xl_folders_are_not_changed(self):
+        xl_folder, data = self.make_xl_folder(3 * SEGMENT_SIZE)
+        other_xl_folder, other_data = self.make_xl_folder(3 * SEGMENT_SIZE, seed=1)
+        states = [self.get_folder_state(folder) for folder in (xl_folder, other_xl_folder)]
+        store = assemble_xl_file.SegmentStore(os.path.join(self.folder, u"store"))
+        for folder, expected in ((xl_folder, data), (other_xl_folder, other_data)):
+            assemble_xl_file.assemble_one_xl_file(folder, store)
+            self.assertEqual(self.read_file(assemble_xl_file.get_out_file_name(folder)), expected)
+        self.assertEqual([self.get_folder_state(folder) for folder in (xl_folder, other_xl_folder)], states)
+
+    def test_reuses_stored_segments(self):
+        xl_folder, data = self.make_xl_folder(3 * SEGMENT_SIZE)
+        store = assemble_xl_file.SegmentStore(os.path.join(self.folder, u"store"))
+        assemble_xl_file.assemble_one_xl_file(xl_folder, store)
+        os.remove(assemble_xl_file.get_out_file_name(xl_folder))
+        store = assemble_xl_file.SegmentStore(store.store_folder)
+        assemble_xl_file.assemble_one_xl_file(xl_folder, store)
+        self.assertEqual((store.added_segments, store.reused_segments), (0, 3))
+        self.assertEqual(self.read_file(assemble_xl_file.get_out_file_name(xl_folder)), data)
+
+    def test_damaged_stored_segment_is_not_used(self):
+        xl_folder, data = self.make_xl_folder(3 * SEGMENT_SIZE)
+        store = assemble_xl_file.SegmentStore(os.path.join(self.folder, u"store"))
+        segment = assemble_xl_file.read_xl_segments(xl_folder)[1]
+        stored_file_name = os.path.join(store.store_folder, segment.segment_hash[:2], segment.segment_hash)
+        os.makedirs(os.path.dirname(stored_file_name))
+        with open(stored_file_name, 'wb') as stored_file:
+            stored_file.write(b"\0" * segment.segment_size)
+        assemble_xl_file.assemble_one_xl_file(xl_folder, store)
+        self.assertEqual(self.read_file(assemble_xl_file.get_out_file_name(xl_folder)), data)
+        self.assertEqual(self.read_file(stored_file_name), self.read_file(os.path.join(xl_folder, segment.segment_hash)))
+
+    def test_unknown_hash_length(self):
+        xl_folder, data = self.make_xl_folder(SEGMENT_SIZE)
+        store = assemble_xl_file.SegmentStore(os.path.join(self.folder, u"store"))
+        segment = assemble_xl_file.Segment(0, SEGMENT_SIZE, u"0" * 20)
+        self.assertRaises(ValueError, store.get_segment_file_name, xl_folder, segment)
+        self.assertFalse(os.path.exists(store.store_folder))
+
+    def test_report(self):
+        xl_folder, data = self.make_xl_folder(3 * SEGMENT_SIZE)
+        store = assemble_xl_file.SegmentStore(os.path.join(self.folder, u"store"))
+        assemble_xl_file.assemble_one_xl_file(xl_folder, store)
+        os.remove(assemble_xl_file.get_out_file_name(xl_folder))
+        assemble_xl_file.assemble_one_xl_file(xl_folder, store)
+        stdout, sys.stdout = sys.stdout, Output()
+        try:
+            store.print_report()
+            report = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn(u"3 segments added, 3 reused, saved {} by cloning".format(
+            assemble_xl_file.format_size(store.cloned_bytes)), report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import argparse
+import hashlib
+import os
+import unittest
+
+import assemble_xl_file
+import split_xl_file
+from tests.support import SEGMENT_SIZE, XLFolderTestCase
+
+
+class SplitTest(XLFolderTestCase):
+    def test_segments_are_named_by_hash(self):
+        for hash_name in ('md5', 'sha1', 'sha256'):
+            xl_folder, data = self.make_xl_folder(2 * SEGMENT_SIZE + 1, seed=len(hash_name), workers=2,
+                                                  hash_name=hash_name)
+            segments = assemble_xl_file.read_xl_segments(xl_folder)
+            self.assertEqual([s.segment_size for s in segments], [SEGMENT_SIZE, SEGMENT_SIZE, 1])
+            for segment in segments:
+                contents = data[segment.segment_offset:segment.segment_offset + segment.segment_size]
+                self.assertEqual(segment.segment_hash, hashlib.new(hash_name, contents).hexdigest())
+                self.assertEqual(self.read_file(os.path.join(xl_folder, segment.segment_hash)), contents)
+
+    def test_name_is_kept(self):
+        xl_folder, data = self.make_xl_folder(SEGMENT_SIZE, name=u"name.with.dots")
+        self.assertEqual(os.path.basename(assemble_xl_file.get_out_file_name(xl_folder)), u"name.with.dots")
+
+    def test_identical_segments_share_a_file(self):
+        file_path = os.path.join(self.folder, u"zeros")
+        with open(file_path, 'wb') as f:
+            f.write(b"\0" * (3 * SEGMENT_SIZE))
+        xl_folder = split_xl_file.split_xl_file(file_path, SEGMENT_SIZE)
+        self.assertEqual(len(set(s.segment_hash for s in assemble_xl_file.read_xl_segments(xl_folder))), 1)
+        self.assertEqual(sorted(os.listdir(xl_folder)), sorted([u".meta", hashlib.sha1(b"\0" * SEGMENT_SIZE).hexdigest()]))
+        os.remove(file_path)
+        assemble_xl_file.assemble_one_xl_file(xl_folder)
+        self.assertEqual(self.read_file(file_path), b"\0" * (3 * SEGMENT_SIZE))
+
+    def test_empty_file(self):
+        file_path = os.path.join(self.folder, u"empty")
+        open(file_path, 'wb').close()
+        self.assertIsNone(split_xl_file.split_xl_file(file_path, SEGMENT_SIZE))
+        self.assertEqual(os.listdir(self.folder), [u"empty"])
+
+    def test_threshold(self):
+        self.assertEqual(split_xl_file.get_threshold('large'), 1000 * 1000 * 1000)
+        self.assertEqual(split_xl_file.get_threshold('12345'), 12345)
+        for value in ('0', '-1', 'huge'):
+            self.assertRaises(argparse.ArgumentTypeError, split_xl_file.get_threshold, value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import decrypt_odrive_file
+from tests.crypto_support import BUFFER_SIZE, PASSWORD, encrypt
+from tests.support import Output
+
+
+class StreamFileTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix=u"odrive-test-")
+        self.args = argparse.Namespace(password=PASSWORD, buffersize=1)
+        self.out_path = os.path.join(self.folder, u"out")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_file(self, encrypted):
+        path = os.path.join(self.folder, u"encrypted")
+        with open(path, 'wb') as f:
+            f.write(encrypted)
+        return path
+
+    def stream(self, path, password=PASSWORD):
+        # stream_file writes to the stdout descriptor, so stdout has to be a real file
+        self.args.password = password
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = open(self.out_path, 'wb'), Output()
+        try:
+            streamed = decrypt_odrive_file.stream_file(self.args, path)
+            errors = sys.stderr.getvalue()
+        finally:
+            sys.stdout.close()
+            sys.stdout, sys.stderr = stdout, stderr
+        with open(self.out_path, 'rb') as f:
+            return streamed, f.read(), errors
+
+    def test_stream(self):
+        data = os.urandom(3 * BUFFER_SIZE + 1)
+        self.assertEqual(self.stream(self.write_file(encrypt(data))), (True, data, u""))
+
+    def test_hash_mismatch(self):
+        encrypted = bytearray(encrypt(os.urandom(3 * BUFFER_SIZE)))
+        encrypted[-3 * decrypt_odrive_file.AES_BLOCK_SIZE] ^= 1
+        streamed, data, errors = self.stream(self.write_file(bytes(encrypted)))
+        self.assertFalse(streamed)
+        self.assertIn(u"Hash mismatch", errors)
+
+    def test_wrong_password(self):
+        path = self.write_file(encrypt(os.urandom(BUFFER_SIZE)))
+        for password in (u"wrong", u"another", u"third"):
+            streamed, data, errors = self.stream(path, password)
+            self.assertFalse(streamed)
+            self.assertTrue(errors.startswith(u"Error: "), errors)
+
+    def test_truncated_file(self):
+        # Nothing after the header, so there is no padding to remove
+        header_size = decrypt_odrive_file.VERSION_LENGTH + decrypt_odrive_file.SALT_LENGTH + decrypt_odrive_file.AES_BLOCK_SIZE
+        streamed, data, errors = self.stream(self.write_file(encrypt(os.urandom(BUFFER_SIZE))[:header_size]))
+        self.assertFalse(streamed)
+        self.assertIn(u"Unable to decrypt", errors)
+
+    def test_missing_file(self):
+        streamed, data, errors = self.stream(os.path.join(self.folder, u"missing"))
+        self.assertFalse(streamed)
+        self.assertIn(u"not found", errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import odrivecli
+from tests.support import FakeAgentTestCase
+
+
+class SamplingTransfersStatus(odrivecli.TransfersStatus):
+    # Calls on_sample with the number of samples taken so far, after every sample
+    def __init__(self, on_sample, **kwargs):
+        super(SamplingTransfersStatus, self).__init__(**kwargs)
+        self.on_sample = on_sample
+        self.samples = 0
+
+    def _print_response(self, messageType, message):
+        super(SamplingTransfersStatus, self)._print_response(messageType, message)
+        if messageType == odrivecli.OdriveSynchronousCommand._STATUS_MESSAGE:
+            self.samples += 1
+            self.on_sample(self.samples)
+
+
+class TransfersStatusTest(FakeAgentTestCase):
+    def set_download(self, percentComplete):
+        self.agent._downloads[u"big"] = {'name': u"big.bin", 'path': u"/mount/big.bin", 'percentComplete': percentComplete}
+
+    def sample(self, on_sample):
+        command = SamplingTransfersStatus(on_sample, agentPort=self.port, desktopPort=None, interval=0.05)
+        self.assertRaises(KeyboardInterrupt, command.execute)
+        return command
+
+    def test_rates(self):
+        def on_sample(samples):
+            if samples == 3:
+                raise KeyboardInterrupt()
+            self.set_download(10 * (samples + 1))
+
+        self.set_download(10)
+        self.sample(on_sample)
+        output = self.get_stdout()
+        # The first sample has no rate yet, the next ones do
+        self.assertIn(u"Downloads: 1\n", output)
+        self.assertIn(u"Downloads: 1, all done in ", output)
+        self.assertIn(u"%/s", output.split(u"Slowest transfers:")[-1])
+        self.assertIn(u" 30.0% ", output)
+        self.assertIn(u"/mount/big.bin", output)
+        self.assertEqual(self.get_stderr(), u"")
+
+    def test_bad_sample(self):
+        def on_sample(samples):
+            if samples == 1:
+                self.set_download(u"unknown")
+            elif samples == 2:
+                self.set_download(20)
+            else:
+                raise KeyboardInterrupt()
+
+        self.set_download(10)
+        command = self.sample(on_sample)
+        self.assertEqual(command.samples, 3)
+        self.assertEqual(self.get_stderr().count(u"Unable to sample transfers: "), 1)
+        self.assertIn(u" 20.0% ", self.get_stdout())
+
+    def test_agent_down(self):
+        def on_sample(samples):
+            self.agent.stop()
+
+        self.set_download(10)
+        command = SamplingTransfersStatus(on_sample, agentPort=self.port, desktopPort=None, interval=0.05)
+        output_message = command._output_message
+        failures = []
+
+        def interrupt_after_two_failures(message, **kwargs):
+            output_message(message, **kwargs)
+            if message.startswith(u"Unable to get the status"):
+                failures.append(message)
+                if len(failures) == 2:
+                    raise KeyboardInterrupt()
+
+        command._output_message = interrupt_after_two_failures
+        self.assertRaises(KeyboardInterrupt, command.execute)
+        self.assertEqual(command.samples, 1)
+        self.assertEqual(self.get_stderr().count(u"Unable to get the status, trying again"), 2)
+
+if __name__ == "__main__":
+    unittest.main()
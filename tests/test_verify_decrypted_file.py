@@ -0,0 +1,87 @@
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import decrypt_odrive_file
+import encrypt_odrive_file
+from tests.crypto_support import BUFFER_SIZE, PASSWORD, BackendTestCase, decrypt, encrypt
+from tests.support import Output
+
+
+class CorruptedFileTest(BackendTestCase):
+    def test_hash_mismatch(self):
+        def test(backend):
+            data = os.urandom(3 * BUFFER_SIZE)
+            encrypted = bytearray(encrypt(data))
+            # Past the header, so it only changes one block of plaintext
+            encrypted[-3 * decrypt_odrive_file.AES_BLOCK_SIZE] ^= 1
+            self.assertFalse(decrypt(bytes(encrypted))[0])
+            chunks = decrypt_odrive_file.DecryptedChunks(io.BytesIO(bytes(encrypted)), PASSWORD, BUFFER_SIZE)
+            with self.assertRaises(decrypt_odrive_file.HashMismatchError):
+                for chunk in chunks:
+                    pass
+        self.for_each_backend(test)
+
+
+class VerifiedDecryptionTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix=u"odrive-test-")
+        self.root = os.path.join(self.folder, u"root")
+        os.mkdir(self.root)
+        self.args = argparse.Namespace(password=PASSWORD, nameonly=False, renamefolder=False, buffersize=1,
+                                       quarantine=None, filter=None, delimiter=u";", recursive=True, workers=1)
+        self._stdout, sys.stdout = sys.stdout, Output()
+
+    def tearDown(self):
+        sys.stdout = self._stdout
+        shutil.rmtree(self.folder)
+
+    def add_file(self, name, data, corrupted=False):
+        encrypted = bytearray(encrypt(data))
+        if corrupted:
+            encrypted[-3 * decrypt_odrive_file.AES_BLOCK_SIZE] ^= 1
+        path = os.path.join(self.root, encrypt_odrive_file.encrypt_name(name, PASSWORD))
+        with open(path, 'wb') as f:
+            f.write(encrypted)
+        return path
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_corrupted_file_is_removed(self):
+        path = self.add_file(u"bad.bin", os.urandom(3 * BUFFER_SIZE), corrupted=True)
+        self.assertFalse(decrypt_odrive_file.single_file(self.args, path))
+        self.assertEqual(os.listdir(self.root), [os.path.basename(path)])
+        self.assertIn(u"Hash mismatch", sys.stdout.getvalue())
+
+    def test_quarantine(self):
+        self.args.quarantine = os.path.join(self.folder, u"quarantine")
+        path = self.add_file(u"bad.bin", os.urandom(3 * BUFFER_SIZE), corrupted=True)
+        self.assertFalse(decrypt_odrive_file.single_file(self.args, path))
+        self.assertEqual(os.listdir(self.root), [os.path.basename(path)])
+        self.assertEqual(os.listdir(self.args.quarantine), [u"bad.bin"])
+
+    def test_recursive(self):
+        data = os.urandom(BUFFER_SIZE + 1)
+        self.add_file(u"good.bin", data)
+        bad_path = self.add_file(u"bad.bin", os.urandom(BUFFER_SIZE), corrupted=True)
+        # The failed file is reported once, not once per pass over the tree
+        self.assertEqual(decrypt_odrive_file.all_files(self.args, self.root), set([bad_path]))
+        self.assertEqual(sys.stdout.getvalue().count(u"Hash mismatch"), 1)
+        self.assertEqual(self.read_file(os.path.join(self.root, u"good.bin")), data)
+        self.assertFalse(os.path.exists(os.path.join(self.root, u"bad.bin")))
+
+    def test_verify_only(self):
+        self.add_file(u"good.bin", os.urandom(BUFFER_SIZE))
+        bad_path = self.add_file(u"bad.bin", os.urandom(BUFFER_SIZE), corrupted=True)
+        self.assertEqual(decrypt_odrive_file.verify_all_files(self.args, self.root), [bad_path])
+        self.assertEqual(len(os.listdir(self.root)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import io
+import os
+import unittest
+
+import assemble_xl_file
+from tests.support import SEGMENT_SIZE, XLFolderTestCase
+
+
+class XLFileTest(XLFolderTestCase):
+    def test_stream(self):
+        xl_folder, data = self.make_xl_folder(4 * SEGMENT_SIZE + 7)
+        out_file = io.BytesIO()
+        self.assertTrue(assemble_xl_file.stream_xl_file(xl_folder, out_file))
+        self.assertEqual(out_file.getvalue(), data)
+
+    def test_stream_missing_segment(self):
+        xl_folder, data = self.make_xl_folder(2 * SEGMENT_SIZE)
+        os.remove(os.path.join(xl_folder, assemble_xl_file.read_xl_segments(xl_folder)[1].segment_hash))
+        self.assertFalse(assemble_xl_file.stream_xl_file(xl_folder, io.BytesIO()))
+        self.assertFalse(assemble_xl_file.stream_xl_file(os.path.join(self.folder, u"missing.xlarge"), io.BytesIO()))
+
+    def test_seek_and_read_across_segments(self):
+        xl_folder, data = self.make_xl_folder(3 * SEGMENT_SIZE + 5)
+        xl_file = assemble_xl_file.XLFile(xl_folder)
+        try:
+            for offset, size in ((0, 10), (SEGMENT_SIZE - 3, 6), (SEGMENT_SIZE, SEGMENT_SIZE * 2 + 1), (len(data) - 2, 10)):
+                xl_file.seek(offset)
+                self.assertEqual(xl_file.read(size), data[offset:offset + size])
+            xl_file.seek(-4, io.SEEK_END)
+            self.assertEqual(xl_file.read(), data[-4:])
+            self.assertEqual(xl_file.read(1), b"")
+        finally:
+            xl_file.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
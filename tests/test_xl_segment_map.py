@@ -0,0 +1,41 @@
+import unittest
+
+import assemble_xl_file
+from tests.support import SEGMENT_SIZE, XLFolderTestCase, write_partial
+
+
+class XLSegmentMapTest(XLFolderTestCase):
+    def setUp(self):
+        if not assemble_xl_file.MMAP_VIEWS:
+            self.skipTest("memory-mapped segments need Python 3")
+        super(XLSegmentMapTest, self).setUp()
+
+    def test_slices(self):
+        xl_folder, data = self.make_xl_folder(3 * SEGMENT_SIZE + 5)
+        with assemble_xl_file.XLSegmentMap(xl_folder) as segment_map:
+            self.assertEqual(b"".join(bytes(view) for view in segment_map), data)
+            for start, end in ((0, None), (1, 2), (SEGMENT_SIZE - 1, SEGMENT_SIZE + 1), (100, len(data) + 100)):
+                self.assertEqual(b"".join(bytes(view) for view in segment_map.slices(start, end)), data[start:end])
+
+    def test_close_while_a_view_is_held(self):
+        xl_folder, data = self.make_xl_folder(2 * SEGMENT_SIZE)
+        segment_map = assemble_xl_file.XLSegmentMap(xl_folder)
+        for view in segment_map:
+            pass
+        segment_map.close()
+        self.assertEqual(bytes(view), data[SEGMENT_SIZE:])
+
+    def test_segment_view_check_matches_file_check(self):
+        xl_folder, data = self.make_xl_folder(3 * SEGMENT_SIZE + 10)
+        for damaged in (False, True):
+            partial_file_name = write_partial(xl_folder, data, 4, damaged)
+            segments = assemble_xl_file.read_xl_segments(xl_folder)
+            with assemble_xl_file.XLSegmentMap(xl_folder, segments) as segment_map:
+                for segment_index, segment in enumerate(segments):
+                    self.assertEqual(
+                        assemble_xl_file.is_segment_written(xl_folder, segment, partial_file_name, segment_map[segment_index]),
+                        assemble_xl_file.is_segment_written(xl_folder, segment, partial_file_name))
+
+
+if __name__ == "__main__":
+    unittest.main()